@@ -1,9 +1,16 @@
 from flask import Blueprint, request, jsonify, make_response
 from flask_restful import Api, Resource
-from models import db, Transcription, Speaker, CustomVocabulary, NoiseProfile
+from models import db, Transcription, TranscriptionStatus, Speaker, CustomVocabulary, NoiseProfile
 from transcription.deepgram_client import DeepgramTranscriptionClient
+from transcription.segmented import SegmentedTranscriber
+from transcription.result_cache import TranscriptCache
 from audio_processor.processor import AudioProcessor
-from audio_processor.exceptions import AudioProcessingError
+from audio_processor.exceptions import AudioProcessingError, AudioProcessingCancelled
+from audio_processor.cache import EnhancedAudioCache
+from audio_processor.memory import MemoryGovernor
+from audio_processor.profiling import profile_store
+from audio_processor.encoder import EncodedStream
+from monitoring import metrics
 from werkzeug.utils import secure_filename
 import os
 import asyncio
@@ -19,6 +26,58 @@ from flask_swagger_ui import get_swaggerui_blueprint
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Enhanced audio cache shared by all jobs; kept outside the upload folder,
+# which is cleared on startup
+enhanced_audio_cache = EnhancedAudioCache(
+    os.environ.get('ENHANCED_CACHE_DIR', '/tmp/enhanced_cache'),
+    max_bytes=int(os.environ.get('ENHANCED_CACHE_MAX_BYTES', 10 * 1024 * 1024 * 1024))
+)
+metrics.register_cache('enhanced_audio', enhanced_audio_cache)
+
+# Jobs of this process share one memory budget; jobs that would exceed it
+# wait for running ones to finish
+memory_governor = MemoryGovernor(int(os.environ.get('MEMORY_BUDGET_BYTES', 0)) or None)
+metrics.register_memory_governor(memory_governor)
+metrics.register_profiles(profile_store)
+
+# Transcription results by submitted audio and request options, so a
+# repeated request costs no API call
+transcript_cache = TranscriptCache(
+    os.environ.get('TRANSCRIPT_CACHE_DIR', '/tmp/transcript_cache'),
+    max_bytes=int(os.environ.get('TRANSCRIPT_CACHE_MAX_BYTES', 1024 * 1024 * 1024)),
+    ttl_seconds=int(os.environ.get('TRANSCRIPT_CACHE_TTL_SECONDS', 30 * 24 * 3600))
+)
+metrics.register_cache('transcripts', transcript_cache)
+
+# One Deepgram client per worker process: jobs share its pooled keep-alive
+# connections and its scheduler's in-flight and rate limits
+transcription_client = DeepgramTranscriptionClient.shared(cache=transcript_cache)
+metrics.register_transcription_client(transcription_client)
+# Long recordings, and any over the client's MAX_FILE_SIZE, are transcribed
+# in concurrent segments
+segmented_transcriber = SegmentedTranscriber(transcription_client, work_dir='/tmp/uploads')
+
+# Per-chunk checkpoints of running jobs, so a job rerun after a crash
+# resumes where it stopped; also outside the upload folder
+CHECKPOINT_DIR = os.environ.get('CHECKPOINT_DIR', '/tmp/checkpoints')
+
+# Worker processes per job: concurrent jobs each start their own pool, so
+# one job is not given every core
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', max(1, min(4, (os.cpu_count() or 1) // 2))))
+
+# Encoding of the enhanced audio file each job writes, which is what the
+# enhanced audio cache keeps and what long recordings are uploaded from in
+# segments: 'pcm16' (16-bit WAV) or 'flac' (lossless, about half the size).
+# Recordings short enough for one request are streamed to Deepgram as they
+# are enhanced, and a stream is always 16-bit WAV (see encoder), so 'flac'
+# only pays off for segmented uploads and cache space; it also makes those
+# jobs encode their output twice
+ENHANCED_OUTPUT_FORMAT = os.environ.get('ENHANCED_OUTPUT_FORMAT', 'pcm16')
+
+# Processors of jobs running in this process, by transcription id, so a
+# job can be cancelled through its processor's cancel token
+active_jobs = {}
+
 # Create Blueprint
 api_bp = Blueprint('api', __name__)
 api = Api(api_bp)
@@ -81,6 +140,23 @@ class TranscriptionAPI(Resource):
             file_path = os.path.join('/tmp/uploads', filename)
             file.save(file_path)
 
+            # Header-only checks: reject bad uploads before queueing any work
+            try:
+                processor = AudioProcessor(
+                    file_path,
+                    workers=JOB_WORKERS,
+                    cache=enhanced_audio_cache,
+                    vad=True,
+                    compact=True,
+                    tier='auto',
+                    checkpoint_dir=CHECKPOINT_DIR,
+                    memory_governor=memory_governor,
+                    output_format=ENHANCED_OUTPUT_FORMAT
+                )
+            except AudioProcessingError as e:
+                os.remove(file_path)
+                return {'error': str(e)}, 400
+
             transcription = Transcription(
                 filename=filename,
                 status='processing'
@@ -88,8 +164,10 @@ class TranscriptionAPI(Resource):
             db.session.add(transcription)
             db.session.commit()
 
-            # Process in background
-            asyncio.create_task(self._process_transcription(transcription.id, file_path))
+            # Process in background; its stage profile is kept under the transcription id
+            processor.job_id = transcription.id
+            active_jobs[transcription.id] = processor
+            asyncio.create_task(self._process_transcription(transcription.id, file_path, processor))
 
             return {
                 'id': transcription.id,
@@ -101,34 +179,68 @@ class TranscriptionAPI(Resource):
             logger.error(f"Error creating transcription: {str(e)}")
             return {'error': str(e)}, 500
 
-    async def _process_transcription(self, transcription_id, file_path):
+    async def _process_transcription(self, transcription_id, file_path, processor):
+        # Enhanced audio is always written in the output format, whatever the upload format
+        enhanced_path = os.path.join(
+            '/tmp/uploads',
+            f'enhanced_{os.path.splitext(os.path.basename(file_path))[0]}{processor.output_extension}'
+        )
+        upload = None
         try:
-            transcription_client = DeepgramTranscriptionClient()
-            processor = AudioProcessor(file_path)
-            
+            # A recording short enough for one request is uploaded as it is
+            # enhanced, without a round trip through the disk; longer ones are
+            # written out and transcribed in segments. A streamed recording's
+            # transcript is cached under its upload and enhancement settings,
+            # so resubmitting it skips the upload
+            stream = None
+            cached_response = None
+            if segmented_transcriber.segment_count(processor.metadata.duration, *processor.output_layout) == 1:
+                # From the same digest of the upload as the enhanced audio cache key
+                transcript_key = await asyncio.to_thread(lambda: transcription_client.stream_cache_key(
+                    file_path, processor.cache_params(), processor.content_digest()
+                ))
+                cached_response = transcript_cache.get(transcript_key)
+                if cached_response is None:
+                    stream = EncodedStream(cancel_token=processor.cancel_token)
+                    upload = asyncio.create_task(transcription_client.transcribe_stream(
+                        stream, stream.content_type, time_map=lambda: processor.time_map, cache_key=transcript_key
+                    ))
+
             # Process audio with enhanced error handling
             try:
-                enhanced_audio, sample_rate, noise_type = await processor.process_audio()
-                enhanced_path = os.path.join('/tmp/uploads', f'enhanced_{os.path.basename(file_path)}')
-                await asyncio.to_thread(processor.save_enhanced_audio, enhanced_audio, sample_rate, enhanced_path)
+                enhanced_path, sample_rate, noise_profiles = await asyncio.to_thread(
+                    processor.process_audio, enhanced_path, stream
+                )
             except AudioProcessingError as e:
                 logger.error(f"Audio processing error: {str(e)}")
                 raise
 
             # Transcribe with proper error handling
             try:
-                result = await transcription_client.transcribe_file(enhanced_path)
+                if upload is not None:
+                    result = await upload
+                elif cached_response is not None:
+                    result = transcription_client.response_result(cached_response, time_map=processor.time_map)
+                else:
+                    result = await segmented_transcriber.transcribe(enhanced_path, time_map=processor.time_map)
                 if not result or 'error' in result:
                     raise ValueError(f"Transcription failed: {result.get('error', 'Unknown error')}")
             except Exception as e:
                 logger.error(f"Transcription error: {str(e)}")
                 raise
 
+            # A cancel that arrived while Deepgram was transcribing still wins
+            if processor.cancel_token.cancelled:
+                raise AudioProcessingCancelled(processor.cancel_token.reason)
+
             # Update transcription record
             transcription = Transcription.query.get(transcription_id)
             transcription.text = result.get('text', '')
             transcription.confidence_score = result.get('confidence', 0.0)
             transcription.status = 'completed'
+            if processor.enhancement_report:
+                transcription.enhancement_tier = processor.enhancement_report.get('tier')
+                transcription.enhancement_time_saved = processor.enhancement_report.get('time_saved_seconds')
 
             # Process speakers with validation
             speakers_data = result.get('speakers', [])
@@ -146,19 +258,26 @@ class TranscriptionAPI(Resource):
                 )
                 db.session.add(speaker)
 
-            # Add noise profile
-            noise_profile = NoiseProfile(
-                transcription_id=transcription_id,
-                type=noise_type,
-                confidence=0.85,
-                start_time=0.0,
-                end_time=float(len(enhanced_audio)) / sample_rate
-            )
-            db.session.add(noise_profile)
+            # Add one noise profile per classified segment
+            for profile in noise_profiles:
+                noise_profile = NoiseProfile(
+                    transcription_id=transcription_id,
+                    type=profile['type'],
+                    confidence=profile['confidence'],
+                    start_time=profile['start_time'],
+                    end_time=profile['end_time']
+                )
+                db.session.add(noise_profile)
             
             db.session.commit()
             logger.info(f"Successfully processed transcription {transcription_id}")
 
+        except AudioProcessingCancelled as e:
+            logger.info(f"Transcription {transcription_id} cancelled: {str(e)}")
+            transcription = Transcription.query.get(transcription_id)
+            transcription.status = TranscriptionStatus.CANCELLED
+            transcription.text = str(e)
+            db.session.commit()
         except Exception as e:
             logger.error(f"Error processing transcription {transcription_id}: {str(e)}")
             transcription = Transcription.query.get(transcription_id)
@@ -166,12 +285,66 @@ class TranscriptionAPI(Resource):
             transcription.text = str(e)
             db.session.commit()
         finally:
+            active_jobs.pop(transcription_id, None)
+            if upload is not None:
+                # Stop an upload the job ended early, or mark its error seen
+                if upload.done() and not upload.cancelled():
+                    upload.exception()
+                else:
+                    upload.cancel()
             # Cleanup
             for path in [file_path, enhanced_path]:
                 try:
-                    if os.path.exists(path):
+                    if path and os.path.exists(path):
                         os.remove(path)
                 except Exception as e:
                     logger.error(f"Error cleaning up file {path}: {str(e)}")
 
+class TranscriptionCancelAPI(Resource):
+    @require_api_key
+    def post(self, transcription_id):
+        """Cancel a running transcription job"""
+        processor = active_jobs.get(transcription_id)
+        if processor is None:
+            transcription = Transcription.query.get(transcription_id)
+            if transcription is None:
+                return {'error': 'Transcription not found'}, 404
+            return {'error': 'Transcription is not running'}, 409
+
+        processor.cancel_token.cancel()
+        logger.info(f"Cancellation requested for transcription {transcription_id}")
+        return {
+            'id': transcription_id,
+            'status': 'cancelling',
+            'message': 'Cancellation requested'
+        }, 202
+
+api.add_resource(TranscriptionCancelAPI, '/transcriptions/<int:transcription_id>/cancel')
+
+class TranscriptionProfileAPI(Resource):
+    @require_api_key
+    def get(self, transcription_id):
+        """Per-stage processing profile of a transcription job"""
+        profile = profile_store.get(transcription_id)
+        if profile is None:
+            return {'error': 'No profile recorded for this transcription'}, 404
+        return profile, 200
+
+api.add_resource(TranscriptionProfileAPI, '/transcriptions/<int:transcription_id>/profile')
+
+class ProfileListAPI(Resource):
+    @require_api_key
+    def get(self):
+        """Profiles of the most recent jobs, newest first, with per-stage totals"""
+        try:
+            limit = int(request.args.get('limit', 50))
+        except ValueError:
+            return {'error': 'limit must be an integer'}, 400
+        return {
+            'profiles': profile_store.recent(limit),
+            'summary': profile_store.stats()
+        }, 200
+
+api.add_resource(ProfileListAPI, '/profiles')
+
 # Rest of the API classes remain the same...
@@ -0,0 +1,596 @@
+"""Reproducible benchmarks of AudioProcessor on synthetic corpora.
+
+Every benchmark case is one entry point run on one synthetic recording:
+
+* ``enhance_audio``: the whole signal enhanced in one in-memory pass,
+* ``process_chunk``: the signal pushed block by block through
+  ``_process_chunk`` with a ChunkEngine, as the sequential pipeline does,
+* ``process_audio``: the full file pipeline (decode, front end, pre-pass,
+  enhancement, save) from the corpus file to an output file.
+
+Recordings are speech-like (voiced syllables with formants, fricatives and
+word and sentence pauses) with a chosen noise type (hiss, hum, babble,
+broadband, ambient or none) mixed in at a chosen SNR, for any duration,
+sample rate and channel count. They are generated in blocks from a seed,
+so any corpus can be rebuilt exactly, and are cached as 16-bit WAV files,
+like the uploads the service gets. The clean speech is regenerated when
+scoring rather than stored.
+
+Each case runs in its own spawned process, so peak RSS is the case's own,
+and is repeated (--repeat) to keep the fastest run. A case reports:
+
+* throughput: audio seconds per CPU second (the process and any pool
+  workers it waited for) and per wall second,
+* peak RSS of the process and its growth while the entry point ran, and
+  the peak RSS of its worker processes,
+* SNR improvement: the scale-invariant SNR of the output against the clean
+  speech minus that of the noisy input, both after the same front end and
+  pre-emphasis the enhancer applies, and
+* for process_audio, the job's per-stage profile (see profiling).
+
+Results are written as JSON together with the environment. Given a
+baseline results file, cases with the same id are compared and flagged
+as regressions when throughput falls or peak memory grows by more than
+the tolerances (and memory by at least MEMORY_MIN_GROWTH, below which RSS
+readings are allocator noise) or the SNR improvement drops by more than
+SNR_TOLERANCE_DB.
+
+Run ``python -m audio_processor.benchmark`` with a --preset (quick,
+standard, long) or explicit --durations, --sample-rates, --channels,
+--noise, --snr and --modes lists; --baseline compares against an earlier
+run, and the exit status is 1 when a regression is flagged.
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import scipy
+import soundfile as sf
+from scipy import signal
+
+from .cancellation import CancellationToken
+from .chunk_engine import ChunkEngine
+from .frontend import FrontEnd
+
+CORPUS_VERSION = 1
+BLOCK_SECONDS = 10.0
+MODES = ('enhance_audio', 'process_chunk', 'process_audio')
+NOISE_TYPES = ('hiss', 'hum', 'babble', 'broadband', 'ambient', 'none')
+# The in-memory modes hold the whole signal and its STFT; longer recordings
+# only run through process_audio
+MAX_IN_MEMORY_SECONDS = 600
+
+PRESETS = {
+    'quick': {
+        'durations': (10,),
+        'sample_rates': (16000, 44100),
+        'channels': (1, 2),
+        'noise': ('hiss', 'babble'),
+        'snr': (10,),
+        'modes': MODES
+    },
+    'standard': {
+        'durations': (10, 60, 600),
+        'sample_rates': (8000, 16000, 44100, 48000),
+        'channels': (1, 2),
+        'noise': ('hiss', 'hum', 'babble', 'broadband', 'ambient'),
+        'snr': (0, 10, 20),
+        'modes': MODES
+    },
+    'long': {
+        'durations': (600, 3600, 10800),
+        'sample_rates': (16000, 44100),
+        'channels': (1,),
+        'noise': ('hiss', 'babble'),
+        'snr': (10,),
+        'modes': ('process_audio',)
+    }
+}
+
+# Regression thresholds against a baseline run
+THROUGHPUT_TOLERANCE = 0.10  # fractional drop in audio seconds per CPU second
+MEMORY_TOLERANCE = 0.20  # fractional growth of peak RSS growth
+MEMORY_MIN_GROWTH = 32 * 1024 * 1024
+SNR_TOLERANCE_DB = 0.5
+
+
+class SpeechLikeSource:
+    """Endless speech-like signal: formant-shaped voiced syllables, fricatives and pauses"""
+    # F1, F2, F3 of a few vowels, in Hz
+    VOWELS = ((730, 1090, 2440), (270, 2290, 3010), (300, 870, 2240), (530, 1840, 2480), (570, 840, 2410))
+    FORMANT_BANDWIDTH = 120.0
+    MAX_HARMONIC_HZ = 4000.0
+
+    def __init__(self, sample_rate, rng):
+        self.sample_rate = sample_rate
+        self.rng = rng
+        self.f0 = rng.uniform(100, 220)
+        self._buffer = np.zeros(0)
+
+    def read(self, frames):
+        pieces = [self._buffer]
+        available = len(self._buffer)
+        while available < frames:
+            piece = self._next_piece()
+            pieces.append(piece)
+            available += len(piece)
+        buffer = np.concatenate(pieces)
+        self._buffer = buffer[frames:]
+        return buffer[:frames]
+
+    def _next_piece(self):
+        rng = self.rng
+        if rng.random() < 0.12:
+            gap = rng.uniform(0.4, 1.2)  # between sentences
+        else:
+            gap = rng.uniform(0.03, 0.15)  # between syllables and words
+        pieces = []
+        if rng.random() < 0.3:
+            pieces.append(self._fricative(rng.uniform(0.04, 0.1)))
+        pieces.append(self._syllable(rng.uniform(0.12, 0.3)))
+        pieces.append(np.zeros(int(gap * self.sample_rate)))
+        return np.concatenate(pieces)
+
+    def _syllable(self, seconds):
+        rng = self.rng
+        frames = max(1, int(seconds * self.sample_rate))
+        self.f0 = float(np.clip(self.f0 * rng.uniform(0.9, 1.1), 90, 250))
+        time_axis = np.arange(frames) / self.sample_rate
+        f0 = self.f0 * (1 + 0.06 * np.sin(2 * np.pi * rng.uniform(2, 5) * time_axis + rng.uniform(0, 2 * np.pi)))
+        phase = 2 * np.pi * np.cumsum(f0) / self.sample_rate
+
+        top = min(self.MAX_HARMONIC_HZ, 0.45 * self.sample_rate)
+        harmonics = np.arange(1, max(2, int(top / f0.max())))
+        formants = np.asarray(self.VOWELS[rng.integers(len(self.VOWELS))], dtype=float)
+        frequencies = harmonics * self.f0
+        envelope = np.sum(1 / (1 + ((frequencies[:, np.newaxis] - formants) / self.FORMANT_BANDWIDTH) ** 2), axis=1)
+        envelope /= np.sqrt(harmonics)
+        voiced = envelope @ np.sin(np.outer(harmonics, phase))
+        voiced *= np.sqrt(np.hanning(frames))
+        return voiced / (np.abs(voiced).max() + 1e-12) * rng.uniform(0.2, 0.4)
+
+    def _fricative(self, seconds):
+        frames = max(2, int(seconds * self.sample_rate))
+        noise = np.diff(self.rng.standard_normal(frames + 1))  # tilted towards high frequencies
+        return noise * np.hanning(frames) * self.rng.uniform(0.02, 0.05)
+
+
+class NoiseSource:
+    """Endless (frames, channels) noise of one type at unit RMS per block"""
+    PINK_B = (0.049922035, -0.095993537, 0.050612699, -0.004408786)
+    PINK_A = (1.0, -2.494956002, 2.017265875, -0.522189400)
+    BROWN_POLE = 0.995
+    HUM_HZ = 60.0
+    BABBLE_TALKERS = 6
+
+    def __init__(self, kind, sample_rate, channels, rng):
+        if kind not in NOISE_TYPES:
+            raise ValueError(f"Unknown noise type: {kind}")
+        self.kind = kind
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.rng = rng
+        self._position = 0
+        self._state = None
+        if kind == 'broadband':
+            self._filter = (self.PINK_B, self.PINK_A)
+        elif kind == 'ambient':
+            self._filter = ((1.0,), (1.0, -self.BROWN_POLE))
+        if kind in ('broadband', 'ambient'):
+            self._state = np.zeros((len(self._filter[1]) - 1, channels))
+        if kind == 'babble':
+            self._talkers = [SpeechLikeSource(sample_rate, rng) for _ in range(self.BABBLE_TALKERS)]
+
+    def read(self, frames):
+        if self.kind == 'none':
+            return np.zeros((frames, self.channels))
+        if self.kind == 'hiss':
+            noise = self.rng.standard_normal((frames, self.channels))
+        elif self.kind == 'hum':
+            time_axis = (self._position + np.arange(frames)) / self.sample_rate
+            hum = sum(np.sin(2 * np.pi * self.HUM_HZ * h * time_axis) / h for h in range(1, 6))
+            noise = hum[:, np.newaxis] + 0.05 * self.rng.standard_normal((frames, self.channels))
+        elif self.kind == 'babble':
+            babble = sum(talker.read(frames) for talker in self._talkers)
+            noise = babble[:, np.newaxis] + 0.01 * self.rng.standard_normal((frames, self.channels))
+        else:
+            b, a = self._filter
+            noise, self._state = signal.lfilter(
+                b, a, self.rng.standard_normal((frames, self.channels)), axis=0, zi=self._state
+            )
+        self._position += frames
+        return noise / (np.sqrt(np.mean(noise ** 2)) + 1e-12)
+
+
+class SyntheticCorpus:
+    """A reproducible noisy speech-like recording"""
+
+    def __init__(self, seconds, sample_rate=16000, channels=1, noise='hiss', snr_db=10.0, seed=0):
+        self.seconds = seconds
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.noise = noise
+        self.snr_db = snr_db
+        self.seed = seed
+        self.frames = int(round(seconds * sample_rate))
+
+    @property
+    def name(self):
+        return (
+            f"{self.noise}_{self.snr_db:g}dB_{self.seconds:g}s_{self.sample_rate}Hz_"
+            f"{self.channels}ch_seed{self.seed}_v{CORPUS_VERSION}"
+        )
+
+    def blocks(self):
+        """Yield (clean, noisy) float64 (frames, channels) blocks covering the recording"""
+        rng = np.random.default_rng([self.seed, CORPUS_VERSION])
+        speech = SpeechLikeSource(self.sample_rate, rng)
+        noise = NoiseSource(self.noise, self.sample_rate, self.channels, rng)
+        # Each channel hears the talker at its own level
+        gains = 1.0 - 0.2 * np.arange(self.channels)
+        block_frames = int(BLOCK_SECONDS * self.sample_rate)
+        for start in range(0, self.frames, block_frames):
+            frames = min(block_frames, self.frames - start)
+            clean = speech.read(frames)[:, np.newaxis] * gains
+            # Scaled per block, so the SNR holds throughout the recording
+            speech_rms = np.sqrt(np.mean(clean ** 2)) or 0.1
+            noisy = clean + noise.read(frames) * speech_rms * 10 ** (-self.snr_db / 20)
+            yield clean, np.clip(noisy, -1.0, 1.0)
+
+    def write(self, directory):
+        """Path of the corpus as 16-bit WAV in directory, generated on first use"""
+        path = os.path.join(directory, f"{self.name}.wav")
+        if os.path.exists(path):
+            return path
+        os.makedirs(directory, exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with sf.SoundFile(temp_path, 'w', self.sample_rate, self.channels, 'PCM_16', format='WAV') as corpus_file:
+            for _, noisy in self.blocks():
+                corpus_file.write(noisy)
+        os.replace(temp_path, path)
+        return path
+
+    def clean(self):
+        """The whole clean signal as (frames, channels)"""
+        return np.concatenate([clean for clean, _ in self.blocks()])
+
+
+class SISNRAccumulator:
+    """Scale-invariant SNR of an estimate against a reference, accumulated block by block"""
+
+    def __init__(self):
+        self.cross = 0.0
+        self.reference_power = 0.0
+        self.estimate_power = 0.0
+
+    def add(self, reference, estimate):
+        reference = np.asarray(reference, dtype=np.float64).ravel()
+        estimate = np.asarray(estimate, dtype=np.float64).ravel()
+        self.cross += float(reference @ estimate)
+        self.reference_power += float(reference @ reference)
+        self.estimate_power += float(estimate @ estimate)
+
+    @property
+    def value(self):
+        if not self.reference_power:
+            return None
+        # Energy of the scaled reference and of what is left of the estimate
+        scale = self.cross / self.reference_power
+        target = scale ** 2 * self.reference_power
+        residual = max(self.estimate_power - 2 * scale * self.cross + target, 1e-20)
+        return 10 * np.log10(max(target, 1e-20) / residual)
+
+
+def _aligned(*streams):
+    """Zip block streams of different block lengths into equal-length block tuples"""
+    iterators = [iter(stream) for stream in streams]
+    buffers = [None] * len(streams)
+    while True:
+        for index, iterator in enumerate(iterators):
+            while buffers[index] is None or not len(buffers[index]):
+                block = next(iterator, None)
+                if block is None:
+                    return
+                buffers[index] = block if buffers[index] is None else np.concatenate([buffers[index], block])
+        length = min(len(buffer) for buffer in buffers)
+        yield tuple(buffer[:length] for buffer in buffers)
+        buffers = [buffer[length:] for buffer in buffers]
+
+
+def _emphasized(blocks):
+    """Pre-emphasis as the ChunkEngine applies it, carried across (frames, channels) blocks"""
+    state = None
+    for block in blocks:
+        if state is None:
+            state = np.zeros((1, block.shape[1]))
+        emphasized, state = signal.lfilter([1.0, -ChunkEngine.PRE_EMPHASIS], [1.0], block, axis=0, zi=state)
+        yield emphasized
+
+
+def _cpu_seconds():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def _peak_rss(who=resource.RUSAGE_SELF):
+    return resource.getrusage(who).ru_maxrss * 1024  # kilobytes on Linux
+
+
+def _run_case(case, corpus_dir, output_dir):
+    """Run one case in this (fresh) process; returns its result dict"""
+    # Imported here so the parent process stays light
+    from .processor import AudioProcessor
+
+    corpus = SyntheticCorpus(case['seconds'], case['sample_rate'], case['channels'], case['noise'], case['snr_db'])
+    path = corpus.write(corpus_dir)
+    processor = AudioProcessor(
+        path, workers=case['workers'], target_sample_rate=case['target_sample_rate'],
+        tier=case['tier'], cancel_token=CancellationToken()
+    )
+
+    if case['mode'] == 'process_audio':
+        output_path = os.path.join(output_dir, f"{case['id']}.wav")
+        baseline_rss = _peak_rss()
+        cpu_start, wall_start = _cpu_seconds(), time.perf_counter()
+        processor.process_audio(output_path)
+        cpu, wall = _cpu_seconds() - cpu_start, time.perf_counter() - wall_start
+        peak_rss = _peak_rss()
+        snr_in, snr_out = _score_file(corpus, path, output_path, processor)
+        os.remove(output_path)
+        stages = {stage['stage']: stage['wall_seconds'] for stage in processor.profile['stages']}
+    else:
+        noisy, sample_rate = sf.read(path, dtype='float32', always_2d=True)
+        baseline_rss = _peak_rss()
+        cpu_start, wall_start = _cpu_seconds(), time.perf_counter()
+        if case['mode'] == 'enhance_audio':
+            enhanced = processor.enhance_audio(noisy.T, sample_rate).T
+        else:
+            enhanced = _chunked(processor, noisy, sample_rate)
+        cpu, wall = _cpu_seconds() - cpu_start, time.perf_counter() - wall_start
+        peak_rss = _peak_rss()
+        reference = next(_emphasized([corpus.clean()]))
+        snr_in, snr_out = (
+            _si_snr(reference, next(_emphasized([noisy]))),
+            _si_snr(reference, enhanced.reshape(len(enhanced), -1))
+        )
+        stages = None
+
+    return {
+        'cpu_seconds': round(cpu, 4),
+        'wall_seconds': round(wall, 4),
+        'audio_seconds_per_cpu_second': round(case['seconds'] / cpu, 2) if cpu else None,
+        'audio_seconds_per_wall_second': round(case['seconds'] / wall, 2) if wall else None,
+        'peak_rss_bytes': peak_rss,
+        'peak_rss_growth_bytes': max(0, peak_rss - baseline_rss),
+        'worker_peak_rss_bytes': _peak_rss(resource.RUSAGE_CHILDREN),
+        'input_si_snr_db': round(snr_in, 2),
+        'output_si_snr_db': round(snr_out, 2),
+        'snr_improvement_db': round(snr_out - snr_in, 2),
+        'stages': stages
+    }
+
+
+def _chunked(processor, noisy, sample_rate):
+    """Enhance block by block through _process_chunk, as the sequential pipeline does"""
+    engine = processor.create_chunk_engine(noisy[:processor.block_frames].T, sample_rate)
+    outputs = []
+    for start in range(0, len(noisy), processor.block_frames):
+        chunk = noisy[start:start + processor.block_frames]
+        outputs.append(processor._process_chunk(chunk, sample_rate, engine=engine, final=False))
+    outputs.append(processor._process_chunk(noisy[:0], sample_rate, engine=engine, final=True))
+    # Mono blocks come back flat, and a block inside the engine's look-ahead empty
+    return np.concatenate([output.reshape(-1, noisy.shape[1]) for output in outputs])
+
+
+def _si_snr(reference, estimate):
+    accumulator = SISNRAccumulator()
+    length = min(len(reference), len(estimate))
+    accumulator.add(reference[:length], estimate[:length])
+    return accumulator.value
+
+
+def _score_file(corpus, input_path, output_path, processor):
+    """Input and output SI-SNR of process_audio, streamed through the processor's front end"""
+    def converted(blocks):
+        frontend = FrontEnd(
+            corpus.sample_rate, corpus.channels, processor.target_sample_rate, processor.channel_mode
+        )
+        return _emphasized(frontend.stream(blocks))
+
+    block_frames = int(BLOCK_SECONDS * corpus.sample_rate)
+    clean = converted(clean for clean, _ in corpus.blocks())
+    noisy = converted(sf.blocks(input_path, block_frames, dtype='float32', always_2d=True))
+    output = sf.blocks(output_path, block_frames, dtype='float32', always_2d=True)
+
+    before, after = SISNRAccumulator(), SISNRAccumulator()
+    for reference, noisy_block, output_block in _aligned(clean, noisy, output):
+        before.add(reference, noisy_block)
+        after.add(reference, output_block)
+    return before.value, after.value
+
+
+def _case_worker(case, corpus_dir, output_dir, connection):
+    try:
+        connection.send(('ok', _run_case(case, corpus_dir, output_dir)))
+    except Exception as e:
+        connection.send(('error', f"{type(e).__name__}: {str(e)}"))
+    finally:
+        connection.close()
+
+
+def run_case(case, corpus_dir, output_dir):
+    """Run one case in a fresh spawned process and return the case with its result"""
+    context = multiprocessing.get_context('spawn')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_case_worker, args=(case, corpus_dir, output_dir, sender))
+    process.start()
+    sender.close()
+    try:
+        status, payload = receiver.recv()
+    except EOFError:
+        status, payload = 'error', f"benchmark process exited with status {process.exitcode}"
+    process.join()
+    if status == 'ok':
+        return dict(case, status='completed', **payload)
+    return dict(case, status='failed', error=payload)
+
+
+def build_cases(durations, sample_rates, channels, noise, snr, modes, workers=1, tier='full',
+                target_sample_rate=16000, max_in_memory_seconds=MAX_IN_MEMORY_SECONDS):
+    """Every combination of the given settings, as case dicts with a stable id"""
+    cases = []
+    for mode, noise_type, snr_db, seconds, sample_rate, channel_count in itertools.product(
+        modes, noise, snr, durations, sample_rates, channels
+    ):
+        case_id = (
+            f"{mode}-{noise_type}-{snr_db:g}dB-{seconds:g}s-{sample_rate}Hz-{channel_count}ch"
+            f"-w{workers}-{tier}"
+        )
+        case = {
+            'id': case_id,
+            'mode': mode,
+            'noise': noise_type,
+            'snr_db': snr_db,
+            'seconds': seconds,
+            'sample_rate': sample_rate,
+            'channels': channel_count,
+            'workers': workers,
+            'tier': tier,
+            'target_sample_rate': target_sample_rate
+        }
+        if mode != 'process_audio' and seconds > max_in_memory_seconds:
+            case.update(status='skipped', error=f"longer than {max_in_memory_seconds}s for an in-memory mode")
+        cases.append(case)
+    return cases
+
+
+def compare(results, baseline):
+    """Flag regressions of results against a baseline run, case by case; returns the flagged ids"""
+    previous = {case['id']: case for case in baseline.get('cases', []) if case.get('status') == 'completed'}
+    regressions = []
+    for case in results['cases']:
+        old = previous.get(case['id'])
+        if case.get('status') != 'completed' or old is None:
+            continue
+        flags = []
+        throughput, old_throughput = case['audio_seconds_per_cpu_second'], old['audio_seconds_per_cpu_second']
+        if throughput and old_throughput and throughput < old_throughput * (1 - THROUGHPUT_TOLERANCE):
+            flags.append(f"throughput {old_throughput} -> {throughput} audio s/CPU s")
+        memory, old_memory = case['peak_rss_growth_bytes'], old['peak_rss_growth_bytes']
+        if memory > old_memory * (1 + MEMORY_TOLERANCE) and memory - old_memory > MEMORY_MIN_GROWTH:
+            flags.append(f"peak RSS growth {old_memory / 2 ** 20:.1f} -> {memory / 2 ** 20:.1f}MB")
+        if case['snr_improvement_db'] < old['snr_improvement_db'] - SNR_TOLERANCE_DB:
+            flags.append(f"SNR improvement {old['snr_improvement_db']} -> {case['snr_improvement_db']} dB")
+        case['regressions'] = flags
+        if flags:
+            regressions.append(case['id'])
+    results['baseline'] = baseline.get('created_at')
+    results['regressions'] = regressions
+    return regressions
+
+
+def environment():
+    """Software and hardware the run was made on, so results are compared like for like"""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'commit': commit
+    }
+
+
+def run(cases, corpus_dir, repeat=1, progress=None):
+    """Run the cases in order, each repeat times keeping the fastest run; returns the results dict"""
+    results = {
+        'created_at': datetime.utcnow().isoformat(),
+        'environment': environment(),
+        'repeat': repeat,
+        'cases': []
+    }
+    with tempfile.TemporaryDirectory(prefix='benchmark_') as output_dir:
+        for case in cases:
+            if case.get('status') != 'skipped':
+                runs = [run_case(case, corpus_dir, output_dir) for _ in range(repeat)]
+                completed = [result for result in runs if result['status'] == 'completed']
+                case = min(completed, key=lambda result: result['cpu_seconds']) if completed else runs[-1]
+            results['cases'].append(case)
+            if progress is not None:
+                progress(case)
+    return results
+
+
+def _report_case(case):
+    if case['status'] == 'completed':
+        print(
+            f"{case['id']}: {case['audio_seconds_per_cpu_second']} audio s/CPU s, "
+            f"peak RSS +{case['peak_rss_growth_bytes'] / 2 ** 20:.1f}MB, "
+            f"SNR {case['snr_improvement_db']:+.2f} dB",
+            file=sys.stderr
+        )
+    else:
+        print(f"{case['id']}: {case['status']} ({case.get('error')})", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='quick')
+    parser.add_argument('--durations', type=float, nargs='+')
+    parser.add_argument('--sample-rates', type=int, nargs='+')
+    parser.add_argument('--channels', type=int, nargs='+')
+    parser.add_argument('--noise', choices=NOISE_TYPES, nargs='+')
+    parser.add_argument('--snr', type=float, nargs='+')
+    parser.add_argument('--modes', choices=MODES, nargs='+')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=3, help='runs per case; the fastest is kept')
+    parser.add_argument('--tier', choices=('bypass', 'fast', 'full', 'auto'), default='full')
+    parser.add_argument('--corpus-dir', default=os.path.join(tempfile.gettempdir(), 'benchmark_corpus'))
+    parser.add_argument('--output', help='results JSON file (default: stdout)')
+    parser.add_argument('--baseline', help='earlier results JSON file to flag regressions against')
+    args = parser.parse_args(argv)
+
+    settings = dict(PRESETS[args.preset])
+    for name in ('durations', 'sample_rates', 'channels', 'noise', 'snr', 'modes'):
+        if getattr(args, name) is not None:
+            settings[name] = getattr(args, name)
+    cases = build_cases(workers=args.workers, tier=args.tier, **settings)
+    results = run(cases, args.corpus_dir, args.repeat, progress=_report_case)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file))
+        for case_id in regressions:
+            print(f"Regression in {case_id}", file=sys.stderr)
+
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(report + '\n')
+    else:
+        print(report)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,167 @@
+"""Content-addressed on-disk cache of enhanced audio.
+
+Entries are keyed on a hash of the uploaded file's bytes together with the
+enhancement parameters, so re-uploads of the same recording under any name
+skip the enhancement pipeline. Each entry is an enhanced audio file, with
+the extension of its output format, plus a small JSON sidecar (sample
+rate, noise profiles). Both are written to a temporary name and renamed
+into place, and the sidecar is written last, so a reader never sees a
+partial entry. Entries are evicted least recently used first once the
+cache grows past its size limit.
+
+Audio is hard-linked into and out of the cache where the filesystem
+allows, so an entry may share its inode with the file it was stored from
+or placed at. Such files must be replaced, never rewritten in place;
+StreamingEncoder removes an existing output file before writing.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+from .encoder import OUTPUT_FORMATS
+
+logger = logging.getLogger(__name__)
+
+
+def content_digest(file_path, block_size=1024 * 1024):
+    """sha256 object fed the file contents, from which content_key derives keys without reading the file again"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as audio_file:
+        for block in iter(lambda: audio_file.read(block_size), b''):
+            digest.update(block)
+    return digest
+
+
+def content_key(file_path, params, block_size=1024 * 1024, digest=None):
+    """
+    Hash of the file contents and the canonical JSON form of params; digest
+    is the file's content_digest, if it has been computed already
+    """
+    digest = (digest or content_digest(file_path, block_size)).copy()
+    digest.update(json.dumps(params, sort_keys=True, separators=(',', ':')).encode())
+    return digest.hexdigest()
+
+
+class EnhancedAudioCache:
+    """LRU, size-bounded cache of enhanced audio files keyed by content hash"""
+    HASH_BLOCK_SIZE = 1024 * 1024
+    AUDIO_SUFFIXES = tuple(extension for _, _, extension in OUTPUT_FORMATS.values())
+    META_SUFFIX = '.json'
+
+    def __init__(self, directory, max_bytes=10 * 1024 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, file_path, params):
+        """Content key of file_path under params (see content_key)"""
+        return content_key(file_path, params, self.HASH_BLOCK_SIZE)
+
+    def _paths(self, key, audio_suffix):
+        base = os.path.join(self.directory, key)
+        return base + audio_suffix, base + self.META_SUFFIX
+
+    def get(self, key, output_path):
+        """
+        Place the cached audio for key at output_path and return its metadata,
+        or return None on a miss.
+        """
+        audio_path, meta_path = self._paths(key, os.path.splitext(output_path)[1])
+        try:
+            with open(meta_path) as meta_file:
+                metadata = json.load(meta_file)
+            self._place(audio_path, output_path)
+            now = time.time()
+            os.utime(meta_path, (now, now))
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            logger.info(f"Enhanced audio cache miss: {key[:12]}")
+            return None
+
+        with self._lock:
+            self.hits += 1
+        logger.info(f"Enhanced audio cache hit: {key[:12]}")
+        return metadata
+
+    def put(self, key, source_path, metadata):
+        """Store source_path and its metadata under key, then evict down to max_bytes"""
+        audio_path, meta_path = self._paths(key, os.path.splitext(source_path)[1])
+        try:
+            self._place(source_path, audio_path)
+            temp_path = f"{meta_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'w') as meta_file:
+                json.dump(metadata, meta_file)
+            os.replace(temp_path, meta_path)
+        except OSError as e:
+            # A failed store only costs a future miss
+            logger.error(f"Error caching enhanced audio {key[:12]}: {str(e)}")
+            return
+        self._evict()
+
+    def _place(self, source, destination):
+        # Hard link where possible, copy otherwise; either way via a
+        # temporary name so destination appears atomically
+        temp_path = f"{destination}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            try:
+                os.link(source, temp_path)
+            except OSError:
+                shutil.copyfile(source, temp_path)
+            os.replace(temp_path, destination)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.META_SUFFIX):
+                continue
+            key = name[:-len(self.META_SUFFIX)]
+            for suffix in self.AUDIO_SUFFIXES:
+                audio_path, meta_path = self._paths(key, suffix)
+                try:
+                    size = os.path.getsize(audio_path) + os.path.getsize(meta_path)
+                    entries.append((os.path.getmtime(meta_path), size, audio_path, meta_path))
+                    break
+                except OSError:
+                    continue
+        return entries
+
+    def _evict(self):
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(entry[1] for entry in entries)
+            for _, size, audio_path, meta_path in entries:
+                if total <= self.max_bytes:
+                    break
+                # Sidecar first, so the entry stops being visible before its audio goes
+                for path in (meta_path, audio_path):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                total -= size
+                self.evictions += 1
+                logger.info(f"Evicted enhanced audio cache entry {os.path.basename(audio_path)}")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions
+            }
@@ -0,0 +1,72 @@
+"""Cooperative deadlines and cancellation for processing jobs.
+
+A CancellationToken belongs to one job. The pipeline calls check() between
+blocks and between enhancement stages, which raises once the job's deadline
+has passed or someone has cancelled it. Unlike a SIGALRM timer this works in
+any thread, affects only its own job, and, because the cancel flag is a
+multiprocessing.Event, also reaches pool workers that received the token
+when the pool started.
+"""
+
+import multiprocessing
+import time
+
+from .exceptions import AudioProcessingCancelled, AudioProcessingTimeout
+
+# Exceptions that end a job on purpose and must not be retried or rewrapped
+INTERRUPTIONS = (AudioProcessingCancelled, AudioProcessingTimeout)
+
+# Start method of the worker pools (see parallel); a token's cancel flag
+# must come from the same context to be shared with their workers
+POOL_START_METHOD = 'forkserver'
+
+
+def pool_context():
+    """multiprocessing context for worker pools: a fork server, or spawn where there is none"""
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context(POOL_START_METHOD if POOL_START_METHOD in methods else 'spawn')
+
+
+class CancellationToken:
+    """Deadline plus cancel flag shared by every stage of one job"""
+
+    def __init__(self, timeout=None):
+        """timeout in seconds counts from start(), or is unlimited if None"""
+        self.timeout = timeout
+        self.deadline = None
+        self.reason = None
+        self._cancelled = pool_context().Event()
+
+    def start(self):
+        """Start the deadline clock, if it is not running already"""
+        if self.deadline is None and self.timeout is not None:
+            self.deadline = time.time() + self.timeout
+        return self
+
+    def cancel(self, reason="Processing cancelled by user"):
+        self.reason = reason
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def expired(self):
+        return self.deadline is not None and time.time() >= self.deadline
+
+    def remaining(self):
+        """Seconds until the deadline, or None without one"""
+        return None if self.deadline is None else max(0.0, self.deadline - time.time())
+
+    def wait(self, seconds):
+        """Sleep for up to seconds, returning early (True) once cancelled"""
+        return self._cancelled.wait(seconds)
+
+    def check(self, stage=None):
+        """Raise AudioProcessingCancelled or AudioProcessingTimeout if the job should stop"""
+        where = f" during {stage}" if stage else ""
+        if self._cancelled.is_set():
+            raise AudioProcessingCancelled(f"{self.reason or 'Processing cancelled'}{where}")
+        if self.expired:
+            raise AudioProcessingTimeout(f"Processing exceeded its {self.timeout}s deadline{where}")
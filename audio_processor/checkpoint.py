@@ -0,0 +1,214 @@
+"""Crash-resumable checkpoints of enhanced chunks.
+
+While a long file is enhanced, every finished chunk (its enhanced samples
+and noise features, plus the ChunkEngine state after it for sequential
+runs) is written to its own file in a per-job directory and then recorded
+in an append-only journal. Files are written under a temporary name,
+fsynced and renamed into place before their journal line is appended and
+fsynced, so every journalled chunk is complete on disk.
+
+A restarted job with the same content key (file contents plus enhancement
+parameters) and the same run layout reads the journal back, checks each
+chunk file against the size and SHA-256 digest recorded for it, and
+resumes after the last chunk that validates: earlier chunks are replayed
+from disk instead of being enhanced again. The directory is removed once
+the job completes; directories of jobs that never come back are removed
+by remove_stale() once they are older than its max_age.
+"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class ChunkCheckpoint:
+    """Durable record of the enhanced chunks of one job"""
+    JOURNAL = 'journal.jsonl'
+    FORMAT_VERSION = 1
+
+    def __init__(self, root, key, layout):
+        """
+        root is the checkpoint directory shared by all jobs, key the job's
+        content key and layout a JSON-serialisable dict describing the run
+        (sample rate, channels, tier, ...) that must match to resume.
+        """
+        self.directory = os.path.join(root, key)
+        self.key = key
+        self.layout = dict(layout, version=self.FORMAT_VERSION, key=key)
+        self.chunks = []  # journal records of the completed chunks, in order
+        os.makedirs(self.directory, exist_ok=True)
+
+    @classmethod
+    def remove_stale(cls, root, max_age):
+        """Remove checkpoint directories not written to in max_age seconds"""
+        if not os.path.isdir(root):
+            return
+        cutoff = time.time() - max_age
+        for name in os.listdir(root):
+            path = os.path.join(root, name)
+            try:
+                if os.path.isdir(path) and os.path.getmtime(path) < cutoff:
+                    shutil.rmtree(path)
+                    logger.info(f"Removed stale checkpoint {name[:12]}")
+            except OSError as e:
+                logger.error(f"Error removing stale checkpoint {path}: {str(e)}")
+
+    @property
+    def completed(self):
+        return len(self.chunks)
+
+    def load(self):
+        """
+        Read back and validate the journal; returns the number of completed
+        chunks to resume after. A journal for another layout is discarded.
+        """
+        self.chunks = []
+        journal_path = os.path.join(self.directory, self.JOURNAL)
+        try:
+            with open(journal_path) as journal:
+                lines = journal.read().splitlines()
+        except FileNotFoundError:
+            lines = []
+
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break  # torn final line from a crash mid-append
+
+        if not records or records[0] != self.layout:
+            if records:
+                logger.warning(f"Checkpoint {self.key[:12]} is for a different run layout, starting over")
+            self._reset()
+            return 0
+
+        for index, record in enumerate(records[1:]):
+            if record.get('index') != index or not self._valid(record['file'], record):
+                logger.warning(f"Checkpoint {self.key[:12]}: chunk {index + 1} failed validation")
+                break
+            self.chunks.append(record)
+
+        # Resuming a stateful run needs the engine state of the last chunk
+        while self.chunks and self.chunks[-1].get('state') and not self._valid(
+            self.chunks[-1]['state']['file'], self.chunks[-1]['state']
+        ):
+            self.chunks.pop()
+
+        # Rewrite the journal so it holds exactly the chunks kept
+        self._write_journal()
+        if self.chunks:
+            logger.info(f"Resuming {self.key[:12]} after {len(self.chunks)} checkpointed chunk(s)")
+        return len(self.chunks)
+
+    def save(self, enhanced, features, state=None):
+        """Durably record the next chunk, with the engine state after it if given"""
+        index = len(self.chunks)
+        record = {
+            'index': index,
+            'frames': int(len(enhanced)),
+            **self._write(f'chunk_{index:06d}.npz', enhanced=enhanced, features=features)
+        }
+        if state is not None:
+            record['state'] = self._write(f'state_{index:06d}.npz', **state)
+
+        self._append(record)
+        # Only the newest engine state is ever needed
+        previous = self.chunks[-1].get('state') if self.chunks else None
+        self.chunks.append(record)
+        if previous:
+            self._remove(previous['file'])
+
+    def chunk(self, index):
+        """Enhanced samples of a completed chunk"""
+        with np.load(os.path.join(self.directory, self.chunks[index]['file'])) as data:
+            return data['enhanced']
+
+    def features(self, index):
+        """Noise features of a completed chunk"""
+        with np.load(os.path.join(self.directory, self.chunks[index]['file'])) as data:
+            return data['features']
+
+    def state(self):
+        """Engine state after the last completed chunk, or None"""
+        if not self.chunks or not self.chunks[-1].get('state'):
+            return None
+        with np.load(os.path.join(self.directory, self.chunks[-1]['state']['file'])) as data:
+            return {name: data[name] for name in data.files}
+
+    def clear(self):
+        """Remove the job's checkpoints"""
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.chunks = []
+
+    def _write(self, name, **arrays):
+        # Serialised in memory so the digest needs no read back from disk
+        buffer = io.BytesIO()
+        np.savez(buffer, **arrays)
+        payload = buffer.getbuffer()
+        path = os.path.join(self.directory, name)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as checkpoint_file:
+            checkpoint_file.write(payload)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(temp_path, path)
+        self._sync_directory()
+        return {'file': name, 'bytes': len(payload), 'sha256': hashlib.sha256(payload).hexdigest()}
+
+    def _valid(self, name, record):
+        path = os.path.join(self.directory, name)
+        try:
+            return os.path.getsize(path) == record['bytes'] and self._digest(path) == record['sha256']
+        except (OSError, KeyError):
+            return False
+
+    def _digest(self, path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as checkpoint_file:
+            for block in iter(lambda: checkpoint_file.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _append(self, record):
+        with open(os.path.join(self.directory, self.JOURNAL), 'a') as journal:
+            journal.write(json.dumps(record) + '\n')
+            journal.flush()
+            os.fsync(journal.fileno())
+
+    def _write_journal(self):
+        path = os.path.join(self.directory, self.JOURNAL)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as journal:
+            for record in [self.layout] + self.chunks:
+                journal.write(json.dumps(record) + '\n')
+            journal.flush()
+            os.fsync(journal.fileno())
+        os.replace(temp_path, path)
+        self._sync_directory()
+
+    def _reset(self):
+        self.clear()
+        os.makedirs(self.directory, exist_ok=True)
+        self._write_journal()
+
+    def _remove(self, name):
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
+
+    def _sync_directory(self):
+        descriptor = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(descriptor)
+        finally:
+            os.close(descriptor)
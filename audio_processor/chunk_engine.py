@@ -0,0 +1,241 @@
+"""Stateful enhancement of a multi-channel stream across consecutive chunks.
+
+The enhancement chain mixes stages with different memory: pre-emphasis looks
+one sample back and the spectral stages (noise gating, echo suppression,
+band limiting) smooth over several seconds. Running them on each chunk
+independently restarts all of that at every chunk edge. The ChunkEngine
+carries the state instead:
+
+* pre-emphasis keeps the last input sample,
+* spectral stages run on each chunk padded with look-behind/look-ahead
+  context, and consecutive outputs are overlap-added with complementary
+  raised-cosine windows. Each padded segment starts on a multiple of
+  FRAME_ALIGNMENT samples so STFT frames fall on the same sample positions
+  as in a single pass over the whole file.
+
+All stages work on ``(channels, samples)`` arrays along the last axis, so
+every channel of a chunk goes through one STFT and one SNR computation.
+Output therefore lags input by ``context + crossfade`` samples until the
+last chunk is pushed with ``final=True``.
+
+A file-level SpectralNoiseProfile, when given, is shared by every chunk
+and channel as the noise gate's floor.
+
+Per-frame noise features from the shared STFT are collected in
+``features`` (one row per STFT frame of the stream, each frame exactly
+once) for the noise classifier.
+
+process_segment() is the stateless counterpart used when chunks are
+enhanced out of order in worker processes: the caller supplies the context
+around the chunk.
+
+All state, windows and output follow the pipeline's dtype policy (see
+dtypes), float32 by default.
+
+An optional ``cancel_token`` (see cancellation) is checked between stages;
+cancellation and deadline errors pass through unwrapped. An optional
+``profiler`` (a profiling.JobProfiler) is told where each stage starts.
+"""
+
+import logging
+
+import numpy as np
+
+from .cancellation import INTERRUPTIONS
+from .dtypes import resolve_dtype
+from .exceptions import AudioEnhancementError
+from .spectral import SpectralEnhancer
+
+logger = logging.getLogger(__name__)
+
+
+class ChunkEngine:
+    """Carry filter state and overlap windows across chunks of a (channels, samples) stream"""
+    PRE_EMPHASIS = 0.97
+    CONTEXT_SECONDS = 6.0
+    CROSSFADE_SECONDS = 0.05
+    FRAME_ALIGNMENT = 1024  # multiple of SpectralEnhancer.HOP_LENGTH
+
+    def __init__(self, sample_rate, channels, strength, noise_profile=None, tier='full', cancel_token=None,
+                 dtype=None, profiler=None):
+        self.sample_rate = sample_rate
+        self.dtype = resolve_dtype(dtype)
+        self.channels = channels
+        self.strength = strength
+        self.noise_profile = noise_profile
+        self.tier = tier
+        self.cancel_token = cancel_token
+        self.profiler = profiler
+        self.spectral = SpectralEnhancer(sample_rate, strength, self._noise_floor(noise_profile), tier, self.dtype)
+        self.context = int(self.CONTEXT_SECONDS * sample_rate)
+        self.crossfade = int(self.CROSSFADE_SECONDS * sample_rate)
+
+        fade = np.linspace(0.0, np.pi / 2, self.crossfade, endpoint=False)
+        self._fade_in = (np.sin(fade) ** 2).astype(self.dtype)
+        self._fade_out = 1 - self._fade_in
+
+        self._last_sample = None
+        self._history = np.zeros((channels, 0), dtype=self.dtype)
+        self._pending = np.zeros((channels, 0), dtype=self.dtype)
+        self._position = 0  # stream offset of the first pending sample
+        self._tail = None
+        self.features = []
+        self.samples_in = 0
+        self.samples_out = 0
+
+    @classmethod
+    def emphasized_noise_power(cls, noise_profile, sample_rate):
+        """
+        Noise STFT power (channels, bins) as the spectral stages see it,
+        i.e. shaped by the pre-emphasis response
+        """
+        frequencies = np.fft.rfftfreq(SpectralEnhancer.FFT_SIZE, 1.0 / sample_rate)
+        power = noise_profile.stft_power(frequencies, sample_rate, SpectralEnhancer.FFT_SIZE)
+        emphasis = np.abs(1.0 - cls.PRE_EMPHASIS * np.exp(-2j * np.pi * frequencies / sample_rate))
+        return power * emphasis ** 2
+
+    def _noise_floor(self, noise_profile):
+        if noise_profile is None:
+            return None
+        power = self.emphasized_noise_power(noise_profile, self.sample_rate)
+        # Mean of a Rayleigh-distributed magnitude with this mean power
+        return (np.sqrt(power) * np.sqrt(np.pi) / 2)[:, :, np.newaxis]
+
+    def process(self, block, final=False):
+        """
+        Push the next (channels, samples) chunk and return whatever output is now final.
+
+        State is only committed once the whole chunk has been processed, so a
+        chunk that raises can be retried without corrupting the engine.
+        """
+        try:
+            self._check('pre-emphasis', block.shape[-1])
+            emphasized = self._pre_emphasis(block, self._last_sample)
+            last_sample = block[:, -1].copy() if block.shape[-1] else self._last_sample
+            if self._pending.shape[-1]:
+                pending = np.concatenate([self._pending, emphasized], axis=-1)
+            else:
+                pending = emphasized
+
+            ready = pending.shape[-1] if final else pending.shape[-1] - self.context - self.crossfade
+            if ready <= 0:
+                self._last_sample = last_sample
+                self._pending = pending
+                self.samples_in += block.shape[-1]
+                return np.zeros((self.channels, 0), dtype=self.dtype)
+
+            lookahead = 0 if final else self.crossfade + self.context
+            history = self._aligned_history()
+            segment = np.concatenate([history, pending[:, :ready + lookahead]], axis=-1)
+            start = history.shape[-1]
+            spectral, features = self._spectral_stages(segment, start, ready)
+
+            region = spectral[:, start:start + ready].copy()
+            tail = None if final else spectral[:, start + ready:start + ready + self.crossfade]
+            if self._tail is not None:
+                overlap = min(self._tail.shape[-1], region.shape[-1])
+                region[:, :overlap] = (
+                    self._tail[:, :overlap] * self._fade_out[:overlap]
+                    + region[:, :overlap] * self._fade_in[:overlap]
+                )
+        except INTERRUPTIONS:
+            raise
+        except Exception as e:
+            logger.error(f"Error in chunk engine: {str(e)}")
+            raise AudioEnhancementError(f"Failed to process chunk in engine: {str(e)}")
+        finally:
+            self._end_stages()
+
+        self._last_sample = last_sample
+        history = np.concatenate([self._history, pending[:, :ready]], axis=-1)
+        self._history = history[:, -(self.context + self.FRAME_ALIGNMENT):]
+        self._pending = pending[:, ready:]
+        self._position += ready
+        self._tail = tail
+        self.features.append(features)
+        self.samples_in += block.shape[-1]
+        self.samples_out += region.shape[-1]
+        return region
+
+    def process_segment(self, segment, start, length):
+        """
+        Enhance segment[:, start:start + length] using the samples around it as context.
+
+        segment must begin on a FRAME_ALIGNMENT boundary of the stream (or at
+        its first sample) and should carry CONTEXT_SECONDS of input on either
+        side of the chunk where the stream has it. Engine state is not used or
+        modified, so segments can be processed in any order and in parallel.
+        Returns the enhanced chunk and its per-frame noise features.
+        """
+        try:
+            self._check('pre-emphasis', segment.shape[-1])
+            emphasized = self._pre_emphasis(segment, None)
+            spectral, features = self._spectral_stages(emphasized, start, length)
+            return spectral[:, start:start + length], features
+        except INTERRUPTIONS:
+            raise
+        except Exception as e:
+            logger.error(f"Error in chunk engine: {str(e)}")
+            raise AudioEnhancementError(f"Failed to process segment in engine: {str(e)}")
+        finally:
+            self._end_stages()
+
+    def state(self):
+        """Arrays that, with restore(), resume the stream after the last processed chunk"""
+        state = {
+            'history': self._history,
+            'pending': self._pending,
+            'counters': np.array([self._position, self.samples_in, self.samples_out], dtype=np.int64)
+        }
+        if self._last_sample is not None:
+            state['last_sample'] = self._last_sample
+        if self._tail is not None:
+            state['tail'] = self._tail
+        return state
+
+    def restore(self, state):
+        """Continue from a state() snapshot; features of earlier chunks are not restored"""
+        self._history = state['history']
+        self._pending = state['pending']
+        self._position, self.samples_in, self.samples_out = (int(value) for value in state['counters'])
+        self._last_sample = state.get('last_sample')
+        self._tail = state.get('tail')
+
+    def _check(self, stage, samples=0):
+        if self.cancel_token is not None:
+            self.cancel_token.check(stage)
+        if self.profiler is not None:
+            self.profiler.mark(stage, samples)
+
+    def _end_stages(self):
+        if self.profiler is not None:
+            self.profiler.mark(None)
+
+    def _aligned_history(self):
+        start = max(0, self._position - self.context)
+        start -= start % self.FRAME_ALIGNMENT
+        return self._history[:, self._history.shape[-1] - (self._position - start):]
+
+    def _pre_emphasis(self, block, last_sample):
+        # Written straight into one output array of the processing dtype
+        emphasized = np.empty(block.shape, dtype=self.dtype)
+        if not block.shape[-1]:
+            return emphasized
+        np.multiply(block[:, :-1], -self.PRE_EMPHASIS, out=emphasized[:, 1:], casting='same_kind')
+        np.add(emphasized[:, 1:], block[:, 1:], out=emphasized[:, 1:], casting='same_kind')
+        if last_sample is None:
+            emphasized[:, 0] = block[:, 0]
+        else:
+            emphasized[:, 0] = block[:, 0] - self.PRE_EMPHASIS * last_sample
+        return emphasized
+
+    def _spectral_stages(self, segment, start, length):
+        self._check('spectral enhancement', segment.shape[-1])
+        enhanced, features = self.spectral.enhance(segment, self.cancel_token, self.profiler)
+        self._end_stages()
+
+        # Keep the features of frames centred inside the chunk, so every
+        # frame of the stream is reported by exactly one chunk
+        centers = self.spectral.frame_centers(features.shape[0])
+        in_chunk = (centers >= start) & (centers < start + length)
+        return enhanced, features[in_chunk]
@@ -0,0 +1,161 @@
+"""Streaming block decoder for audio uploads.
+
+Reads an audio file in fixed-size blocks of float32 samples so the whole
+recording never has to be decoded into memory at once. WAV and FLAC are read
+through soundfile; compressed containers (mp3, mp4) are decoded by an ffmpeg
+subprocess writing raw float32 PCM to a pipe. Stream parameters come from
+the header probe when the caller already has them, otherwise from
+soundfile/ffprobe.
+"""
+
+import json
+import logging
+import os
+import subprocess
+
+import numpy as np
+import soundfile as sf
+
+from .exceptions import AudioFormatError, AudioEnhancementError
+
+logger = logging.getLogger(__name__)
+
+
+class StreamingDecoder:
+    """Decode an audio file block by block into reusable float32 buffers"""
+    SOUNDFILE_FORMATS = {'wav', 'flac'}
+    FFMPEG_FORMATS = {'mp3', 'mp4'}
+    SAMPLE_WIDTH = np.dtype(np.float32).itemsize
+
+    def __init__(self, file_path, audio_format=None, metadata=None):
+        self.file_path = file_path
+        self.format = (audio_format or os.path.splitext(file_path)[1].lstrip('.')).lower()
+        if self.format not in self.SOUNDFILE_FORMATS | self.FFMPEG_FORMATS:
+            raise AudioFormatError(f"No streaming decoder for format: {self.format}")
+
+        if metadata is not None:
+            self.sample_rate = metadata.sample_rate
+            self.channels = metadata.channels
+            self.frames = metadata.frames
+        else:
+            self.sample_rate = None
+            self.channels = None
+            self.frames = None
+            self._read_metadata()
+
+    @property
+    def duration(self):
+        """Duration in seconds, from the container metadata"""
+        return self.frames / self.sample_rate if self.sample_rate else 0.0
+
+    def _read_metadata(self):
+        try:
+            if self.format in self.SOUNDFILE_FORMATS:
+                info = sf.info(self.file_path)
+                self.sample_rate = info.samplerate
+                self.channels = info.channels
+                self.frames = info.frames
+            else:
+                self._read_ffprobe_metadata()
+        except AudioFormatError:
+            raise
+        except Exception as e:
+            logger.error(f"Error reading audio metadata: {str(e)}")
+            raise AudioFormatError(f"Could not read audio metadata: {str(e)}")
+
+    def _read_ffprobe_metadata(self):
+        result = subprocess.run(
+            [
+                'ffprobe', '-v', 'error',
+                '-select_streams', 'a:0',
+                '-show_entries', 'stream=sample_rate,channels:format=duration',
+                '-of', 'json',
+                self.file_path
+            ],
+            capture_output=True,
+            check=True
+        )
+        metadata = json.loads(result.stdout)
+        streams = metadata.get('streams') or []
+        if not streams:
+            raise AudioFormatError(f"No audio stream found in {self.file_path}")
+
+        self.sample_rate = int(streams[0]['sample_rate'])
+        self.channels = int(streams[0]['channels'])
+        duration = float(metadata.get('format', {}).get('duration', 0.0))
+        self.frames = int(round(duration * self.sample_rate))
+
+    def block_count(self, block_frames):
+        """Number of blocks blocks() will yield for the given block size"""
+        return max(1, (self.frames + block_frames - 1) // block_frames)
+
+    def blocks(self, block_frames):
+        """
+        Yield consecutive (frames, channels) float32 blocks.
+
+        Every block is a view into a single buffer that is reused for the next
+        block, so callers must copy anything they need to keep past the next
+        iteration. Peak decode memory is one block regardless of file length.
+        """
+        if block_frames <= 0:
+            raise ValueError("block_frames must be positive")
+
+        if self.format in self.SOUNDFILE_FORMATS:
+            yield from self._soundfile_blocks(block_frames)
+        else:
+            yield from self._ffmpeg_blocks(block_frames)
+
+    def _soundfile_blocks(self, block_frames):
+        buffer = np.empty((block_frames, self.channels), dtype=np.float32)
+        with sf.SoundFile(self.file_path) as audio_file:
+            while True:
+                block = audio_file.read(block_frames, dtype='float32', always_2d=True, out=buffer)
+                if not len(block):
+                    break
+                yield block
+
+    def _ffmpeg_blocks(self, block_frames):
+        frame_bytes = self.SAMPLE_WIDTH * self.channels
+        buffer = bytearray(block_frames * frame_bytes)
+        view = memoryview(buffer)
+        process = subprocess.Popen(
+            [
+                'ffmpeg', '-v', 'error', '-nostdin',
+                '-i', self.file_path,
+                '-vn',
+                '-f', 'f32le',
+                '-acodec', 'pcm_f32le',
+                '-ac', str(self.channels),
+                '-ar', str(self.sample_rate),
+                'pipe:1'
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            bufsize=0
+        )
+        try:
+            while True:
+                filled = 0
+                while filled < len(buffer):
+                    read = process.stdout.readinto(view[filled:])
+                    if not read:
+                        break
+                    filled += read
+
+                frames = filled // frame_bytes
+                if not frames:
+                    break
+                yield np.frombuffer(buffer, dtype=np.float32, count=frames * self.channels).reshape(frames, self.channels)
+                if filled < len(buffer):
+                    break
+
+            return_code = process.wait()
+            if return_code != 0:
+                error_output = process.stderr.read().decode(errors='replace').strip()
+                raise AudioEnhancementError(f"ffmpeg decode failed ({return_code}): {error_output}")
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+            process.stderr.close()
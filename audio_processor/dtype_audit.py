@@ -0,0 +1,148 @@
+"""Per-stage allocation and dtype audit of the enhancement pipeline.
+
+Runs the front end and a ChunkEngine over a synthetic noisy block under
+tracemalloc, which numpy reports its array buffers to. The engine and
+SpectralEnhancer already announce every stage boundary through their
+cancel token's check() calls, so the audit passes a StageProbe in the
+token's place and, for each stage, records its peak allocation above what
+was live when the stage began, in units of one copy of the stage input
+(the block in the processing dtype). A stage that starts promoting to
+float64 or copying its input shows up as extra copies; the output and
+feature dtypes are checked directly.
+
+Run ``python -m audio_processor.dtype_audit`` (optionally with --dtype,
+--seconds, --channels, --tier); it prints one JSON report and exits with
+status 1 when a stage exceeds its COPY_BUDGET or the output dtype leaves
+the policy.
+"""
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from .chunk_engine import ChunkEngine
+from .dtypes import resolve_dtype
+from .frontend import FrontEnd
+from .spectral import SpectralEnhancer
+
+# Most copies of the stage input a stage may allocate at its peak, a margin
+# above what the float32 pipeline measures. The spectral stages work on
+# (channels, bins, frames) arrays, about twice the size of the samples in
+# float32 and four times in complex64; noise reduction also holds
+# filtfilt's and fftconvolve's internal padding.
+COPY_BUDGET = {
+    'front end': 1.5,
+    'pre-emphasis': 2.5,
+    'spectral enhancement': 10.0,
+    'noise reduction': 15.0,
+    'echo suppression': 9.0,
+    'band-pass filtering': 1.0,
+    'inverse STFT': 7.0
+}
+
+
+class StageProbe:
+    """Stands in for a cancel token and measures allocations between check() calls"""
+
+    def __init__(self):
+        self.stages = []
+        self._current = None
+
+    def check(self, stage=None):
+        self.close()
+        tracemalloc.reset_peak()
+        self._current = (stage, tracemalloc.get_traced_memory()[0], time.perf_counter())
+
+    def close(self):
+        if self._current is None:
+            return
+        stage, baseline, started = self._current
+        peak = tracemalloc.get_traced_memory()[1]
+        self.stages.append({
+            'stage': stage,
+            'peak_bytes': max(0, peak - baseline),
+            'seconds': time.perf_counter() - started
+        })
+        self._current = None
+
+
+def audit(dtype=None, seconds=30.0, channels=1, sample_rate=44100, target_sample_rate=16000, tier='full'):
+    """Measure every stage on one synthetic block; returns the report dict"""
+    dtype = resolve_dtype(dtype)
+    rng = np.random.default_rng(0)
+    frames = int(seconds * sample_rate)
+    time_axis = np.arange(frames) / sample_rate
+    tone = 0.3 * np.sin(2 * np.pi * 440 * time_axis)[:, np.newaxis]
+    decoded = (tone + 0.05 * rng.standard_normal((frames, channels))).astype(np.float32)
+
+    frontend = FrontEnd(sample_rate, channels, target_sample_rate, 'keep', dtype)
+    probe = StageProbe()
+    tracemalloc.start()
+    try:
+        probe.check('front end')
+        block = np.concatenate(list(frontend.stream([decoded])))
+        probe.close()
+
+        # The noise floor of the fast tier comes from a profile; a flat
+        # floor at the noise level stands in for one here
+        engine = ChunkEngine(frontend.output_sample_rate, channels, 0.5, dtype=dtype, cancel_token=probe)
+        if tier == 'fast':
+            floor = np.full((channels, len(engine.spectral.frequencies), 1), 0.05 * np.sqrt(SpectralEnhancer.FFT_SIZE))
+            engine.spectral = SpectralEnhancer(engine.sample_rate, 0.5, floor, 'fast', dtype)
+        enhanced = engine.process(np.ascontiguousarray(block.T), final=True)
+        probe.close()
+    finally:
+        tracemalloc.stop()
+
+    # The decoder always yields float32; the front end converts it, so its
+    # copies are counted in the processing dtype
+    input_bytes = {'front end': decoded.size * block.itemsize}
+    stages = []
+    for record in probe.stages:
+        reference = input_bytes.get(record['stage'], block.nbytes)
+        copies = record['peak_bytes'] / reference
+        budget = COPY_BUDGET.get(record['stage'])
+        stages.append(dict(record, copies=round(copies, 2), budget=budget,
+                           regression=budget is not None and copies > budget))
+
+    features = engine.features[0] if engine.features else np.zeros((0, 0), dtype=np.float32)
+    dtype_errors = [
+        f"{name} is {array.dtype}, expected {expected}"
+        for name, array, expected in (
+            ('front end output', block, dtype),
+            ('enhanced output', enhanced, dtype),
+            ('features', features, np.dtype(np.float32))
+        )
+        if array.dtype != expected
+    ]
+    return {
+        'dtype': dtype.name,
+        'tier': tier,
+        'channels': channels,
+        'seconds': seconds,
+        'block_bytes': block.nbytes,
+        'stages': stages,
+        'dtype_errors': dtype_errors,
+        'passed': not dtype_errors and not any(stage['regression'] for stage in stages)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dtype', default=None)
+    parser.add_argument('--seconds', type=float, default=30.0)
+    parser.add_argument('--channels', type=int, default=1)
+    parser.add_argument('--tier', choices=SpectralEnhancer.TIERS, default='full')
+    args = parser.parse_args(argv)
+
+    report = audit(args.dtype, args.seconds, args.channels, tier=args.tier)
+    print(json.dumps(report, indent=2))
+    return 0 if report['passed'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
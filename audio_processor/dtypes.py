@@ -0,0 +1,22 @@
+"""Floating-point dtype policy of the DSP pipeline.
+
+Every stage after decoding (front end, pre-emphasis, the spectral stages,
+pool transfers and the written output) works in one real dtype, float32
+unless configured otherwise. Constants the stages mix into the signal
+(filter taps, windows, masks, gains, noise floors) are created in that
+dtype up front, so numpy never promotes a block to float64 and copies it
+midway through a stage; spectra use the matching complex dtype.
+"""
+
+import numpy as np
+
+DEFAULT_DTYPE = np.dtype(np.float32)
+SUPPORTED_DTYPES = (np.dtype(np.float32), np.dtype(np.float64))
+
+
+def resolve_dtype(dtype=None):
+    """The processing dtype for a dtype argument (None for the default)"""
+    dtype = DEFAULT_DTYPE if dtype is None else np.dtype(dtype)
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"Unsupported processing dtype: {dtype}")
+    return dtype
@@ -0,0 +1,226 @@
+"""Incremental encoding of the enhanced output.
+
+Enhanced chunks are encoded as they are produced into a compact format
+meant for upload to the transcription service rather than for archiving:
+16-bit PCM, either as WAV ('pcm16') or losslessly compressed as FLAC
+('flac'). At the processing format (16 kHz mono by default) that is 32 KB
+per second of audio for WAV and typically half of that or less for FLAC,
+against 64 KB for the float32 samples the enhancer works in.
+
+Samples are converted to 16-bit integers here, rounded and clipped, rather
+than by libsndfile, which wraps out-of-range floats around and does not
+round the same way for every container; both formats therefore hold the
+same samples.
+
+The encoder can also write into a sink that only takes bytes in order,
+such as an EncodedStream feeding an upload while enhancement is still
+running. Both containers go back to fill in their header once the length
+is known, which a sink cannot do, so a sink gets 'pcm16' as a streaming
+WAV: a header whose sizes are left at their maximum, then the samples.
+"""
+
+import asyncio
+import collections
+import logging
+import os
+import struct
+import threading
+
+import numpy as np
+import soundfile as sf
+
+logger = logging.getLogger(__name__)
+
+# Output format: (soundfile container, subtype, file extension)
+OUTPUT_FORMATS = {
+    'pcm16': ('WAV', 'PCM_16', '.wav'),
+    'flac': ('FLAC', 'PCM_16', '.flac')
+}
+DEFAULT_OUTPUT_FORMAT = 'pcm16'
+PCM16_SCALE = 32768  # full scale of 16-bit samples, as soundfile reads them back
+
+
+STREAM_FORMAT = 'pcm16'  # the only format a sink can take
+STREAM_MIME_TYPE = 'audio/wav'
+
+
+def output_extension(output_format):
+    """File extension of an output format"""
+    return OUTPUT_FORMATS[output_format][2]
+
+
+def _streaming_wav_header(sample_rate, channels):
+    # RIFF and data sizes of 0xFFFFFFFF mark a WAV of unknown length
+    block_align = channels * 2
+    return (
+        b'RIFF' + struct.pack('<I', 0xFFFFFFFF) + b'WAVE'
+        + b'fmt ' + struct.pack('<IHHIIHH', 16, 1, channels, sample_rate, sample_rate * block_align, block_align, 16)
+        + b'data' + struct.pack('<I', 0xFFFFFFFF)
+    )
+
+
+class StreamingEncoder:
+    """
+    Encode (frames,) or (frames, channels) blocks as they arrive into one
+    output file, or into a sink (any object with write(bytes)) as a
+    streaming WAV
+    """
+
+    def __init__(self, destination, sample_rate, channels, output_format=DEFAULT_OUTPUT_FORMAT):
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format: {output_format}")
+        self.output_format = output_format
+        self.frames = 0
+        if isinstance(destination, (str, os.PathLike)):
+            container, subtype, _ = OUTPUT_FORMATS[output_format]
+            self.path = destination
+            self._sink = None
+            # Replace an existing file rather than truncate it: it may be a
+            # hard link to a cache entry (see cache)
+            try:
+                os.remove(destination)
+            except FileNotFoundError:
+                pass
+            self._file = sf.SoundFile(destination, 'w', sample_rate, channels, subtype, format=container)
+        else:
+            if output_format != STREAM_FORMAT:
+                raise ValueError(f"Only {STREAM_FORMAT} can be written to a stream, not {output_format}")
+            self.path = None
+            self._sink = destination
+            self._file = None
+            self._sink_bytes = 0
+            self._write_bytes(_streaming_wav_header(sample_rate, channels))
+
+    def write(self, block):
+        """Encode the next block; returns its frame count"""
+        if not len(block):
+            return 0
+        samples = np.rint(np.multiply(block, PCM16_SCALE, dtype=np.float32))
+        np.clip(samples, -PCM16_SCALE, PCM16_SCALE - 1, out=samples)
+        if self._file is not None:
+            self._file.write(samples.astype(np.int16))
+        else:
+            self._write_bytes(samples.astype('<i2').tobytes())
+        self.frames += len(block)
+        return len(block)
+
+    def _write_bytes(self, data):
+        self._sink.write(data)
+        self._sink_bytes += len(data)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+    @property
+    def bytes_written(self):
+        return os.path.getsize(self.path) if self.path is not None else self._sink_bytes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+class EncodedStream:
+    """
+    Encoded bytes handed from a producing thread to an asyncio consumer
+
+    The producer (an encoder in the processing thread) calls write() and
+    finally close(), or fail() with the error that stopped it; a coroutine
+    reads the bytes with async for, for instance as a request body. At most
+    max_buffered bytes wait between the two: write() blocks the producer
+    beyond that until the consumer catches up. When the consumer stops
+    early it calls aclose(), and write() then raises, which stops the
+    producer. A producer blocked on a stalled consumer still stops when
+    cancel_token, the producing job's CancellationToken, is cancelled or
+    expires.
+    """
+    POLL_SECONDS = 0.5
+
+    def __init__(self, max_buffered=16 * 1024 * 1024, cancel_token=None):
+        self.max_buffered = max_buffered
+        self.cancel_token = cancel_token
+        self.content_type = STREAM_MIME_TYPE
+        self.bytes_written = 0
+        self._chunks = collections.deque()
+        self._buffered = 0
+        self._closed = False
+        self._error = None
+        self._abandoned = False
+        self._condition = threading.Condition()
+        self._loop = None
+        self._ready = None
+
+    def write(self, data):
+        with self._condition:
+            while self._buffered >= self.max_buffered and not self._abandoned:
+                if self.cancel_token is not None:
+                    self.cancel_token.check('upload')
+                self._condition.wait(self.POLL_SECONDS)
+            if self._abandoned:
+                raise BrokenPipeError("The reader of the encoded stream stopped")
+            if self._closed:
+                raise ValueError("Write to a closed encoded stream")
+            self._chunks.append(bytes(data))
+            self._buffered += len(data)
+            self.bytes_written += len(data)
+        self._wake()
+        return len(data)
+
+    def close(self):
+        """End of the stream"""
+        with self._condition:
+            self._closed = True
+        self._wake()
+
+    def fail(self, error):
+        """End the stream with error, raised in the reader once it has read what came before"""
+        with self._condition:
+            if self._closed:
+                return
+            self._error = error
+            self._closed = True
+        self._wake()
+
+    def _wake(self):
+        with self._condition:
+            loop, ready = self._loop, self._ready
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(ready.set)
+            except RuntimeError:
+                pass  # the reader's loop is gone
+
+    def __aiter__(self):
+        with self._condition:
+            if self._loop is not None:
+                raise RuntimeError("An encoded stream can only be read once")
+            self._loop = asyncio.get_running_loop()
+            self._ready = asyncio.Event()
+        return self
+
+    async def __anext__(self):
+        while True:
+            with self._condition:
+                if self._chunks and not self._abandoned:
+                    chunk = self._chunks.popleft()
+                    self._buffered -= len(chunk)
+                    self._condition.notify_all()
+                    return chunk
+                if self._error is not None:
+                    raise self._error
+                if self._closed or self._abandoned:
+                    raise StopAsyncIteration
+                self._ready.clear()
+            await self._ready.wait()
+
+    async def aclose(self):
+        """Stop reading, whether or not the stream was read to its end; a later write() raises"""
+        with self._condition:
+            self._abandoned = True
+            self._chunks.clear()
+            self._buffered = 0
+            self._condition.notify_all()
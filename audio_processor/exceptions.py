@@ -26,3 +26,8 @@ class AudioEnhancementError(AudioProcessingError):
     """Raised when audio enhancement operation fails."""
     def __init__(self, message):
         super().__init__(message, error_code='ENHANCEMENT_ERROR')
+
+class AudioProcessingCancelled(AudioProcessingError):
+    """Raised when audio processing is cancelled on request."""
+    def __init__(self, message):
+        super().__init__(message, error_code='CANCELLED')
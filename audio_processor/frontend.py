@@ -0,0 +1,161 @@
+"""Front-end stage that brings decoded audio to the processing format.
+
+Runs between the decoder and enhancement: channels are downmixed or
+selected first, then the signal is resampled to the target rate with a
+streaming polyphase filter. Everything downstream (enhancement, noise
+classification, the saved file and the upload) then works on, typically,
+16 kHz mono instead of the source format. Output blocks, and the
+resampler's filter and history, are in the pipeline's processing dtype
+(see dtypes).
+"""
+
+import logging
+from math import gcd
+
+import numpy as np
+from scipy import signal
+
+from .dtypes import resolve_dtype
+from .exceptions import AudioQualityError
+
+logger = logging.getLogger(__name__)
+
+
+class StreamingResampler:
+    """
+    Polyphase resampler that can be fed consecutive blocks.
+
+    Uses the same anti-aliasing filter and delay compensation as
+    scipy.signal.resample_poly, but keeps enough input history between
+    calls that the concatenated output equals a single resample_poly call
+    over the whole signal.
+    """
+    KAISER_BETA = 5.0
+
+    def __init__(self, source_rate, target_rate, channels, dtype=None):
+        divisor = gcd(int(source_rate), int(target_rate))
+        self.up = int(target_rate) // divisor
+        self.down = int(source_rate) // divisor
+
+        max_rate = max(self.up, self.down)
+        half_len = 10 * max_rate
+        # Cast to the processing dtype before scaling, as resample_poly does
+        self.dtype = resolve_dtype(dtype)
+        taps = signal.firwin(2 * half_len + 1, 1.0 / max_rate, window=('kaiser', self.KAISER_BETA)).astype(self.dtype)
+        taps *= self.up
+        pre_pad = (self.down - half_len % self.down) % self.down
+        self.taps = np.concatenate([np.zeros(pre_pad, dtype=self.dtype), taps])
+        self._delay = (half_len + pre_pad) // self.down
+
+        self._history = np.zeros((0, channels), dtype=self.dtype)
+        self._history_start = 0  # stream index of _history[0], always a multiple of down
+        self._produced = 0  # filter outputs emitted so far, including the delay
+        self._samples_in = 0
+        self._samples_out = 0
+
+    def process(self, block):
+        """Resample the next (frames, channels) block and return the output that is now exact"""
+        self._samples_in += len(block)
+        buffer = np.concatenate([self._history, block]) if len(self._history) else np.asarray(block, dtype=self.dtype)
+        return self._emit(buffer, len(buffer) * self.up // self.down)
+
+    def flush(self):
+        """Return the remaining output once the last block has been processed"""
+        remaining = -(-self._samples_in * self.up // self.down) - self._samples_out
+        padding = np.zeros((len(self.taps) // self.up + self.down + 1, self._history.shape[1]), dtype=self.dtype)
+        buffer = np.concatenate([self._history, padding])
+        tail = self._emit(buffer, len(buffer) * self.up // self.down)
+        emitted = len(tail)
+        tail = tail[:max(0, remaining)]
+        self._samples_out -= emitted - len(tail)
+        return tail
+
+    def _emit(self, buffer, available):
+        offset = self._history_start * self.up // self.down
+        filtered = signal.upfirdn(self.taps, buffer, self.up, self.down, axis=0)
+        first = self._produced - offset
+        last = min(available, len(filtered))
+
+        output = filtered[first:last]
+        self._produced = offset + max(first, last)
+
+        # Drop the filter delay at the start of the stream
+        if self._samples_out == 0 and self._produced - len(output) < self._delay:
+            output = output[self._delay - (self._produced - len(output)):]
+        self._samples_out += len(output)
+
+        # Keep the input the next outputs still depend on, starting on a
+        # multiple of down so output phases line up between calls
+        keep_from = max(0, (self._produced * self.down - len(self.taps) + 1) // self.up)
+        keep_from -= keep_from % self.down
+        keep_from = max(keep_from, self._history_start)
+        self._history = buffer[keep_from - self._history_start:]
+        self._history_start = keep_from
+        return output
+
+
+class FrontEnd:
+    """Downmix/select channels and resample decoded blocks before enhancement"""
+    CHANNEL_MODES = {'mix', 'keep'}
+
+    def __init__(self, sample_rate, channels, target_sample_rate=None, channel_mode='mix', dtype=None):
+        self.sample_rate = sample_rate
+        self.dtype = resolve_dtype(dtype)
+        self.channels = channels
+        self.channel_mode = channel_mode
+
+        if isinstance(channel_mode, int) and not isinstance(channel_mode, bool):
+            if not 0 <= channel_mode < channels:
+                raise AudioQualityError(f"Channel {channel_mode} not available in {channels}-channel audio")
+            self.output_channels = 1
+        elif channel_mode in self.CHANNEL_MODES:
+            self.output_channels = 1 if channel_mode == 'mix' else channels
+        else:
+            raise ValueError(f"Unknown channel mode: {channel_mode}")
+
+        # Never upsample: a lower source rate carries no extra information
+        self.output_sample_rate = min(sample_rate, target_sample_rate or sample_rate)
+        self.resampler = None
+        if self.output_sample_rate != sample_rate:
+            self.resampler = StreamingResampler(sample_rate, self.output_sample_rate, self.output_channels, self.dtype)
+
+        logger.info(
+            f"Front end: {sample_rate}Hz/{channels}ch -> "
+            f"{self.output_sample_rate}Hz/{self.output_channels}ch (channel mode: {channel_mode})"
+        )
+
+    def stream(self, blocks):
+        """
+        Yield one converted (frames, channels) block of the processing dtype per input block.
+
+        The resampler's tail is appended to the last block, so the number of
+        blocks, and with it the chunk count, stays the same as the decoder's.
+        """
+        previous = None
+        for block in blocks:
+            converted = self._convert(block)
+            if previous is not None:
+                yield previous
+            previous = converted
+
+        if previous is None:
+            return
+        if self.resampler is not None:
+            tail = self.resampler.flush()
+            previous = np.concatenate([previous, tail]) if len(tail) else previous
+        yield previous
+
+    def convert_channels(self, block):
+        """Downmix or select channels of a (frames, channels) block, without resampling"""
+        if self.channel_mode == 'mix':
+            return block.mean(axis=1, keepdims=True)
+        if self.channel_mode != 'keep':
+            return block[:, self.channel_mode:self.channel_mode + 1]
+        return block
+
+    def _convert(self, block):
+        block = self.convert_channels(block)
+        if self.resampler is not None:
+            return self.resampler.process(block)
+        # Decoder buffers are reused, so hand on a copy
+        return np.array(block, dtype=self.dtype)
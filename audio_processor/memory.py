@@ -0,0 +1,179 @@
+"""Process-wide memory budget and chunk sizing for processing jobs.
+
+A job's working set is estimated from its probed metadata rather than the
+upload's size, since compressed formats expand many times over when
+decoded. It has two parts:
+
+* a file-level part that grows with duration: the per-frame noise
+  features and VAD levels kept for the whole recording, and
+* a per-block part that grows with the block size: decoder and front-end
+  buffers plus the spectral stages' STFT working arrays, times the number
+  of worker processes enhancing blocks at once.
+
+The MemoryGovernor picks each job's block size from that estimate, the
+budget still unreserved and the RAM psutil reports as available, and
+reserves the job's working set while it runs. A job whose smallest block
+size does not fit waits, first come first served, until running jobs
+release enough; a job that would not fit even on its own still runs once
+nothing else does, with the smallest blocks.
+"""
+
+import collections
+import itertools
+import logging
+import threading
+import time
+
+import psutil
+
+from .chunk_engine import ChunkEngine
+from .decoder import StreamingDecoder
+from .dtypes import resolve_dtype
+from .spectral import SpectralEnhancer
+from .vad import VoiceActivityDetector
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryReservation:
+    """Memory reserved for one admitted job and the block size planned within it"""
+
+    def __init__(self, job, block_frames, working_set):
+        self.job = job
+        self.block_frames = block_frames
+        self.working_set = working_set
+
+
+class MemoryGovernor:
+    """Admit processing jobs against a process-wide memory budget"""
+    # Block sizes tried, largest first; fixed steps keep the block size (and
+    # with it checkpoint layout) stable across runs of the same job
+    BLOCK_SECONDS = (256, 128, 64, 32, 16, 8)
+    # Peak bytes per enhanced float32 sample and channel in the spectral
+    # stages (complex STFT, magnitude, masks and their temporaries; about
+    # 15 copies of the block by dtype_audit, with margin); twice that in
+    # float64
+    ENHANCE_BYTES_PER_SAMPLE = 120
+    # Decoder buffer, channel conversion and resampler copies per decoded sample
+    DECODE_COPIES = 3
+    WORKER_OVERHEAD = 64 * 1024 * 1024  # interpreter and libraries of a pool worker
+    AVAILABLE_FRACTION = 0.5  # plan with at most this share of currently free RAM
+    BUDGET_FRACTION = 0.5  # default budget as a share of total RAM
+    POLL_SECONDS = 0.5
+
+    def __init__(self, budget_bytes=None):
+        self.budget_bytes = budget_bytes or int(psutil.virtual_memory().total * self.BUDGET_FRACTION)
+        self.reserved = 0
+        self.active = 0
+        self.admitted = 0
+        self.queued_total = 0
+        self.wait_seconds = 0.0
+        self._queue = collections.deque()
+        self._tickets = itertools.count()
+        self._condition = threading.Condition()
+
+    def working_set(self, metadata, block_frames, output_rate, output_channels, workers=1, dtype=None):
+        """Estimated peak bytes of a job decoding block_frames frames at a time"""
+        itemsize = resolve_dtype(dtype).itemsize
+        output_rate = output_rate or metadata.sample_rate
+        output_frames = block_frames * output_rate / metadata.sample_rate
+        context = ChunkEngine.CONTEXT_SECONDS * output_rate
+
+        decode = block_frames * metadata.channels * StreamingDecoder.SAMPLE_WIDTH * self.DECODE_COPIES
+        segment = (output_frames + 2 * context) * output_channels
+        enhance = segment * self.ENHANCE_BYTES_PER_SAMPLE * itemsize // 4
+        if workers > 1:
+            # Every worker enhances its own segment, and up to two chunks per
+            # worker wait in shared memory (input and output)
+            enhance = workers * (enhance + self.WORKER_OVERHEAD) + 2 * workers * segment * 2 * itemsize
+
+        stream_frames = metadata.duration * output_rate / SpectralEnhancer.HOP_LENGTH
+        features = stream_frames * len(SpectralEnhancer.FEATURE_NAMES) * 8
+        vad = metadata.duration / VoiceActivityDetector.FRAME_SECONDS * 3 * 8
+        return int(decode + enhance + features + vad)
+
+    def plan(self, metadata, output_rate, output_channels, workers=1, limit=None, dtype=None):
+        """
+        (block_frames, working_set) with the largest block whose working set
+        fits in limit (by default the whole budget) and in available RAM, or
+        the smallest block if none does.
+        """
+        limit = self.budget_bytes if limit is None else limit
+        limit = min(limit, psutil.virtual_memory().available * self.AVAILABLE_FRACTION)
+        for seconds in self.BLOCK_SECONDS:
+            block_frames = int(seconds * metadata.sample_rate)
+            # No shorter than the file, when its header gives the length (a
+            # FLAC STREAMINFO may leave it at 0, unknown)
+            if metadata.frames > 0:
+                block_frames = min(block_frames, metadata.frames)
+            working_set = self.working_set(metadata, block_frames, output_rate, output_channels, workers, dtype)
+            if working_set <= limit:
+                break
+        return block_frames, working_set
+
+    def acquire(self, job, metadata, output_rate, output_channels, workers=1, cancel_token=None, dtype=None):
+        """
+        Wait until the job fits in the budget, reserve its working set and
+        return its MemoryReservation. cancel_token, if given, is checked
+        while waiting.
+        """
+        ticket = next(self._tickets)
+        queued_at = None
+        with self._condition:
+            self._queue.append(ticket)
+            try:
+                while True:
+                    if cancel_token is not None:
+                        cancel_token.check('memory admission')
+                    free = self.budget_bytes - self.reserved
+                    block_frames, working_set = self.plan(
+                        metadata, output_rate, output_channels, workers, free, dtype
+                    )
+                    if self._queue[0] == ticket and (working_set <= free or not self.active):
+                        break
+                    if queued_at is None:
+                        queued_at = time.time()
+                        self.queued_total += 1
+                        logger.info(
+                            f"Queued {job}: needs {working_set / 1024 / 1024:.0f}MB, "
+                            f"{max(0, free) / 1024 / 1024:.0f}MB of the memory budget free"
+                        )
+                    self._condition.wait(self.POLL_SECONDS)
+            finally:
+                self._queue.remove(ticket)
+                self._condition.notify_all()
+
+            if queued_at is not None:
+                self.wait_seconds += time.time() - queued_at
+            self.reserved += working_set
+            self.active += 1
+            self.admitted += 1
+
+        logger.info(
+            f"Admitted {job}: {block_frames} frames per block, "
+            f"{working_set / 1024 / 1024:.0f}MB working set, "
+            f"{self.reserved / 1024 / 1024:.0f}/{self.budget_bytes / 1024 / 1024:.0f}MB reserved"
+        )
+        return MemoryReservation(job, block_frames, working_set)
+
+    def release(self, reservation):
+        with self._condition:
+            self.reserved -= reservation.working_set
+            self.active -= 1
+            self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            return {
+                'budget_bytes': self.budget_bytes,
+                'reserved_bytes': self.reserved,
+                'active_jobs': self.active,
+                'queued_jobs': len(self._queue),
+                'admitted_jobs': self.admitted,
+                'queued_total': self.queued_total,
+                'wait_seconds': self.wait_seconds
+            }
+
+
+# Shared by every AudioProcessor not given its own governor
+default_governor = MemoryGovernor()
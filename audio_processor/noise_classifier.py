@@ -0,0 +1,119 @@
+"""Background noise classification from per-frame spectral features.
+
+The features come from the shared STFT of the enhancement pass (see
+SpectralEnhancer.FEATURE_NAMES), so classification needs no extra read or
+transform of the audio. Frames are grouped into fixed-length segments; in
+each segment only the frames the noise gate mostly closed on (background
+rather than speech) are averaged, every label is scored from those
+averages in one vectorized step, and adjacent segments with the same label
+are merged into NoiseProfile-shaped rows.
+"""
+
+import logging
+
+import numpy as np
+
+from .spectral import SpectralEnhancer
+
+logger = logging.getLogger(__name__)
+
+
+class NoiseClassifier:
+    """Label background noise per time segment with a confidence"""
+    SEGMENT_SECONDS = 5.0
+    BACKGROUND_QUANTILE = 0.5  # frames at or below this gate quantile count as background
+    SILENCE_DB = -100.0  # mean per-bin STFT power; white noise at about -75 dBFS
+    LABELS = ('silence', 'hum', 'broadband', 'babble', 'hiss', 'ambient')
+    SCORE_SHARPNESS = 4.0
+
+    def __init__(self, sample_rate, hop_length=SpectralEnhancer.HOP_LENGTH):
+        self.sample_rate = sample_rate
+        self.hop_length = hop_length
+        self.frames_per_segment = max(1, int(round(self.SEGMENT_SECONDS * sample_rate / hop_length)))
+        self._columns = {name: index for index, name in enumerate(SpectralEnhancer.FEATURE_NAMES)}
+
+    def classify(self, features):
+        """
+        Classify a (frames, features) table covering the whole stream.
+
+        Returns a list of {'type', 'confidence', 'start_time', 'end_time'}
+        dicts, one per run of segments sharing a label.
+        """
+        if features is None or not len(features):
+            return []
+
+        summary, frame_counts = self._segment_summary(features)
+        probabilities = self._label_probabilities(summary)
+        labels = probabilities.argmax(axis=1)
+        confidences = probabilities.max(axis=1)
+        return self._merge(labels, confidences, frame_counts)
+
+    def classify_spectrum(self, power):
+        """
+        Label one (channels, bins) noise power spectrum at SpectralEnhancer
+        bins, e.g. a file-level noise profile, before any enhancement has run.
+        Returns (label, confidence).
+        """
+        features = SpectralEnhancer(self.sample_rate, 1.0).spectrum_features(power)
+        probabilities = self._label_probabilities(features.astype(np.float64))[0]
+        best = int(probabilities.argmax())
+        return self.LABELS[best], float(probabilities[best])
+
+    def _segment_summary(self, features):
+        frames = len(features)
+        segments = -(-frames // self.frames_per_segment)
+        padded = np.full((segments * self.frames_per_segment, features.shape[1]), np.nan, dtype=np.float64)
+        padded[:frames] = features
+        grouped = padded.reshape(segments, self.frames_per_segment, features.shape[1])
+
+        # Background frames: where the noise gate passed least of the signal
+        gate = grouped[:, :, self._columns['gate']]
+        threshold = np.nanquantile(gate, self.BACKGROUND_QUANTILE, axis=1, keepdims=True)
+        background = (gate <= threshold)[:, :, np.newaxis]
+        summary = np.nanmean(np.where(background, grouped, np.nan), axis=1)
+
+        frame_counts = np.full(segments, self.frames_per_segment)
+        frame_counts[-1] = frames - (segments - 1) * self.frames_per_segment
+        return summary, frame_counts
+
+    def _label_probabilities(self, summary):
+        column = lambda name: summary[:, self._columns[name]]
+        energy = column('energy_db')
+        flatness = column('flatness')
+        low, mid, high, top = column('band_low'), column('band_mid'), column('band_high'), column('band_top')
+        zcr = column('zcr')
+
+        # Each score is roughly in [-2, 2]; positive means the segment looks
+        # like that label
+        scores = np.stack([
+            (self.SILENCE_DB - energy) / 2.5,
+            (low - 0.6) * 4.0 + (0.15 - flatness) * 4.0,
+            (flatness - 0.3) * 4.0,
+            (mid + high - 0.7) * 4.0 + (0.3 - flatness) * 2.0,
+            (top - 0.4) * 4.0 + (zcr - 0.3) * 4.0,
+            np.zeros(len(summary))
+        ], axis=1)
+        scores = np.nan_to_num(scores, nan=-1.0) * self.SCORE_SHARPNESS
+        scores -= scores.max(axis=1, keepdims=True)
+        weights = np.exp(scores)
+        return weights / weights.sum(axis=1, keepdims=True)
+
+    def _merge(self, labels, confidences, frame_counts):
+        seconds_per_frame = self.hop_length / self.sample_rate
+        boundaries = np.concatenate([[0], np.cumsum(frame_counts)]) * seconds_per_frame
+        profiles = []
+        run_start = 0
+        for index in range(1, len(labels) + 1):
+            if index < len(labels) and labels[index] == labels[run_start]:
+                continue
+            weights = frame_counts[run_start:index]
+            profiles.append({
+                'type': self.LABELS[labels[run_start]],
+                'confidence': float(np.average(confidences[run_start:index], weights=weights)),
+                'start_time': float(boundaries[run_start]),
+                'end_time': float(boundaries[index])
+            })
+            run_start = index
+
+        logger.info(f"Classified background noise into {len(profiles)} segment(s)")
+        return profiles
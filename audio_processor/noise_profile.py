@@ -0,0 +1,105 @@
+"""File-level spectral noise profile.
+
+The profile is built once per file, during the VAD pre-pass, from the
+lowest-energy (non-speech) frames found anywhere in the recording. Frame
+power spectra are accumulated into 1 dB energy buckets as the scan runs,
+so the non-speech threshold, which depends on the whole file, can be applied
+afterwards without keeping per-frame spectra in memory.
+
+The resulting SpectralNoiseProfile is shared by every chunk and channel: it
+sets the noise-reduction strength and SNR estimates and gives the spectral
+noise gate a fixed per-bin noise floor, so chunked runs no longer depend on
+what each chunk happens to start with. It also lets the noise be classified
+before enhancement starts, which the enhancement tier choice relies on.
+"""
+
+import logging
+
+import numpy as np
+from scipy import signal
+
+logger = logging.getLogger(__name__)
+
+
+class SpectralNoiseProfile:
+    """Per-channel noise power spectral density of one recording"""
+
+    def __init__(self, frequencies, psd, noise_power, speech_power, frames):
+        self.frequencies = frequencies
+        self.psd = psd  # (channels, bins), power per Hz
+        self.noise_power = noise_power  # mean square of the noise frames
+        self.speech_power = speech_power  # mean square of the remaining frames
+        self.frames = frames
+
+    @property
+    def channels(self):
+        return self.psd.shape[0]
+
+    @property
+    def snr_db(self):
+        """Speech-to-noise ratio of the recording in dB"""
+        if not self.noise_power:
+            return float('inf')
+        return 10 * np.log10(max(self.speech_power, self.noise_power) / self.noise_power)
+
+    def stft_power(self, frequencies, sample_rate, fft_size, window='hann'):
+        """
+        Expected noise STFT power at the given bin frequencies, as
+        (channels, bins), for scipy.signal.stft output at sample_rate.
+        """
+        taps = signal.get_window(window, fft_size)
+        psd = np.stack([np.interp(frequencies, self.frequencies, channel) for channel in self.psd])
+        return psd * sample_rate * np.sum(taps ** 2) / np.sum(taps) ** 2
+
+
+class NoiseProfileAccumulator:
+    """Collect frame spectra by frame energy during a scan and build the profile afterwards"""
+    BUCKET_DB = 1.0
+    MIN_DB = -130.0
+    MAX_DB = 10.0
+    MIN_FRAMES = 25
+
+    def __init__(self, sample_rate, frame_length, channels):
+        self.sample_rate = sample_rate
+        self.frame_length = frame_length
+        self.frequencies = np.fft.rfftfreq(frame_length, 1.0 / sample_rate)
+        buckets = int((self.MAX_DB - self.MIN_DB) / self.BUCKET_DB)
+        self._spectra = np.zeros((buckets, channels, len(self.frequencies)))
+        self._power = np.zeros(buckets)
+        self._counts = np.zeros(buckets, dtype=np.int64)
+
+    def add(self, energy_db, power, window):
+        """Add frames with the given energies and windowed (frames, channels, bins) power spectra"""
+        buckets = np.clip(
+            ((energy_db - self.MIN_DB) / self.BUCKET_DB).astype(np.int64), 0, len(self._counts) - 1
+        )
+        # Power per Hz, so profiles compare across frame lengths and rates
+        density = power / (np.sum(window ** 2) * self.sample_rate)
+        np.add.at(self._spectra, buckets, density)
+        np.add.at(self._power, buckets, 10 ** (energy_db / 10))
+        np.add.at(self._counts, buckets, 1)
+
+    def profile(self, threshold_db):
+        """Profile of the frames below threshold_db (at least MIN_FRAMES of the quietest)"""
+        total = self._counts.sum()
+        if not total:
+            return None
+
+        upper_edges = self.MIN_DB + self.BUCKET_DB * np.arange(1, len(self._counts) + 1)
+        selected = upper_edges <= threshold_db
+        if self._counts[selected].sum() < min(self.MIN_FRAMES, total):
+            # Too little silence: fall back to the quietest frames
+            selected = np.cumsum(self._counts) - self._counts < min(self.MIN_FRAMES, total)
+
+        frames = self._counts[selected].sum()
+        psd = self._spectra[selected].sum(axis=0) / frames
+        noise_power = self._power[selected].sum() / frames
+        remaining = total - frames
+        speech_power = self._power[~selected].sum() / remaining if remaining else noise_power
+
+        profile = SpectralNoiseProfile(self.frequencies, psd, noise_power, speech_power, frames)
+        logger.info(
+            f"Noise profile from {frames} of {total} frames: "
+            f"{10 * np.log10(noise_power + 1e-20):.1f} dB, SNR {profile.snr_db:.1f} dB"
+        )
+        return profile
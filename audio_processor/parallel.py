@@ -0,0 +1,254 @@
+"""Process-pool execution of chunk enhancement.
+
+The parent process decodes the file block by block and copies each block,
+together with the context the spectral stages need on either side, into a
+shared memory segment. Worker processes attach to that segment, run
+ChunkEngine.process_segment() on all channels at once and write the enhanced
+samples into a second shared segment, so no sample arrays are pickled in
+either direction; only the small per-frame feature table comes back with
+the task result. Results are handed back strictly in chunk order and the
+features are appended to the parent's engine in that order.
+
+The engine's cancel_token travels to the workers with the engine, and its
+cancel flag is shared with them, so a cancelled or expired job stops
+inside the workers as well as in the parent, which checks it between
+chunks. Cancellation and deadline errors are never retried.
+
+If the engine has a profiler, each worker profiles the stages of its own
+chunks and returns their totals with the features; the parent merges them
+into the engine's profiler.
+
+Workers are started by a fork server (or spawned where there is none)
+rather than forked from the caller: jobs run in threads of a multi-threaded
+server, and a plain fork copies locks other threads hold at that moment,
+logging's among them, into a child that can then deadlock on them.
+"""
+
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .cancellation import INTERRUPTIONS, pool_context
+from .exceptions import AudioEnhancementError
+from .profiling import JobProfiler
+
+logger = logging.getLogger(__name__)
+
+# The engine is sent once per worker through the pool initializer rather
+# than with every task
+_worker_engine = None
+
+
+def _init_worker(engine):
+    global _worker_engine
+    _worker_engine = engine
+    if engine.profiler is not None:
+        # The worker's copy of the profiler carries the parent's open stages
+        engine.profiler = JobProfiler(engine.profiler.job)
+
+
+def _enhance_shared_segment(input_name, output_name, shape, start, length):
+    """Enhance one chunk whose samples and output live in shared memory; returns its features and stage totals"""
+    input_shm = shared_memory.SharedMemory(name=input_name)
+    output_shm = shared_memory.SharedMemory(name=output_name)
+    try:
+        dtype = _worker_engine.dtype
+        segment = np.ndarray(shape, dtype=dtype, buffer=input_shm.buf)
+        output = np.ndarray((length, shape[1]), dtype=dtype, buffer=output_shm.buf)
+        enhanced, features = _worker_engine.process_segment(segment.T, start, length)
+        output[:] = enhanced.T
+        del segment, output
+    finally:
+        input_shm.close()
+        output_shm.close()
+    profiler = _worker_engine.profiler
+    return features, profiler.drain() if profiler is not None else None
+
+
+class _SharedChunk:
+    """Input and output shared memory segments for one in-flight chunk"""
+
+    def __init__(self, index, segment, start, length):
+        self.index = index
+        self.shape = segment.shape
+        self.dtype = segment.dtype
+        self.start = start
+        self.length = length
+        self.input = shared_memory.SharedMemory(create=True, size=max(1, segment.nbytes))
+        np.ndarray(segment.shape, dtype=self.dtype, buffer=self.input.buf)[:] = segment
+        self.output = shared_memory.SharedMemory(
+            create=True,
+            size=max(1, length * segment.shape[1] * self.dtype.itemsize)
+        )
+        self.attempts = 0
+        self.future = None
+        self.features = None
+
+    def result(self):
+        """Copy the enhanced samples out of shared memory"""
+        output = np.ndarray((self.length, self.shape[1]), dtype=self.dtype, buffer=self.output.buf)
+        enhanced = output.copy()
+        del output
+        return enhanced
+
+    def release(self):
+        for shm in (self.input, self.output):
+            try:
+                shm.close()
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class ParallelChunkEnhancer:
+    """Spread chunks of one file across a process pool and reassemble them in order"""
+    MAX_RETRIES = 3
+    POLL_SECONDS = 0.5  # how often the parent checks the cancel token while waiting
+
+    def __init__(self, engine, workers=None):
+        self.engine = engine
+        self.workers = workers or multiprocessing.cpu_count()
+        self.max_in_flight = self.workers * 2
+        self.context = engine.context
+        self.alignment = engine.FRAME_ALIGNMENT
+
+    def iter_segments(self, blocks):
+        """
+        Turn consecutive (frames, channels) blocks into (segment, start, length)
+        tuples, where segment carries aligned look-behind and look-ahead context.
+        """
+        window = np.zeros((0, 0), dtype=self.engine.dtype)
+        window_start = 0
+        region_start = 0
+        regions = []
+
+        for block in blocks:
+            block = np.asarray(block, dtype=self.engine.dtype)
+            window = np.concatenate([window, block]) if len(window) else block.copy()
+            regions.append(len(block))
+
+            # A region can go out once the window holds its full look-ahead
+            while regions:
+                region_end = region_start + regions[0]
+                if window_start + len(window) < region_end + self.context:
+                    break
+                yield self._cut(window, window_start, region_start, regions[0], region_end + self.context)
+                region_start = region_end
+                regions.pop(0)
+                window, window_start = self._trim(window, window_start, region_start)
+
+        while regions:
+            region_end = region_start + regions[0]
+            yield self._cut(window, window_start, region_start, regions[0], region_end + self.context)
+            region_start = region_end
+            regions.pop(0)
+
+    def _segment_start(self, region_start):
+        start = max(0, region_start - self.context)
+        return start - start % self.alignment
+
+    def _cut(self, window, window_start, region_start, length, end):
+        segment_start = self._segment_start(region_start)
+        segment = window[segment_start - window_start:end - window_start]
+        return segment, region_start - segment_start, length
+
+    def _trim(self, window, window_start, region_start):
+        keep_from = self._segment_start(region_start)
+        return window[keep_from - window_start:], keep_from
+
+    def run(self, blocks, start_index=0):
+        """
+        Yield enhanced chunks in order while up to max_in_flight chunks are
+        processed or held back waiting for an earlier chunk.
+
+        Chunks before start_index (already enhanced by an earlier run) are
+        cut for their context but not enhanced or yielded.
+        """
+        in_flight = {}
+        finished = {}
+        next_index = start_index
+
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=pool_context(),
+            initializer=_init_worker,
+            initargs=(self.engine,)
+        ) as executor:
+            try:
+                for index, (segment, start, length) in enumerate(self.iter_segments(blocks)):
+                    if index < start_index:
+                        continue
+                    self._check()
+                    chunk = _SharedChunk(index, segment, start, length)
+                    self._submit(executor, chunk)
+                    in_flight[chunk.future] = chunk
+
+                    # Chunks done out of order hold their shared memory until
+                    # they are emitted, so they count against the limit too
+                    while len(in_flight) + len(finished) >= self.max_in_flight:
+                        self._collect(executor, in_flight, finished)
+                        while next_index in finished:
+                            yield self._emit(finished.pop(next_index))
+                            next_index += 1
+
+                while in_flight:
+                    self._collect(executor, in_flight, finished)
+                    while next_index in finished:
+                        yield self._emit(finished.pop(next_index))
+                        next_index += 1
+            finally:
+                for chunk in in_flight.values():
+                    chunk.future.cancel()
+                executor.shutdown(wait=True, cancel_futures=True)
+                for chunk in in_flight.values():
+                    chunk.release()
+
+    def _emit(self, result):
+        enhanced, features = result
+        self.engine.features.append(features)
+        return enhanced
+
+    def _submit(self, executor, chunk):
+        chunk.attempts += 1
+        chunk.future = executor.submit(
+            _enhance_shared_segment,
+            chunk.input.name,
+            chunk.output.name,
+            chunk.shape,
+            chunk.start,
+            chunk.length
+        )
+
+    def _check(self):
+        if self.engine.cancel_token is not None:
+            self.engine.cancel_token.check('parallel enhancement')
+
+    def _collect(self, executor, in_flight, finished):
+        done = None
+        while not done:
+            self._check()
+            done, _ = wait(list(in_flight), timeout=self.POLL_SECONDS, return_when=FIRST_COMPLETED)
+        for future in done:
+            chunk = in_flight.pop(future)
+            try:
+                chunk.features, stages = future.result()
+            except INTERRUPTIONS:
+                chunk.release()
+                raise
+            except Exception as e:
+                if chunk.attempts >= self.MAX_RETRIES:
+                    chunk.release()
+                    logger.error(f"Chunk {chunk.index + 1} failed after {chunk.attempts} attempts: {str(e)}")
+                    raise AudioEnhancementError(f"Failed to process chunk {chunk.index + 1}: {str(e)}")
+                logger.warning(f"Retry {chunk.attempts} for chunk {chunk.index + 1}: {str(e)}")
+                self._submit(executor, chunk)
+                in_flight[chunk.future] = chunk
+                continue
+
+            if stages and self.engine.profiler is not None:
+                self.engine.profiler.merge(stages)
+            finished[chunk.index] = (chunk.result(), chunk.features)
+            chunk.release()
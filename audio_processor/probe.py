@@ -0,0 +1,373 @@
+"""Header-only probing of audio uploads.
+
+Reads just the container/codec headers of an upload (RIFF fmt/data chunks,
+FLAC STREAMINFO, the first MPEG audio frame plus its Xing/VBRI header, the
+MP4 moov box) to get duration, sample rate, channels and codec without
+decoding any audio. Probing a file costs a few small reads, so uploads can be
+validated and sized before anything is decoded. The container is identified
+from its magic bytes, not from the file name.
+"""
+
+import io
+import logging
+import os
+import struct
+
+from .exceptions import AudioFormatError
+
+logger = logging.getLogger(__name__)
+
+MIME_TYPES = {
+    'wav': 'audio/wav',
+    'flac': 'audio/flac',
+    'mp3': 'audio/mpeg',
+    'mp4': 'audio/mp4'
+}
+
+# MPEG audio header tables, indexed by version bits (0: 2.5, 2: 2, 3: 1)
+_MPEG_SAMPLE_RATES = {
+    3: (44100, 48000, 32000),
+    2: (22050, 24000, 16000),
+    0: (11025, 12000, 8000)
+}
+_MPEG_BITRATES = {
+    (3, 3): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (3, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (3, 1): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 3): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (2, 1): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)
+}
+
+_WAVE_CODECS = {1: 'pcm', 3: 'pcm_float', 6: 'alaw', 7: 'mulaw'}
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+MP3_SCAN_BYTES = 64 * 1024  # how far to look for the first frame sync
+MAX_MOOV_BYTES = 64 * 1024 * 1024
+
+
+class AudioMetadata:
+    """Stream parameters read from an upload's headers"""
+
+    def __init__(self, audio_format, codec, sample_rate, channels, frames, file_size, bits_per_sample=None):
+        self.format = audio_format
+        self.codec = codec
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.frames = frames
+        self.file_size = file_size
+        self.bits_per_sample = bits_per_sample
+
+    @property
+    def duration(self):
+        """Duration in seconds"""
+        return self.frames / self.sample_rate if self.sample_rate else 0.0
+
+    @property
+    def mime_type(self):
+        return MIME_TYPES[self.format]
+
+    def decoded_bytes(self, sample_width=4, channels=None):
+        """Size of the whole stream decoded to sample_width-byte samples"""
+        return self.frames * (channels or self.channels) * sample_width
+
+    def to_dict(self):
+        return {
+            'format': self.format,
+            'codec': self.codec,
+            'sample_rate': self.sample_rate,
+            'channels': self.channels,
+            'frames': self.frames,
+            'duration': self.duration,
+            'bits_per_sample': self.bits_per_sample,
+            'file_size': self.file_size
+        }
+
+    def __repr__(self):
+        return (
+            f"AudioMetadata({self.format}/{self.codec}, {self.sample_rate}Hz, "
+            f"{self.channels}ch, {self.duration:.2f}s)"
+        )
+
+
+def probe_audio(source, audio_format=None):
+    """
+    Read the headers of an audio file and return its AudioMetadata.
+
+    source is a path or a seekable binary file object (its position is
+    restored afterwards). If audio_format is given, the container found in
+    the headers must match it. Raises AudioFormatError for unknown,
+    mismatched or corrupt headers.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as stream:
+            return probe_audio(stream, audio_format)
+
+    position = source.tell()
+    try:
+        source.seek(0, io.SEEK_END)
+        file_size = source.tell()
+        source.seek(0)
+        head = source.read(12)
+
+        if head[:4] == b'RIFF' and head[8:12] == b'WAVE':
+            metadata = _probe_wav(source, file_size)
+        elif head[:4] == b'fLaC':
+            metadata = _probe_flac(source, file_size, 4)
+        elif head[4:8] == b'ftyp':
+            metadata = _probe_mp4(source, file_size)
+        else:
+            metadata = _probe_id3_prefixed(source, file_size, head)
+    except AudioFormatError:
+        raise
+    except (struct.error, KeyError, IndexError, ValueError, OSError) as e:
+        raise AudioFormatError(f"Corrupt audio header: {str(e)}")
+    finally:
+        source.seek(position)
+
+    if audio_format and metadata.format != audio_format.lower():
+        raise AudioFormatError(
+            f"File content is {metadata.format}, which does not match its extension ({audio_format})"
+        )
+    if not metadata.sample_rate or not metadata.channels:
+        raise AudioFormatError(f"Audio header declares no samples ({metadata.format})")
+
+    logger.debug(f"Probed audio: {metadata}")
+    return metadata
+
+
+def _probe_id3_prefixed(stream, file_size, head):
+    # FLAC and MP3 may both start with an ID3v2 tag
+    offset = 0
+    if head[:3] == b'ID3':
+        stream.seek(6)
+        size_bytes = stream.read(4)
+        offset = 10 + ((size_bytes[0] << 21) | (size_bytes[1] << 14) | (size_bytes[2] << 7) | size_bytes[3])
+        if head[5] & 0x10:  # footer present
+            offset += 10
+        stream.seek(offset)
+        if stream.read(4) == b'fLaC':
+            return _probe_flac(stream, file_size, offset + 4)
+    return _probe_mp3(stream, file_size, offset)
+
+
+def _probe_wav(stream, file_size):
+    stream.seek(12)
+    fmt = None
+    while True:
+        header = stream.read(8)
+        if len(header) < 8:
+            raise AudioFormatError("WAV file has no data chunk")
+        chunk_id, chunk_size = struct.unpack('<4sI', header)
+
+        if chunk_id == b'fmt ':
+            fmt = stream.read(min(chunk_size, 40))
+            stream.seek(chunk_size - len(fmt) + (chunk_size & 1), io.SEEK_CUR)
+        elif chunk_id == b'data':
+            if fmt is None:
+                raise AudioFormatError("WAV data chunk precedes its fmt chunk")
+            # Streamed writers leave the size at 0 or 0xFFFFFFFF
+            data_size = min(chunk_size, file_size - stream.tell()) or file_size - stream.tell()
+            break
+        else:
+            stream.seek(chunk_size + (chunk_size & 1), io.SEEK_CUR)
+
+    format_tag, channels, sample_rate, _, block_align, bits = struct.unpack('<HHIIHH', fmt[:16])
+    if format_tag == _WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+        format_tag = struct.unpack('<H', fmt[24:26])[0]
+    codec = _WAVE_CODECS.get(format_tag, f'wave_0x{format_tag:04x}')
+    if codec == 'pcm':
+        codec = f'pcm_s{bits}le' if bits > 8 else 'pcm_u8'
+    elif codec == 'pcm_float':
+        codec = f'pcm_f{bits}le'
+
+    frames = data_size // block_align if block_align else 0
+    return AudioMetadata('wav', codec, sample_rate, channels, frames, file_size, bits)
+
+
+def _probe_flac(stream, file_size, offset):
+    stream.seek(offset)
+    header = stream.read(4)
+    if len(header) < 4 or header[0] & 0x7F != 0:
+        raise AudioFormatError("FLAC stream does not start with STREAMINFO")
+    info = stream.read(34)
+    if len(info) < 34:
+        raise AudioFormatError("Truncated FLAC STREAMINFO block")
+
+    # 20 bits sample rate, 3 bits channels - 1, 5 bits bits per sample - 1,
+    # 36 bits total samples
+    packed = int.from_bytes(info[10:18], 'big')
+    sample_rate = packed >> 44
+    channels = ((packed >> 41) & 0x7) + 1
+    bits = ((packed >> 36) & 0x1F) + 1
+    frames = packed & 0xFFFFFFFFF
+    return AudioMetadata('flac', 'flac', sample_rate, channels, frames, file_size, bits)
+
+
+def _parse_mpeg_header(header):
+    word = struct.unpack('>I', header)[0]
+    if word >> 21 != 0x7FF:
+        return None
+    version = (word >> 19) & 0x3
+    layer = (word >> 17) & 0x3
+    bitrate_index = (word >> 12) & 0xF
+    rate_index = (word >> 10) & 0x3
+    if version == 1 or layer == 0 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    bitrate = _MPEG_BITRATES[(3 if version == 3 else 2, layer)][bitrate_index] * 1000
+    sample_rate = _MPEG_SAMPLE_RATES[version][rate_index]
+    padding = (word >> 9) & 0x1
+    channels = 1 if (word >> 6) & 0x3 == 3 else 2
+    if layer == 3:  # Layer I
+        samples_per_frame = 384
+        frame_length = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples_per_frame = 576 if layer == 1 and version != 3 else 1152
+        frame_length = samples_per_frame // 8 * bitrate // sample_rate + padding
+    return {
+        'version': version,
+        'layer': 4 - layer,
+        'bitrate': bitrate,
+        'sample_rate': sample_rate,
+        'channels': channels,
+        'samples_per_frame': samples_per_frame,
+        'frame_length': frame_length
+    }
+
+
+def _probe_mp3(stream, file_size, offset):
+    stream.seek(offset)
+    data = stream.read(MP3_SCAN_BYTES)
+
+    # A frame only counts if the next header follows where it ends, which
+    # rules out stray sync patterns in tag data
+    frame = None
+    position = data.find(b'\xff')
+    while 0 <= position <= len(data) - 4:
+        frame = _parse_mpeg_header(data[position:position + 4])
+        if frame:
+            following = position + frame['frame_length']
+            if following + 4 > len(data) or _parse_mpeg_header(data[following:following + 4]):
+                break
+        frame = None
+        position = data.find(b'\xff', position + 1)
+    if frame is None:
+        raise AudioFormatError("No MPEG audio frame found")
+
+    frame_data = data[position:position + frame['frame_length']]
+    frame_count = _xing_frame_count(frame_data, frame) or _vbri_frame_count(frame_data)
+    if frame_count:
+        frames = frame_count * frame['samples_per_frame']
+    else:
+        # Constant bitrate: duration follows from the payload size
+        audio_bytes = file_size - offset - position
+        stream.seek(max(0, file_size - 128))
+        if stream.read(3) == b'TAG':
+            audio_bytes -= 128
+        frames = int(audio_bytes * 8 / frame['bitrate'] * frame['sample_rate'])
+
+    return AudioMetadata(
+        'mp3', f"mp{frame['layer']}", frame['sample_rate'], frame['channels'], frames, file_size
+    )
+
+
+def _xing_frame_count(frame_data, frame):
+    if frame['version'] == 3:
+        side_info = 17 if frame['channels'] == 1 else 32
+    else:
+        side_info = 9 if frame['channels'] == 1 else 17
+    start = 4 + side_info
+    if frame_data[start:start + 4] not in (b'Xing', b'Info'):
+        return None
+    flags = struct.unpack('>I', frame_data[start + 4:start + 8])[0]
+    if not flags & 0x1:
+        return None
+    return struct.unpack('>I', frame_data[start + 8:start + 12])[0]
+
+
+def _vbri_frame_count(frame_data):
+    if frame_data[36:40] != b'VBRI':
+        return None
+    return struct.unpack('>I', frame_data[50:54])[0]
+
+
+def _iter_boxes(stream, start, end):
+    """Yield (type, payload_start, payload_end) for the MP4 boxes in [start, end)"""
+    position = start
+    while position + 8 <= end:
+        stream.seek(position)
+        size, box_type = struct.unpack('>I4s', stream.read(8))
+        header = 8
+        if size == 1:
+            size = struct.unpack('>Q', stream.read(8))[0]
+            header = 16
+        elif size == 0:
+            size = end - position
+        if size < header:
+            raise AudioFormatError(f"Corrupt MP4 box size for {box_type!r}")
+        yield box_type, position + header, min(position + size, end)
+        position += size
+
+
+def _find_box(stream, start, end, *path):
+    for box_type, payload_start, payload_end in _iter_boxes(stream, start, end):
+        if box_type == path[0]:
+            if len(path) == 1:
+                return payload_start, payload_end
+            found = _find_box(stream, payload_start, payload_end, *path[1:])
+            if found:
+                return found
+    return None
+
+
+def _probe_mp4(stream, file_size):
+    # moov may sit after mdat; box headers let us skip over the media data
+    moov = _find_box(stream, 0, file_size, b'moov')
+    if moov is None:
+        raise AudioFormatError("MP4 file has no moov box")
+    if moov[1] - moov[0] > MAX_MOOV_BYTES:
+        raise AudioFormatError("MP4 moov box is too large")
+    stream.seek(moov[0])
+    moov_stream = io.BytesIO(stream.read(moov[1] - moov[0]))
+    moov_size = moov[1] - moov[0]
+
+    for box_type, trak_start, trak_end in _iter_boxes(moov_stream, 0, moov_size):
+        if box_type != b'trak':
+            continue
+        mdia = _find_box(moov_stream, trak_start, trak_end, b'mdia')
+        if mdia is None:
+            continue
+        hdlr = _find_box(moov_stream, mdia[0], mdia[1], b'hdlr')
+        if hdlr is None:
+            raise AudioFormatError("MP4 track has no hdlr box")
+        moov_stream.seek(hdlr[0] + 8)
+        if moov_stream.read(4) != b'soun':
+            continue
+
+        mdhd = _find_box(moov_stream, mdia[0], mdia[1], b'mdhd')
+        if mdhd is None:
+            raise AudioFormatError("MP4 audio track has no mdhd box")
+        moov_stream.seek(mdhd[0])
+        version = moov_stream.read(4)[0]
+        if version == 1:
+            _, _, timescale, duration = struct.unpack('>QQIQ', moov_stream.read(28))
+        else:
+            _, _, timescale, duration = struct.unpack('>IIII', moov_stream.read(16))
+
+        stsd = _find_box(moov_stream, mdia[0], mdia[1], b'minf', b'stbl', b'stsd')
+        if stsd is None:
+            raise AudioFormatError("MP4 audio track has no stsd box")
+        # Full box header and entry count, then the first sample entry: size,
+        # codec, reserved, data reference index, version, revision, vendor,
+        # channel count, sample size, compression id, packet size and the
+        # 16.16 fixed-point sample rate
+        moov_stream.seek(stsd[0] + 8)
+        entry = moov_stream.read(36)
+        codec = entry[4:8].decode('latin-1').strip()
+        channels, bits = struct.unpack('>HH', entry[24:28])
+        sample_rate = struct.unpack('>I', entry[32:36])[0] >> 16 or timescale
+        frames = int(duration * sample_rate / timescale) if timescale else 0
+        return AudioMetadata('mp4', codec, sample_rate, channels, frames, file_size, bits)
+
+    raise AudioFormatError("MP4 file has no audio track")
@@ -1,20 +1,26 @@
 import numpy as np
-from pydub import AudioSegment
-from scipy import signal
-import soundfile as sf
-import io
 import os
-import librosa
-import noisereduce as nr
-from scipy.fftpack import fft, ifft
+import soundfile as sf
 import logging
 import time
-import signal as sys_signal
-from functools import wraps
-import psutil
 import multiprocessing
-from concurrent.futures import ThreadPoolExecutor
+import itertools
 from .exceptions import *
+from .cancellation import CancellationToken, INTERRUPTIONS
+from .decoder import StreamingDecoder
+from .chunk_engine import ChunkEngine
+from .parallel import ParallelChunkEnhancer
+from .frontend import FrontEnd
+from .noise_classifier import NoiseClassifier
+from .probe import probe_audio
+from .vad import VoiceActivityDetector, SilenceSplicer, TimeMap
+from .noise_profile import NoiseProfileAccumulator
+from .cache import content_digest, content_key
+from .checkpoint import ChunkCheckpoint
+from .memory import default_governor
+from .dtypes import resolve_dtype
+from .profiling import JobProfiler, profile_store
+from .encoder import StreamingEncoder, OUTPUT_FORMATS, DEFAULT_OUTPUT_FORMAT, STREAM_FORMAT, output_extension
 
 # Configure logging with additional metrics
 logging.basicConfig(
@@ -27,55 +33,106 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def timeout_handler(signum, frame):
-    raise AudioProcessingTimeout("Audio processing operation timed out")
-
-def with_timeout(seconds=300):
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            sys_signal.signal(sys_signal.SIGALRM, timeout_handler)
-            sys_signal.alarm(seconds)
-            try:
-                result = func(*args, **kwargs)
-                sys_signal.alarm(0)
-                return result
-            except AudioProcessingTimeout:
-                logger.error(f"Operation timed out after {seconds} seconds")
-                raise
-            finally:
-                sys_signal.alarm(0)
-        return wrapper
-    return decorator
-
-def log_memory_usage():
-    process = psutil.Process(os.getpid())
-    mem_info = process.memory_info()
-    logger.info(f"Memory usage: {mem_info.rss / 1024 / 1024:.2f} MB")
-
-def calculate_snr(signal, noise):
-    """Calculate Signal-to-Noise Ratio in dB"""
-    signal_power = np.mean(signal ** 2)
-    noise_power = np.mean(noise ** 2)
+def snr_from_power(signal_power, noise_power):
+    """Signal-to-Noise Ratio in dB of two mean powers; inf without noise, -inf for silence"""
     if noise_power == 0:
         return float('inf')
+    if signal_power == 0:
+        return float('-inf')
     return 10 * np.log10(signal_power / noise_power)
 
+def calculate_snr(signal, noise):
+    """Calculate Signal-to-Noise Ratio in dB"""
+    return snr_from_power(np.mean(signal ** 2), np.mean(noise ** 2))
+
 class AudioProcessor:
     SUPPORTED_FORMATS = {'wav', 'mp3', 'flac', 'mp4'}
     TARGET_SAMPLE_RATE = 16000
     TARGET_DB = -20
     MIN_SAMPLE_RATE = 8000
     MAX_CHANNELS = 2
-    CHUNK_SIZE = 50 * 1024 * 1024  # 50MB chunks
+    MAX_DURATION = 4 * 60 * 60  # 4 hours
+    CACHE_VERSION = 3  # bump when enhancement output changes
     MAX_RETRIES = 3
+    RETRY_DELAY = 1.0
+    DEFAULT_TIMEOUT = 300  # seconds per process_audio call
+    CHECKPOINT_MAX_AGE = 7 * 24 * 60 * 60  # checkpoints of jobs never resumed
+    
+    # Enhancement tiers, cheapest first, with the SNR gain each is expected
+    # to deliver and the noise types it is not good enough for
+    TIERS = ('bypass', 'fast', 'full')
+    TIER_GAIN_DB = {'bypass': 0.0, 'fast': 6.0, 'full': 12.0}
+    TIER_UNSUITABLE = {'bypass': {'hum', 'babble', 'broadband'}, 'fast': {'babble'}, 'full': set()}
+    TARGET_SNR_DB = 25.0
+    # Wall seconds per audio second of the full tier; replaced by the first
+    # measured full run, then refined by every later one
+    full_tier_rate = 0.01
+    full_tier_runs = 0
     
-    def __init__(self, file_path):
+    def __init__(self, file_path, workers=1, target_sample_rate=TARGET_SAMPLE_RATE, channel_mode='mix', cache=None,
+                 vad=False, compact=False, tier='full', cancel_token=None, checkpoint_dir=None,
+                 memory_governor=None, dtype=None, job_id=None, output_format=DEFAULT_OUTPUT_FORMAT):
+        """
+        target_sample_rate is the rate enhancement runs at (None keeps the
+        source rate); channel_mode is 'mix' to downmix to mono, 'keep' to
+        keep every channel, or a channel index to select one channel.
+        cache is an optional EnhancedAudioCache shared between jobs.
+        With vad, only detected speech (plus padding) is enhanced and the
+        silence between is written as zeros, or left out entirely with
+        compact; time_map then maps output time back to the recording.
+        tier is one of TIERS or 'auto' to pick the cheapest tier expected to
+        reach TARGET_SNR_DB for the file's SNR and noise type.
+        cancel_token is a CancellationToken for this job (by default one with
+        a DEFAULT_TIMEOUT deadline); process_audio starts its deadline once
+        the job is admitted by the memory governor, checks it between blocks
+        and enhancement stages, and checks for cancellation while queued.
+        With checkpoint_dir, every enhanced chunk is checkpointed there and a
+        rerun of the same job after a crash resumes after the last
+        checkpointed chunk; checkpoints are removed when the job completes.
+        memory_governor (by default the process-wide one) sizes the job's
+        blocks and holds it back while it would exceed the memory budget.
+        dtype is the processing dtype of every stage after decoding (see
+        dtypes), float32 by default.
+        Every process_audio call is profiled stage by stage (see profiling);
+        its record, stored under job_id (by default the file path), is kept
+        in profile.
+        output_format is the encoding of the enhanced output file (see
+        encoder): 'pcm16' for 16-bit WAV or 'flac'. It does not apply to an
+        output stream, which is always STREAM_FORMAT.
+        """
+        if tier != 'auto' and tier not in self.TIERS:
+            raise ValueError(f"Unknown enhancement tier: {tier}")
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format: {output_format}")
         self.file_path = file_path
+        self.cache = cache
+        self.checkpoint_dir = checkpoint_dir
+        self.memory_governor = memory_governor or default_governor
+        self.vad = vad
+        self.compact = compact
+        self.speech_index = None
+        self.noise_profile = None
+        self.time_map = None
+        self.tier = tier
+        self.cancel_token = cancel_token or CancellationToken(timeout=self.DEFAULT_TIMEOUT)
+        self.enhancement_report = None
+        self.noise_type = None
+        self.workers = workers or multiprocessing.cpu_count()
+        self.target_sample_rate = target_sample_rate
+        self.channel_mode = channel_mode
+        self.dtype = resolve_dtype(dtype)
+        self.job_id = job_id
+        self.output_format = output_format
+        self.output_bytes = None
+        self._content_digest = None
+        self.profiler = None
+        self.profile = None
         self._validate_file()
         self.progress = 0
-        self.total_chunks = 0
         self.processed_chunks = 0
+        self.processed_seconds = 0.0
+        self.expected_seconds = 0.0
+        self.start_time = None
         
     def _validate_file(self):
         if not os.path.exists(self.file_path):
@@ -87,192 +144,642 @@ class AudioProcessor:
             logger.error(f"Unsupported format: {self.format}")
             raise AudioFormatError(f"Unsupported audio format: {self.format}")
             
-        # Check file size for chunked processing
-        self.file_size = os.path.getsize(self.file_path)
-        self.requires_chunking = self.file_size > 100 * 1024 * 1024  # 100MB
-        if self.requires_chunking:
-            self.total_chunks = (self.file_size + self.CHUNK_SIZE - 1) // self.CHUNK_SIZE
-            logger.info(f"File size: {self.file_size / 1024 / 1024:.2f}MB, will be processed in {self.total_chunks} chunks")
-    
-    def _validate_audio_parameters(self, audio):
-        if audio.frame_rate < self.MIN_SAMPLE_RATE:
-            raise AudioQualityError(f"Sample rate too low: {audio.frame_rate}Hz (minimum: {self.MIN_SAMPLE_RATE}Hz)")
+        # Read the container headers only: bad or oversized uploads are
+        # rejected here, before anything is decoded
+        self.metadata = probe_audio(self.file_path, self.format)
+        self._validate_audio_parameters(self.metadata.sample_rate, self.metadata.channels)
+        if self.metadata.duration > self.MAX_DURATION:
+            raise AudioQualityError(
+                f"Audio too long: {self.metadata.duration:.0f}s (maximum: {self.MAX_DURATION}s)"
+            )
         
-        if audio.channels > self.MAX_CHANNELS:
-            raise AudioQualityError(f"Too many channels: {audio.channels} (maximum: {self.MAX_CHANNELS})")
+        # Size the run from the decoded working set rather than the
+        # compressed size; process_audio re-plans once the job is admitted
+        self.file_size = self.metadata.file_size
+        self.decoded_size = self.metadata.decoded_bytes(StreamingDecoder.SAMPLE_WIDTH)
+        block_frames, self.working_set = self.memory_governor.plan(
+            self.metadata, *self._output_format(), self.workers, dtype=self.dtype
+        )
+        self._set_block_frames(block_frames)
+        logger.info(
+            f"Probed {self.metadata}: {self.decoded_size / 1024 / 1024:.2f}MB decoded, "
+            f"{self.working_set / 1024 / 1024:.2f}MB working set, {self.total_chunks} chunk(s)"
+        )
     
-    def _process_chunk(self, chunk_data, sample_rate):
-        """Process a single chunk of audio data"""
+    def _output_format(self):
+        """Sample rate and channel count enhancement runs at"""
+        channels = self.metadata.channels if self.channel_mode == 'keep' else 1
+        return self.target_sample_rate or self.metadata.sample_rate, channels
+    
+    def _set_block_frames(self, block_frames):
+        self.block_frames = block_frames
+        self.total_chunks = max(1, -(-self.metadata.frames // block_frames))
+        self.requires_chunking = self.total_chunks > 1
+    
+    def _validate_audio_parameters(self, sample_rate, channels):
+        if sample_rate < self.MIN_SAMPLE_RATE:
+            raise AudioQualityError(f"Sample rate too low: {sample_rate}Hz (minimum: {self.MIN_SAMPLE_RATE}Hz)")
+        
+        if channels > self.MAX_CHANNELS:
+            raise AudioQualityError(f"Too many channels: {channels} (maximum: {self.MAX_CHANNELS})")
+    
+    def _process_chunk(self, chunk_data, sample_rate, engine=None, final=True):
+        """
+        Process a single (frames, channels) block of audio data in the processing dtype
+        
+        All channels are enhanced together as one (channels, frames) array.
+        engine is the ChunkEngine of a chunked run; the returned block then
+        lags the input by the engine's look-ahead and is completed by the
+        final=True call.
+        """
         try:
-            # Convert chunk to numpy array
-            samples = np.array(chunk_data.get_array_of_samples(), dtype=np.float32)
-            samples = samples / (1 << (8 * chunk_data.sample_width - 1))
-            
-            # Process channels in parallel
-            channels = self.split_channels(samples)
-            with ThreadPoolExecutor(max_workers=min(len(channels), multiprocessing.cpu_count())) as executor:
-                enhanced_channels = list(executor.map(
-                    lambda x: self.enhance_audio(x, sample_rate),
-                    channels
-                ))
+            enhanced = self.enhance_audio(chunk_data.T, sample_rate, engine=engine, final=final)
             
-            # Combine channels if necessary
-            if len(enhanced_channels) > 1:
-                enhanced_chunk = np.stack(enhanced_channels, axis=1)
-            else:
-                enhanced_chunk = enhanced_channels[0]
-                
-            return enhanced_chunk
+            # Back to (frames, channels), or a flat array for mono
+            return enhanced[0] if enhanced.shape[0] == 1 else enhanced.T
             
+        except INTERRUPTIONS:
+            raise
         except Exception as e:
             logger.error(f"Error processing chunk: {str(e)}")
             raise AudioEnhancementError(f"Failed to process chunk: {str(e)}")
-        finally:
-            # Clear memory
-            del samples
-            del channels
-            log_memory_usage()
             
-    @with_timeout(300)
-    def process_audio(self):
-        """Enhanced processing pipeline with chunked processing and memory management"""
+    def process_audio(self, output_path=None, stream=None):
+        """
+        Enhanced processing pipeline with chunked processing and memory management
+        
+        Enhanced chunks are written to output_path (by default a WAV file next
+        to the input) as they finish, so the full output is never held in
+        memory. Returns the output path, its sample rate and the noise
+        profiles. Raises AudioProcessingCancelled or AudioProcessingTimeout
+        when the cancel token fires.
+        
+        With stream (an EncodedStream), chunks are encoded into the stream
+        instead, as a streaming 16-bit WAV, for a reader such as an upload to
+        consume while the job runs. A file is then written only when there is
+        a cache to store it in; otherwise no file is written and the path
+        returned is None. The stream ends once the output is complete, with
+        time_map already final, or fails with the error that stopped the job.
+        """
+        start_time = time.time()
+        self.profiler = JobProfiler(self.job_id if self.job_id is not None else self.file_path)
+        outcome = 'failed'
+        try:
+            with self.profiler.stage('other'):
+                try:
+                    result = self._process_audio(output_path, stream)
+                except BaseException as e:
+                    if stream is not None:
+                        stream.fail(e)
+                    raise
+            outcome = 'cached' if (self.enhancement_report or {}).get('cached') else 'completed'
+            return result
+        except AudioProcessingCancelled:
+            outcome = 'cancelled'
+            raise
+        except AudioProcessingTimeout:
+            outcome = 'timeout'
+            raise
+        finally:
+            self._record_profile(outcome, time.time() - start_time)
+    
+    def _process_audio(self, output_path, stream):
         start_time = time.time()
+        if stream is None or self.cache is not None:
+            output_path = output_path or self.default_output_path()
+        else:
+            output_path = None
         logger.info(f"Starting audio processing for file: {self.file_path}")
-        log_memory_usage()
         
+        cache_key = None
+        if self.cache is not None or self.checkpoint_dir is not None:
+            with self.profiler.stage('cache lookup'):
+                cache_key = content_key(self.file_path, self.cache_params(), digest=self.content_digest())
+        if self.cache is not None:
+            with self.profiler.stage('cache lookup'):
+                cached = self.cache.get(cache_key, output_path)
+            if cached is not None:
+                logger.info(f"Enhanced audio for {self.file_path} served from cache")
+                self.time_map = TimeMap.from_list(cached['time_map']) if cached.get('time_map') else None
+                self.enhancement_report = dict(cached.get('enhancement') or {}, cached=True)
+                if stream is not None:
+                    with self.profiler.stage('save'):
+                        self._stream_file(output_path, stream)
+                return output_path, cached['sample_rate'], cached['noise_profiles']
+        
+        # Wait for room in the memory budget, then size blocks to what was granted
+        with self.profiler.stage('memory admission'):
+            reservation = self.memory_governor.acquire(
+                self.file_path, self.metadata, *self._output_format(), self.workers,
+                cancel_token=self.cancel_token, dtype=self.dtype
+            )
+        # The deadline covers the job's own work, not its wait for admission
+        self.cancel_token.start()
+        self._set_block_frames(reservation.block_frames)
+        self.working_set = reservation.working_set
+        
+        checkpoint = None
         try:
-            audio = AudioSegment.from_file(self.file_path)
-            self._validate_audio_parameters(audio)
-            sample_rate = audio.frame_rate
+            decoder = StreamingDecoder(self.file_path, self.format, metadata=self.metadata)
             
-            if self.requires_chunking:
-                enhanced_chunks = []
-                chunk_duration = self.CHUNK_SIZE * 1000 // (audio.frame_rate * audio.sample_width * audio.channels)  # ms
-                
-                for i in range(0, len(audio), chunk_duration):
-                    chunk = audio[i:i + chunk_duration]
-                    retry_count = 0
-                    
-                    while retry_count < self.MAX_RETRIES:
-                        try:
-                            enhanced_chunk = self._process_chunk(chunk, sample_rate)
-                            enhanced_chunks.append(enhanced_chunk)
-                            self.processed_chunks += 1
-                            self.progress = (self.processed_chunks / self.total_chunks) * 100
-                            logger.info(f"Processed chunk {self.processed_chunks}/{self.total_chunks} ({self.progress:.1f}%)")
-                            break
-                        except Exception as e:
-                            retry_count += 1
-                            logger.warning(f"Retry {retry_count} for chunk {self.processed_chunks + 1}: {str(e)}")
-                            if retry_count == self.MAX_RETRIES:
-                                raise
-                            time.sleep(1)
-                    
-                    # Clear memory after each chunk
-                    del chunk
-                    log_memory_usage()
-                
-                enhanced_audio = np.concatenate(enhanced_chunks)
-                del enhanced_chunks
-                
+            # Downmix and resample before anything else so every later stage
+            # runs at the (usually much smaller) processing format
+            frontend = FrontEnd(
+                decoder.sample_rate, decoder.channels, self.target_sample_rate, self.channel_mode, self.dtype
+            )
+            sample_rate = frontend.output_sample_rate
+            
+            block_frames = self.block_frames
+            self.processed_chunks = 0
+            self.processed_seconds = 0.0
+            self.expected_seconds = self.metadata.duration
+            self.start_time = start_time
+            
+            # One scan of the file finds the speech regions and builds the
+            # noise profile every chunk shares
+            with self.profiler.stage('pre-pass'):
+                self._scan(decoder, frontend)
+            splicer = self._create_splicer(sample_rate) if self.vad else None
+            
+            # Each stage of the block pipeline is charged only for its own
+            # work, not for pulling blocks from the stage before it
+            blocks = self.profiler.profiled(
+                self._checked(decoder.blocks(block_frames), 'decoding'), 'decode'
+            )
+            blocks = self.profiler.profiled(frontend.stream(blocks), 'front end')
+            if splicer is not None:
+                blocks = self.profiler.profiled(splicer.compact(blocks), 'silence splicing')
+            first_block = next(blocks, None)
+            if first_block is None:
+                raise AudioQualityError(f"No audio samples decoded from {self.file_path}")
+            
+            tier = self.choose_tier(sample_rate)
+            blocks = itertools.chain([first_block], blocks)
+            channels = first_block.shape[1]
+            enhancement_start = time.time()
+            
+            if tier == 'bypass':
+                engine = None
+                enhanced_stream = self._passthrough(blocks, sample_rate)
             else:
-                enhanced_audio = self._process_chunk(audio, sample_rate)
+                # The engine carries the noise estimate, filter state and
+                # overlap across chunks, so chunk size does not affect the output
+                engine = self.create_chunk_engine(first_block.T, sample_rate, self.noise_profile, tier)
+                parallel = self.workers > 1 and self.total_chunks > 1
+                checkpoint = self._open_checkpoint(cache_key, sample_rate, channels, tier, parallel)
+                resumed = checkpoint.load() if checkpoint is not None else 0
+                
+                # Blocks of checkpointed chunks are still decoded, for the
+                # resampler and splicer state, but not enhanced again
+                if parallel:
+                    enhanced_stream = self._enhance_parallel(blocks, engine, resumed)
+                else:
+                    if resumed:
+                        engine.restore(checkpoint.state())
+                    enhanced_stream = self._enhance_sequential(
+                        itertools.islice(blocks, resumed, None), sample_rate, engine
+                    )
+                if checkpoint is not None:
+                    enhanced_stream = self._checkpointed(enhanced_stream, engine, checkpoint, stateful=not parallel)
+                enhanced_stream = self.profiler.profiled(enhanced_stream, 'enhancement')
+            if splicer is not None and not self.compact:
+                enhanced_stream = self.profiler.profiled(splicer.expand(enhanced_stream, channels), 'silence splicing')
+            
+            frames_written = self._write_stream(enhanced_stream, output_path, sample_rate, channels, stream)
+            if not frames_written:
+                raise AudioQualityError(f"No audio samples decoded from {self.file_path}")
+            self.time_map = splicer.time_map if splicer is not None and self.compact else None
+            if stream is not None:
+                # The reader can finish while noise is classified
+                stream.close()
+            self._record_enhancement(tier, time.time() - enhancement_start)
+            
+            # Classify background noise from the features the enhancement
+            # pass already extracted, without another read of the audio
+            with self.profiler.stage('classification'):
+                if engine is not None:
+                    noise_profiles = self.classify_background_noise(
+                        engine, sample_rate, splicer.time_map if splicer is not None else None
+                    )
+                else:
+                    noise_profiles = self._whole_file_noise_profile()
             
-            # Classify background noise
-            noise_type = self.classify_background_noise(enhanced_audio, sample_rate)
+            if self.cache is not None:
+                with self.profiler.stage('cache store'):
+                    self.cache.put(cache_key, output_path, {
+                        'sample_rate': sample_rate,
+                        'noise_profiles': noise_profiles,
+                        'time_map': self.time_map.to_list() if self.time_map else None,
+                        'enhancement': self.enhancement_report
+                    })
+            
+            if checkpoint is not None:
+                checkpoint.clear()
             
             total_time = time.time() - start_time
             logger.info(f"Total processing time: {total_time:.2f} seconds")
-            log_memory_usage()
             
-            return enhanced_audio, sample_rate, noise_type
+            return output_path, sample_rate, noise_profiles
             
+        except INTERRUPTIONS as e:
+            logger.warning(f"Processing of {self.file_path} stopped: {str(e)}")
+            self._remove_partial_output(output_path)
+            # A job that ran out of time can pick up where it stopped; a
+            # cancelled one will not be back
+            if checkpoint is not None and isinstance(e, AudioProcessingCancelled):
+                checkpoint.clear()
+            raise
         except Exception as e:
             logger.error(f"Error processing audio: {str(e)}")
+            self._remove_partial_output(output_path)
             if isinstance(e, AudioProcessingError):
                 raise
             raise AudioEnhancementError(f"Failed to process audio: {str(e)}")
+        finally:
+            self.memory_governor.release(reservation)
+    
+    def _record_profile(self, outcome, elapsed):
+        """Store the job's profile record and log its summary"""
+        self.profile = self.profiler.record(
+            file=self.file_path,
+            outcome=outcome,
+            tier=(self.enhancement_report or {}).get('tier'),
+            workers=self.workers,
+            dtype=self.dtype.name,
+            output_format=self.output_format,
+            output_bytes=self.output_bytes,
+            audio_seconds=self.metadata.duration,
+            block_frames=self.block_frames,
+            elapsed_seconds=round(elapsed, 6)
+        )
+        profile_store.add(self.profile)
+        slowest = max(self.profile['stages'], key=lambda stage: stage['wall_seconds'], default=None)
+        logger.info(
+            f"Profile of {self.profiler.job}: {outcome} in {elapsed:.2f}s, "
+            f"{self.profile['cpu_seconds']:.2f}s CPU, "
+            f"peak RSS +{self.profile['peak_rss_growth_bytes'] / 1024 / 1024:.1f}MB"
+            + (f", slowest stage {slowest['stage']} ({slowest['wall_seconds']:.2f}s)" if slowest else "")
+        )
     
-    def enhance_audio(self, audio_data, sample_rate):
-        """Optimized audio enhancement with adaptive thresholds"""
+    def content_digest(self):
+        """sha256 of the file contents (see cache.content_digest), read once per processor"""
+        if self._content_digest is None:
+            self._content_digest = content_digest(self.file_path)
+        return self._content_digest
+    
+    def cache_params(self):
+        """Parameters that, together with the file contents, determine the enhanced output"""
+        return {
+            'version': self.CACHE_VERSION,
+            'target_sample_rate': self.target_sample_rate,
+            'channel_mode': self.channel_mode,
+            'dtype': self.dtype.name,
+            'output_format': self.output_format,
+            'vad': self.vad,
+            'compact': self.compact,
+            'tier': self.tier
+        }
+    
+    def choose_tier(self, sample_rate):
+        """Resolve the requested tier; 'auto' goes by the file's SNR and noise type"""
+        self.noise_type = None
+        if self.noise_profile is not None:
+            power = ChunkEngine.emphasized_noise_power(self.noise_profile, sample_rate)
+            self.noise_type = NoiseClassifier(sample_rate).classify_spectrum(power)
+        if self.tier != 'auto':
+            return self.tier
+        if self.noise_profile is None:
+            return 'full'
+        
+        snr = self.noise_profile.snr_db
+        label, _ = self.noise_type
+        for tier in self.TIERS:
+            if snr + self.TIER_GAIN_DB[tier] >= self.TARGET_SNR_DB and label not in self.TIER_UNSUITABLE[tier]:
+                break
+        logger.info(f"Enhancement tier: {tier} (SNR {snr:.1f} dB, noise: {label})")
+        return tier
+    
+    def _record_enhancement(self, tier, seconds):
+        """Record the tier used and the time it saved against the full tier"""
+        estimated_full = AudioProcessor.full_tier_rate * self.processed_seconds
+        if tier == 'full':
+            if self.processed_seconds:
+                rate = seconds / self.processed_seconds
+                weight = 0.2 if AudioProcessor.full_tier_runs else 1.0
+                AudioProcessor.full_tier_rate += weight * (rate - AudioProcessor.full_tier_rate)
+                AudioProcessor.full_tier_runs += 1
+            time_saved = 0.0
+        else:
+            time_saved = max(0.0, estimated_full - seconds)
+        
+        self.enhancement_report = {
+            'requested_tier': self.tier,
+            'tier': tier,
+            'snr_db': float(self.noise_profile.snr_db) if self.noise_profile is not None else None,
+            'noise_type': self.noise_type[0] if self.noise_type else None,
+            'enhancement_seconds': seconds,
+            'time_saved_seconds': time_saved
+        }
+        logger.info(f"Enhancement report: {self.enhancement_report}")
+    
+    def _whole_file_noise_profile(self):
+        """One noise profile row for the whole file from the pre-pass classification"""
+        if not self.noise_type or not self.metadata.duration:
+            return []
+        label, confidence = self.noise_type
+        return [{'type': label, 'confidence': confidence, 'start_time': 0.0, 'end_time': self.metadata.duration}]
+    
+    def _scan(self, decoder, frontend):
+        """Pre-pass over the file: speech index and file-level noise profile"""
+        start_time = time.time()
+        detector = VoiceActivityDetector(decoder.sample_rate)
+        accumulator = NoiseProfileAccumulator(decoder.sample_rate, detector.frame_length, frontend.output_channels)
+        decoded = self.profiler.profiled(self._checked(decoder.blocks(self.block_frames), 'pre-pass'), 'decode')
+        blocks = (frontend.convert_channels(block) for block in decoded)
+        self.speech_index = detector.detect(blocks, noise=accumulator)
+        self.noise_profile = accumulator.profile(self.speech_index.threshold_db)
+        logger.info(f"Pre-pass completed in {time.time() - start_time:.2f} seconds")
+    
+    def _open_checkpoint(self, key, sample_rate, channels, tier, parallel):
+        """ChunkCheckpoint of this job, or None without a checkpoint_dir"""
+        if self.checkpoint_dir is None:
+            return None
+        ChunkCheckpoint.remove_stale(self.checkpoint_dir, self.CHECKPOINT_MAX_AGE)
+        return ChunkCheckpoint(self.checkpoint_dir, key, {
+            'sample_rate': sample_rate,
+            'channels': channels,
+            'tier': tier,
+            'block_frames': self.block_frames,
+            'parallel': parallel,
+            'dtype': self.dtype.name
+        })
+    
+    def _checkpointed(self, enhanced_stream, engine, checkpoint, stateful):
+        """Replay the chunks checkpointed by an earlier run, then checkpoint and pass on new ones"""
+        completed = checkpoint.completed
+        live = self._checkpoint_chunks(enhanced_stream, engine, checkpoint, stateful)
+        if not completed:
+            yield from live
+            return
+        
+        # Pulling the first new chunk reads the input blocks of the
+        # checkpointed ones, which the splicer must see before their output
+        # can be expanded
+        first = list(itertools.islice(live, 1))
+        engine.features[:0] = [
+            features for features in map(checkpoint.features, range(completed)) if len(features)
+        ]
+        for index in range(completed):
+            with self.profiler.stage('checkpoint'):
+                enhanced = checkpoint.chunk(index)
+            self._update_progress(len(enhanced) / engine.sample_rate)
+            yield enhanced
+        yield from first
+        yield from live
+    
+    def _checkpoint_chunks(self, enhanced_stream, engine, checkpoint, stateful):
+        """Checkpoint each chunk, with its features and (if stateful) the engine state after it"""
+        known = len(engine.features)
+        for enhanced_chunk in enhanced_stream:
+            new_features = engine.features[known:]
+            features = (
+                np.concatenate(new_features) if new_features
+                else np.zeros((0, len(engine.spectral.FEATURE_NAMES)))
+            )
+            with self.profiler.stage('checkpoint', len(enhanced_chunk)):
+                checkpoint.save(enhanced_chunk, features, engine.state() if stateful else None)
+            yield enhanced_chunk
+            # Counted after the yield, so features the caller inserts meanwhile are skipped
+            known = len(engine.features)
+    
+    def _checked(self, blocks, stage):
+        """Pass blocks through, checking the cancel token before each"""
+        for block in blocks:
+            self.cancel_token.check(stage)
+            yield block
+    
+    def _create_splicer(self, sample_rate):
+        """SilenceSplicer for the scanned speech regions, or None if nothing would be cut"""
+        if not len(self.speech_index.regions):
+            logger.warning(f"No speech detected in {self.file_path}, enhancing the whole file")
+            return None
+        self.expected_seconds = self.speech_index.speech_seconds
+        return SilenceSplicer(self.speech_index, sample_rate)
+    
+    @property
+    def output_extension(self):
+        return output_extension(self.output_format)
+    
+    @property
+    def output_layout(self):
+        """Sample rate and channel count of the enhanced output"""
+        return self._output_format()
+    
+    def default_output_path(self):
+        return f"{os.path.splitext(self.file_path)[0]}_enhanced{self.output_extension}"
+    
+    def _write_stream(self, enhanced_stream, output_path, sample_rate, channels, stream=None):
+        """
+        Encode enhanced chunks to output_path and/or stream as they are
+        produced; returns the frame count
+        """
+        encoders = []
         try:
-            start_time = time.time()
-            
-            # Calculate initial SNR
-            noise_sample = audio_data[:int(sample_rate * 0.1)]  # First 100ms
+            if output_path is not None:
+                encoders.append(StreamingEncoder(output_path, sample_rate, channels, self.output_format))
+            if stream is not None:
+                encoders.append(StreamingEncoder(stream, sample_rate, channels, STREAM_FORMAT))
+            for enhanced_chunk in enhanced_stream:
+                if len(enhanced_chunk):
+                    with self.profiler.stage('save', len(enhanced_chunk)):
+                        for encoder in encoders:
+                            encoder.write(enhanced_chunk)
+        finally:
+            for encoder in encoders:
+                encoder.close()
+        # What leaves the job: the stream when there is one
+        encoder = encoders[-1]
+        self.output_bytes = encoder.bytes_written
+        logger.info(
+            f"Wrote {encoder.frames} enhanced frames to {output_path if stream is None else 'the output stream'} "
+            f"({encoder.output_format}, {self.output_bytes / 1024 / 1024:.2f}MB)"
+        )
+        return encoder.frames
+    
+    def _stream_file(self, path, stream):
+        """Encode an enhanced output file into stream and end it"""
+        info = sf.info(path)
+        with StreamingEncoder(stream, info.samplerate, info.channels, STREAM_FORMAT) as encoder:
+            for block in sf.blocks(path, blocksize=self.block_frames, dtype='float32', always_2d=info.channels > 1):
+                encoder.write(block)
+        self.output_bytes = encoder.bytes_written
+        stream.close()
+    
+    def _remove_partial_output(self, output_path):
+        try:
+            if output_path is not None and os.path.exists(output_path):
+                os.remove(output_path)
+        except OSError as e:
+            logger.error(f"Error removing partial output {output_path}: {str(e)}")
+    
+    def _passthrough(self, blocks, sample_rate):
+        """Bypass tier: hand converted blocks on unchanged"""
+        for chunk in blocks:
+            self._update_progress(len(chunk) / sample_rate)
+            yield chunk[:, 0] if chunk.shape[1] == 1 else chunk
+    
+    def _enhance_sequential(self, blocks, sample_rate, engine):
+        """Enhance blocks one after another in this process, carrying engine state"""
+        for chunk in blocks:
+            retry_count = 0
+            while retry_count < self.MAX_RETRIES:
+                try:
+                    enhanced_chunk = self._process_chunk(chunk, sample_rate, engine=engine, final=False)
+                    self._update_progress(len(chunk) / sample_rate)
+                    yield enhanced_chunk
+                    break
+                except INTERRUPTIONS:
+                    raise
+                except Exception as e:
+                    retry_count += 1
+                    logger.warning(f"Retry {retry_count} for chunk {self.processed_chunks + 1}: {str(e)}")
+                    if retry_count == self.MAX_RETRIES:
+                        raise
+                    self._wait(self.RETRY_DELAY)
+        
+        # Drain the look-ahead still held by the engine
+        empty = np.zeros((0, engine.channels), dtype=engine.dtype)
+        yield self._process_chunk(empty, sample_rate, engine=engine, final=True)
+    
+    def _wait(self, seconds):
+        """Sleep up to seconds, waking early (and raising) if the job is cancelled"""
+        remaining = self.cancel_token.remaining()
+        self.cancel_token.wait(seconds if remaining is None else min(seconds, remaining))
+        self.cancel_token.check('retry')
+    
+    def _enhance_parallel(self, blocks, engine, start_index=0):
+        """Enhance blocks (from chunk start_index on) across a process pool, yielding results in chunk order"""
+        logger.info(f"Enhancing {self.total_chunks - start_index} chunks with {self.workers} worker processes")
+        enhancer = ParallelChunkEnhancer(engine, self.workers)
+        for enhanced_chunk in enhancer.run(blocks, start_index):
+            self._update_progress(len(enhanced_chunk) / engine.sample_rate)
+            yield enhanced_chunk[:, 0] if enhanced_chunk.shape[1] == 1 else enhanced_chunk
+    
+    def _update_progress(self, chunk_seconds):
+        self.processed_chunks += 1
+        self.processed_seconds += chunk_seconds
+        self.progress = min(100.0, (self.processed_chunks / self.total_chunks) * 100)
+        logger.info(
+            f"Processed chunk {self.processed_chunks}/{self.total_chunks} ({self.progress:.1f}%), "
+            f"ETA {self.estimated_time_remaining():.1f}s"
+        )
+    
+    def estimated_time_remaining(self):
+        """Seconds left in process_audio, from the throughput so far and the probed duration"""
+        elapsed = time.time() - self.start_time
+        if not self.processed_seconds:
+            return float('nan')
+        remaining = max(0.0, self.expected_seconds - self.processed_seconds)
+        return remaining * elapsed / self.processed_seconds
+    
+    def create_chunk_engine(self, audio_data, sample_rate, noise_profile=None, tier='full'):
+        """
+        Create a ChunkEngine for a (channels, samples) stream
+        
+        With a file-level noise_profile the SNR, and with it the
+        noise-reduction strength, comes from the whole recording and the
+        profile is shared by every chunk. Without one, the first 100ms of
+        audio_data stand in for the noise.
+        """
+        audio_data = np.atleast_2d(audio_data)
+        
+        if noise_profile is not None:
+            initial_snr = noise_profile.snr_db
+            noise_power = noise_profile.noise_power
+        else:
+            noise_sample = audio_data[:, :int(sample_rate * 0.1)]  # First 100ms
             initial_snr = calculate_snr(audio_data, noise_sample)
-            logger.info(f"Initial SNR: {initial_snr:.2f} dB")
-            
-            # Adaptive noise reduction threshold based on SNR
-            noise_reduction_strength = min(0.75, max(0.3, 1.0 - initial_snr / 30))
-            
-            # Apply pre-emphasis filter
-            pre_emphasis = 0.97
-            emphasized_audio = np.append(
-                audio_data[0],
-                audio_data[1:] - pre_emphasis * audio_data[:-1]
-            )
-            
-            # Optimized FFT-based processing
-            fft_size = 2048  # Optimal size for performance
-            hop_length = fft_size // 4
-            
-            # Apply adaptive noise reduction
-            cleaned_audio = self.adaptive_noise_reduction(
-                emphasized_audio,
-                sample_rate,
-                noise_reduction_strength
-            )
-            
-            # Apply echo cancellation
-            echo_cancelled = self.echo_cancellation(cleaned_audio, sample_rate)
+            noise_power = np.mean(noise_sample ** 2)
+        logger.info(f"Initial SNR: {initial_snr:.2f} dB")
+        
+        # Adaptive noise reduction threshold based on SNR
+        noise_reduction_strength = min(0.75, max(0.3, 1.0 - initial_snr / 30))
+        
+        engine = ChunkEngine(
+            sample_rate, audio_data.shape[0], noise_reduction_strength, noise_profile, tier, self.cancel_token,
+            self.dtype, self.profiler
+        )
+        engine.initial_snr = initial_snr
+        engine.noise_power = noise_power
+        return engine
+    
+    def enhance_audio(self, audio_data, sample_rate, engine=None, final=True):
+        """
+        Optimized audio enhancement with adaptive thresholds
+        
+        audio_data is a (samples,) or (channels, samples) array and the
+        result has the same number of dimensions. Without an engine the whole
+        signal is enhanced in one pass. With an engine from
+        create_chunk_engine the call is one step of a chunked run and returns
+        only the output that is final so far.
+        """
+        try:
+            start_time = time.time()
+            single_channel = np.ndim(audio_data) == 1
+            audio_data = np.atleast_2d(audio_data)
+            if engine is None:
+                engine = self.create_chunk_engine(audio_data, sample_rate)
             
-            # Apply band-pass filter
-            nyquist = sample_rate // 2
-            low_cutoff = 80
-            high_cutoff = 8000
-            b, a = signal.butter(
-                N=4,
-                Wn=[low_cutoff/nyquist, high_cutoff/nyquist],
-                btype='band'
-            )
-            filtered_audio = signal.filtfilt(b, a, echo_cancelled)
+            filtered_audio = engine.process(audio_data, final=final)
+            if single_channel:
+                filtered_audio = filtered_audio[0]
             
             # Calculate final SNR
-            final_snr = calculate_snr(filtered_audio, noise_sample)
-            logger.info(f"Final SNR: {final_snr:.2f} dB (improvement: {final_snr - initial_snr:.2f} dB)")
+            if filtered_audio.shape[-1]:
+                output_power = np.mean(filtered_audio ** 2)
+                if output_power:
+                    final_snr = snr_from_power(output_power, engine.noise_power)
+                    logger.info(f"Final SNR: {final_snr:.2f} dB (improvement: {final_snr - engine.initial_snr:.2f} dB)")
+                else:
+                    logger.info("Final SNR: enhanced output is silent")
             
             processing_time = time.time() - start_time
             logger.info(f"Audio enhancement completed in {processing_time:.2f} seconds")
             return filtered_audio
             
+        except INTERRUPTIONS:
+            raise
         except Exception as e:
             logger.error(f"Error enhancing audio: {str(e)}")
             raise AudioEnhancementError(f"Failed to enhance audio: {str(e)}")
     
-    def adaptive_noise_reduction(self, audio_data, sample_rate, strength=0.75):
-        """Apply adaptive noise reduction with enhanced parameters"""
+    def classify_background_noise(self, engine, sample_rate, time_map=None):
+        """
+        Classify background noise per time segment from the engine's per-frame features
+        
+        Returns a list of {'type', 'confidence', 'start_time', 'end_time'}
+        dicts in stream order, ready to be stored as NoiseProfile rows. When
+        silence was spliced out, time_map maps the times to the recording.
+        """
         try:
-            start_time = time.time()
-            noise_clip = audio_data[:int(sample_rate)]
-            reduced_noise = nr.reduce_noise(
-                y=audio_data,
-                y_noise=noise_clip,
-                sr=sample_rate,
-                stationary=False,
-                prop_decrease=strength
-            )
-            logger.info(f"Noise reduction completed in {time.time() - start_time:.2f} seconds")
-            return reduced_noise
+            features = np.concatenate(engine.features) if engine.features else None
+            profiles = NoiseClassifier(sample_rate).classify(features)
+            if time_map is not None:
+                for profile in profiles:
+                    profile['start_time'] = time_map.to_original(profile['start_time'], side='right')
+                    profile['end_time'] = time_map.to_original(profile['end_time'], side='left')
+            return profiles
         except Exception as e:
-            logger.error(f"Error in noise reduction: {str(e)}")
-            raise AudioEnhancementError(f"Failed to reduce noise: {str(e)}")
+            logger.error(f"Error classifying background noise: {str(e)}")
+            raise AudioEnhancementError(f"Failed to classify background noise: {str(e)}")
     
     def save_enhanced_audio(self, audio_data, sample_rate, output_path):
-        """Save enhanced audio with error handling"""
+        """Save (frames,) or (frames, channels) enhanced audio in the output format, with error handling"""
         try:
             start_time = time.time()
-            sf.write(output_path, audio_data, sample_rate)
+            channels = 1 if np.ndim(audio_data) == 1 else audio_data.shape[1]
+            with StreamingEncoder(output_path, sample_rate, channels, self.output_format) as encoder:
+                encoder.write(audio_data)
             logger.info(f"Enhanced audio saved to {output_path} in {time.time() - start_time:.2f} seconds")
         except Exception as e:
             logger.error(f"Error saving enhanced audio: {str(e)}")
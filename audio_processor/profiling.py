@@ -0,0 +1,227 @@
+"""Per-stage profiling of processing jobs.
+
+Every AudioProcessor job carries a JobProfiler that times the pipeline's
+stages (decode, front end, pre-emphasis, the spectral stages, checkpoint,
+save, classification, ...) and produces one record per job. The pipeline
+is a chain of generators, so stages interleave block by block; the
+profiler keeps a stack of open stages and charges every stage only for
+the time spent in it and not in a stage entered from it, so the stage
+times of a job add up to its total.
+
+For each stage it records wall time, CPU time of the job's thread, growth
+of the process's peak RSS while the stage ran, and the samples (per
+channel) the stage handled, from which samples/sec follows. A stage
+transition costs a perf_counter, a thread_time and a getrusage call, so
+profiling stays on in production. Peak RSS is a process-wide high-water
+mark: a stage is charged for the memory it pushed the peak up by, which
+concurrent jobs share.
+
+Worker processes of a parallel run profile the engine stages of their
+chunks themselves and return the stage records with each chunk, which
+the parent merges into the job's profile; their wall times then add up
+across workers.
+
+Finished records are kept in a bounded ProfileStore (profile_store, shared
+by the process) and written to the 'performance' log as JSON.
+"""
+
+import collections
+import json
+import logging
+import resource
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+perf_logger = logging.getLogger('performance')
+
+# ru_maxrss is in kilobytes on Linux
+_MAXRSS_UNIT = 1024
+
+
+def _peak_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * _MAXRSS_UNIT
+
+
+class JobProfiler:
+    """Exclusive per-stage wall time, CPU time, peak RSS growth and samples of one job"""
+
+    def __init__(self, job=None):
+        self.job = job
+        self.started_at = datetime.utcnow()
+        self.stages = {}
+        self._stack = []  # [stage, marked] of the open stages, innermost last
+        self._resumed = None  # (wall, cpu, peak rss) when the innermost stage last resumed
+
+    def enter(self, stage, marked=False):
+        """Open stage inside the current one"""
+        self._charge()
+        self._stack.append([stage, marked])
+
+    def exit(self, samples=0):
+        """Close the innermost stage, crediting it with samples"""
+        self._charge()
+        stage, _ = self._stack.pop()
+        self._totals(stage)['calls'] += 1
+        self._totals(stage)['samples'] += samples
+
+    def stage(self, stage, samples=0):
+        """Context manager timing a block of code as stage"""
+        return _Stage(self, stage, samples)
+
+    def mark(self, stage, samples=0):
+        """
+        Close the stage opened by the previous mark() at this level (if any)
+        and open stage, or with stage None only close it. This suits code
+        that only announces where each stage starts, as the engine's
+        cancel-token checks do.
+        """
+        if self._stack and self._stack[-1][1]:
+            self.exit()
+        if stage is not None:
+            self.enter(stage, marked=True)
+            self._totals(stage)['samples'] += samples
+
+    def profiled(self, iterable, stage, samples=len):
+        """Pass iterable through, charging the time taken to produce each item to stage"""
+        iterator = iter(iterable)
+        while True:
+            self.enter(stage)
+            count = 0
+            try:
+                item = next(iterator, _END)
+                if item is not _END:
+                    count = samples(item)
+            finally:
+                self.exit(count)
+            if item is _END:
+                return
+            yield item
+
+    def merge(self, stages):
+        """Add stage records (from drain() in another process) to this profile"""
+        for stage, record in stages.items():
+            totals = self._totals(stage)
+            for name, value in record.items():
+                totals[name] += value
+
+    def drain(self):
+        """Stage totals so far, and reset them; open stages keep running"""
+        self._charge()
+        stages, self.stages = self.stages, {}
+        return stages
+
+    def record(self, **details):
+        """One record of the job: its details, totals and per-stage breakdown"""
+        while self._stack:
+            self.exit()
+        stages = []
+        for stage, totals in self.stages.items():
+            stages.append({
+                'stage': stage,
+                'calls': totals['calls'],
+                'wall_seconds': round(totals['wall'], 6),
+                'cpu_seconds': round(totals['cpu'], 6),
+                'peak_rss_growth_bytes': totals['peak_rss_growth'],
+                'samples': totals['samples'],
+                'samples_per_second': (
+                    round(totals['samples'] / totals['wall'], 1) if totals['samples'] and totals['wall'] else None
+                )
+            })
+        return {
+            'job': self.job,
+            'started_at': self.started_at.isoformat(),
+            **details,
+            'wall_seconds': round(sum(totals['wall'] for totals in self.stages.values()), 6),
+            'cpu_seconds': round(sum(totals['cpu'] for totals in self.stages.values()), 6),
+            'peak_rss_growth_bytes': sum(totals['peak_rss_growth'] for totals in self.stages.values()),
+            'stages': stages
+        }
+
+    def _totals(self, stage):
+        if stage not in self.stages:
+            self.stages[stage] = {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'peak_rss_growth': 0, 'samples': 0}
+        return self.stages[stage]
+
+    def _charge(self):
+        # Credit the innermost open stage with the time since it last resumed
+        now = (time.perf_counter(), time.thread_time(), _peak_rss())
+        if self._stack and self._resumed is not None:
+            totals = self._totals(self._stack[-1][0])
+            totals['wall'] += now[0] - self._resumed[0]
+            totals['cpu'] += now[1] - self._resumed[1]
+            totals['peak_rss_growth'] += now[2] - self._resumed[2]
+        self._resumed = now
+
+
+_END = object()
+
+
+class _Stage:
+    def __init__(self, profiler, stage, samples):
+        self.profiler = profiler
+        self.stage = stage
+        self.samples = samples
+
+    def __enter__(self):
+        self.profiler.enter(self.stage)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.exit(self.samples)
+        return False
+
+
+class ProfileStore:
+    """The most recent job profile records, by job"""
+
+    def __init__(self, max_records=500):
+        self.max_records = max_records
+        self._records = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        with self._lock:
+            self._records.pop(record['job'], None)
+            self._records[record['job']] = record
+            while len(self._records) > self.max_records:
+                self._records.popitem(last=False)
+        perf_logger.info(json.dumps({'job_profile': record}, default=str))
+
+    def get(self, job):
+        with self._lock:
+            return self._records.get(job)
+
+    def recent(self, limit=50):
+        """Newest records first"""
+        with self._lock:
+            return list(reversed(self._records.values()))[:limit]
+
+    def stats(self):
+        """Per-stage totals and throughput over the stored records"""
+        with self._lock:
+            records = list(self._records.values())
+        stages = {}
+        for record in records:
+            for stage in record['stages']:
+                totals = stages.setdefault(stage['stage'], {
+                    'jobs': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'max_peak_rss_growth_bytes': 0, 'samples': 0
+                })
+                totals['jobs'] += 1
+                totals['wall_seconds'] += stage['wall_seconds']
+                totals['cpu_seconds'] += stage['cpu_seconds']
+                totals['max_peak_rss_growth_bytes'] = max(
+                    totals['max_peak_rss_growth_bytes'], stage['peak_rss_growth_bytes']
+                )
+                totals['samples'] += stage['samples']
+        for totals in stages.values():
+            totals['samples_per_second'] = (
+                round(totals['samples'] / totals['wall_seconds'], 1)
+                if totals['samples'] and totals['wall_seconds'] else None
+            )
+        return {'jobs': len(records), 'stages': stages}
+
+
+# Shared by every AudioProcessor in the process
+profile_store = ProfileStore()
@@ -0,0 +1,283 @@
+"""Spectral enhancement on a single shared STFT.
+
+Noise gating, echo suppression and band limiting used to run as separate
+passes, each with its own forward and inverse transform (noisereduce, the
+echo canceller) or in the time domain (the band-pass). SpectralEnhancer
+computes one STFT per block, derives each stage as a gain mask on that
+spectrogram, extracts per-frame noise features from it and inverts once.
+
+All arrays follow the pipeline's dtype policy (see dtypes): a float32
+segment is transformed, masked and inverted in float32/complex64. The
+transforms are computed here rather than with scipy.signal.stft/istft,
+which pad with float64 zeros and so run every float32 block through
+complex128; they give the same result (hann window, zero boundary
+extension, padding to whole frames, 'spectrum' scaling) with one windowed
+frame array and one spectrum, and overlap-add without a per-frame loop.
+"""
+
+import logging
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import fft as sp_fft
+from scipy import signal
+
+from .dtypes import resolve_dtype
+
+logger = logging.getLogger(__name__)
+
+
+class SpectralEnhancer:
+    """Apply noise gating, echo suppression and band limiting as masks on one STFT"""
+    FFT_SIZE = 1024
+    HOP_LENGTH = 256
+
+    # Non-stationary noise gate
+    TIME_CONSTANT_SECONDS = 2.0
+    GATE_THRESHOLD = 2.0
+    GATE_SLOPE = 10.0
+    FREQ_SMOOTH_HZ = 500
+    TIME_SMOOTH_MS = 50
+
+    # Late-reflection (echo) suppression
+    ECHO_DELAY_MS = 50
+    ECHO_DECAY = 0.4
+    ECHO_FLOOR = 0.1
+
+    # Band limiting
+    LOW_CUTOFF = 80
+    HIGH_CUTOFF = 8000
+    MAX_CUTOFF_RATIO = 0.95  # keep the upper band edge below Nyquist
+    FILTER_ORDER = 4
+
+    TIERS = ('fast', 'full')
+
+    # Per-frame noise features, in column order
+    FEATURE_NAMES = ('energy_db', 'flatness', 'band_low', 'band_mid', 'band_high', 'band_top', 'gate', 'zcr')
+    FEATURE_BANDS = (0, 300, 1000, 3000)
+
+    def __init__(self, sample_rate, strength, noise_floor=None, tier='full', dtype=None):
+        """
+        noise_floor is an optional (channels, bins, 1) expected noise STFT
+        magnitude; the gate then never compares a bin against less than it.
+        tier 'fast' gates each bin against that floor alone, without the
+        adaptive level tracking, mask smoothing and echo suppression.
+        dtype is the processing dtype (see dtypes) of segments and masks.
+        """
+        if tier not in self.TIERS:
+            raise ValueError(f"Unknown spectral tier: {tier}")
+        self.sample_rate = sample_rate
+        self.strength = strength
+        self.dtype = resolve_dtype(dtype)
+        self.frequencies = np.fft.rfftfreq(self.FFT_SIZE, 1.0 / sample_rate)
+        self.noise_floor = None if noise_floor is None else np.asarray(noise_floor, dtype=self.dtype)
+        self.tier = tier if noise_floor is not None else 'full'
+
+        # Zero-phase band limiting: the Butterworth magnitude response
+        # evaluated at the STFT bin frequencies
+        nyquist = sample_rate / 2
+        high_cutoff = min(self.HIGH_CUTOFF, self.MAX_CUTOFF_RATIO * nyquist)
+        sos = signal.butter(
+            N=self.FILTER_ORDER,
+            Wn=[self.LOW_CUTOFF / nyquist, high_cutoff / nyquist],
+            btype='band',
+            output='sos'
+        )
+        _, response = signal.sosfreqz(sos, worN=self.frequencies, fs=sample_rate)
+        self.band_gain = np.abs(response)[:, np.newaxis].astype(self.dtype)
+
+        window = signal.get_window('hann', self.FFT_SIZE)
+        self._window = window.astype(self.dtype)[:, np.newaxis]
+        self._stft_scale = self.dtype.type(1.0 / window.sum())
+        self._window_sum = self.dtype.type(window.sum())
+        self._window_power = (window ** 2).astype(self.dtype)
+
+        frames_per_constant = self.TIME_CONSTANT_SECONDS * sample_rate / self.HOP_LENGTH
+        pole = (np.sqrt(1 + 4 * frames_per_constant ** 2) - 1) / (2 * frames_per_constant ** 2)
+        # In the processing dtype, or filtfilt promotes every magnitude it smooths
+        self._smoothing_b = np.array([pole], dtype=self.dtype)
+        self._smoothing_a = np.array([1, pole - 1], dtype=self.dtype)
+        self._mask_filter = self._smoothing_filter()
+        self._echo_delay = max(1, int(self.ECHO_DELAY_MS / 1000 * sample_rate / self.HOP_LENGTH))
+
+        edges = list(self.FEATURE_BANDS) + [nyquist + 1]
+        self._band_bins = [
+            (self.frequencies >= low) & (self.frequencies < high)
+            for low, high in zip(edges[:-1], edges[1:])
+        ]
+
+    def _smoothing_filter(self):
+        freq_bins = int(self.FREQ_SMOOTH_HZ / (self.sample_rate / (self.FFT_SIZE / 2)))
+        time_frames = int(self.TIME_SMOOTH_MS / (self.HOP_LENGTH / self.sample_rate * 1000))
+        if freq_bins < 1 and time_frames < 1:
+            return None
+        kernel = np.outer(
+            np.concatenate([np.linspace(0, 1, freq_bins + 1, endpoint=False), np.linspace(1, 0, freq_bins + 2)])[1:-1],
+            np.concatenate([np.linspace(0, 1, time_frames + 1, endpoint=False), np.linspace(1, 0, time_frames + 2)])[1:-1]
+        )
+        return (kernel / np.sum(kernel)).astype(self.dtype)
+
+    def frame_centers(self, frames):
+        """Sample positions, relative to the segment start, of the centres of its STFT frames"""
+        return np.arange(frames) * self.HOP_LENGTH
+
+    def enhance(self, segment, cancel_token=None, profiler=None):
+        """
+        Enhance a (channels, samples) segment.
+
+        Returns the enhanced segment and a (frames, features) array with one
+        row per STFT frame, averaged over channels, in FEATURE_NAMES order.
+        cancel_token, if given, is checked between stages, and profiler (a
+        profiling.JobProfiler) is told where each stage starts.
+        """
+        segment = np.asarray(segment, dtype=self.dtype)
+
+        def check(stage):
+            if cancel_token is not None:
+                cancel_token.check(stage)
+            if profiler is not None:
+                profiler.mark(stage, segment.shape[-1])
+
+        spectrum = self._stft(segment)
+        magnitude = np.abs(spectrum)
+
+        check('noise reduction')
+        if self.tier == 'fast':
+            mask = self._stationary_gate(magnitude)
+        else:
+            mask = self._noise_gate(magnitude)
+            check('echo suppression')
+            mask *= self._echo_suppression(magnitude * mask)
+        features = self._features(magnitude, mask, segment)
+        check('band-pass filtering')
+        mask *= self.band_gain
+
+        spectrum *= mask
+        check('inverse STFT')
+        return self._istft(spectrum, segment.shape[-1]), features
+
+    def _stft(self, segment):
+        """(..., bins, frames) spectrum of a (..., samples) segment, as scipy.signal.stft"""
+        half = self.FFT_SIZE // 2
+        frames = -(-segment.shape[-1] // self.HOP_LENGTH) + 1
+        padded = np.zeros(segment.shape[:-1] + (self.FFT_SIZE + (frames - 1) * self.HOP_LENGTH,), dtype=self.dtype)
+        padded[..., half:half + segment.shape[-1]] = segment
+
+        # (..., FFT_SIZE, frames) windowed frames in one contiguous array
+        views = sliding_window_view(padded, self.FFT_SIZE, axis=-1)[..., ::self.HOP_LENGTH, :]
+        windowed = np.empty(segment.shape[:-1] + (self.FFT_SIZE, frames), dtype=self.dtype)
+        np.multiply(np.swapaxes(views, -1, -2), self._window, out=windowed)
+        del padded, views
+
+        spectrum = sp_fft.rfft(windowed, axis=-2)
+        spectrum *= self._stft_scale
+        return spectrum
+
+    def _istft(self, spectrum, length):
+        """First length samples of the inverse of _stft(), as scipy.signal.istft"""
+        frames = spectrum.shape[-1]
+        segments = sp_fft.irfft(spectrum, n=self.FFT_SIZE, axis=-2)
+        segments *= self._window_sum
+        segments *= self._window
+
+        # Overlap-add: hop k of every frame lands k hops after the frame start
+        overlap = self.FFT_SIZE // self.HOP_LENGTH
+        hops = segments.reshape(segments.shape[:-2] + (overlap, self.HOP_LENGTH, frames))
+        output = np.zeros(segments.shape[:-2] + (frames + overlap - 1, self.HOP_LENGTH), dtype=self.dtype)
+        for hop in range(overlap):
+            output[..., hop:hop + frames, :] += np.swapaxes(hops[..., hop, :, :], -1, -2)
+        del segments, hops
+        output = output.reshape(output.shape[:-2] + (-1,))
+
+        norm = np.zeros((frames + overlap - 1, self.HOP_LENGTH), dtype=self.dtype)
+        window_power = self._window_power.reshape(overlap, self.HOP_LENGTH)
+        for hop in range(overlap):
+            norm[hop:hop + frames] += window_power[hop]
+        norm = norm.reshape(-1)
+
+        half = self.FFT_SIZE // 2
+        output = output[..., half:half + length]
+        norm = norm[half:half + length]
+        output /= np.where(norm > 1e-10, norm, 1.0).astype(self.dtype)
+        return output
+
+    def _noise_gate(self, magnitude):
+        # Each bin is compared against its own slowly varying level, so the
+        # gate adapts to non-stationary noise without a separate noise clip
+        smoothed = signal.filtfilt(self._smoothing_b, self._smoothing_a, magnitude, axis=-1, padtype=None)
+        if self.noise_floor is not None:
+            # The file-level noise profile keeps the reference from rising
+            # with long stretches of speech
+            np.maximum(smoothed, self.noise_floor, out=smoothed)
+        mask = self._gate_mask(magnitude, smoothed)
+
+        if self._mask_filter is not None:
+            mask = signal.fftconvolve(mask, self._mask_filter[np.newaxis], mode='same', axes=(-2, -1))
+        return self._apply_strength(mask)
+
+    def _stationary_gate(self, magnitude):
+        return self._apply_strength(self._gate_mask(magnitude, self.noise_floor))
+
+    def _gate_mask(self, magnitude, reference):
+        # Logistic gate on the level above the reference, computed in place
+        # in one array of the magnitude's shape and dtype
+        mask = magnitude - reference
+        mask /= reference + 1e-12
+        mask -= self.GATE_THRESHOLD
+        mask *= -self.GATE_SLOPE
+        np.exp(mask, out=mask)
+        mask += 1.0
+        return np.reciprocal(mask, out=mask)
+
+    def _apply_strength(self, mask):
+        mask *= self.strength
+        mask += 1.0 - self.strength
+        return mask
+
+    def _echo_suppression(self, magnitude):
+        power = np.square(magnitude)
+        gain = np.zeros_like(power)
+        gain[..., self._echo_delay:] = power[..., :-self._echo_delay]
+        gain *= -self.ECHO_DECAY
+        power += 1e-12
+        gain /= power
+        gain += 1.0
+        np.maximum(gain, self.ECHO_FLOOR ** 2, out=gain)
+        return np.sqrt(gain, out=gain)
+
+    def _features(self, magnitude, mask, segment):
+        power = (magnitude ** 2).mean(axis=0)
+        total = power.sum(axis=0) + 1e-12
+        energy_db = 10 * np.log10(total / power.shape[0])
+        flatness = np.exp(np.mean(np.log(power + 1e-30), axis=0)) / (total / power.shape[0])
+        bands = [power[bins].sum(axis=0) / total for bins in self._band_bins]
+        gate = mask.mean(axis=(0, 1))
+        zcr = self._zero_crossing_rate(segment, power.shape[-1])
+        return np.stack([energy_db, flatness] + bands + [gate, zcr], axis=1).astype(np.float32)
+
+    def spectrum_features(self, power):
+        """
+        One feature row for a (channels, bins) average power spectrum, such
+        as a noise profile. The zero-crossing rate is estimated from the
+        spectrum (Rice's formula); there is no gate value.
+        """
+        power = power.mean(axis=0)
+        total = power.sum() + 1e-12
+        energy_db = 10 * np.log10(total / len(power))
+        flatness = np.exp(np.mean(np.log(power + 1e-30))) / (total / len(power))
+        bands = [power[bins].sum() / total for bins in self._band_bins]
+        zcr = 2 * np.sqrt(np.sum(self.frequencies ** 2 * power) / total) / self.sample_rate
+        return np.array([[energy_db, flatness] + bands + [np.nan, zcr]], dtype=np.float32)
+
+    def _zero_crossing_rate(self, segment, frames):
+        # Crossings per sample in the hop-sized window around each frame
+        # centre, from one cumulative sum over the segment
+        mono = segment.mean(axis=0)
+        if len(mono) < 2:
+            return np.zeros(frames)
+        signs = np.signbit(mono)
+        cumulative = np.concatenate([[0], np.cumsum(signs[1:] != signs[:-1])])
+        centers = self.frame_centers(frames)
+        starts = np.clip(centers - self.HOP_LENGTH // 2, 0, len(mono) - 1)
+        ends = np.clip(centers + self.HOP_LENGTH // 2, 0, len(mono) - 1)
+        return (cumulative[ends] - cumulative[starts]) / np.maximum(ends - starts, 1)
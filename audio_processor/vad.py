@@ -0,0 +1,261 @@
+"""Voice-activity pre-pass and silence splicing.
+
+The VoiceActivityDetector makes one cheap pass over the decoded file
+(channels already downmixed or selected, at the source rate, no resampling)
+and scores short frames on energy above the file's noise floor and the
+share of energy in the speech band. The result is a SpeechIndex: padded
+speech regions in seconds, plus the per-frame levels and decisions. The same
+pass feeds the file's noise profile (see noise_profile).
+
+A SilenceSplicer then cuts the silence between regions out of the block
+stream before enhancement, so only speech (with its padding) is enhanced.
+Its TimeMap relates positions in the spliced ("compacted") stream to the
+original recording, and expand() re-inserts the gaps as digital silence when
+full-length output is wanted.
+"""
+
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class TimeMap:
+    """Piecewise mapping from compacted-stream time to original-recording time"""
+
+    def __init__(self, segments=None):
+        # (compact_start, original_start, duration) in seconds, in order
+        self.segments = [tuple(segment) for segment in segments or []]
+
+    def to_original(self, times, side='right'):
+        """
+        Map compacted times (scalar or array) to original times.
+
+        A time exactly on a splice is placed at the start of the following
+        region with side='right' (for start times) and at the end of the
+        preceding region with side='left' (for end times).
+        """
+        if not self.segments:
+            return times
+        table = np.asarray(self.segments)
+        values = np.asarray(times, dtype=np.float64)
+        index = np.clip(np.searchsorted(table[:, 0], values, side=side) - 1, 0, len(table) - 1)
+        mapped = table[index, 1] + np.minimum(values - table[index, 0], table[index, 2])
+        return float(mapped) if np.ndim(mapped) == 0 else mapped
+
+    def to_list(self):
+        return [list(segment) for segment in self.segments]
+
+    @classmethod
+    def from_list(cls, segments):
+        return cls(segments)
+
+
+class SpeechIndex:
+    """Padded speech regions of a recording and the frame-level VAD data behind them"""
+
+    def __init__(self, regions, duration, frame_seconds, energy_db, speech, threshold_db):
+        self.regions = regions  # (n, 2) start/end seconds
+        self.duration = duration
+        self.frame_seconds = frame_seconds
+        self.energy_db = energy_db
+        self.speech = speech
+        self.threshold_db = threshold_db  # frames at or below this level are non-speech
+
+    @property
+    def speech_seconds(self):
+        return float(np.sum(self.regions[:, 1] - self.regions[:, 0])) if len(self.regions) else 0.0
+
+    def sample_regions(self, sample_rate):
+        """Regions as (n, 2) sample offsets at sample_rate"""
+        return np.round(self.regions * sample_rate).astype(np.int64)
+
+
+class VoiceActivityDetector:
+    """Frame-level energy/spectral speech detector producing a SpeechIndex"""
+    FRAME_SECONDS = 0.02
+    FLOOR_PERCENTILE = 10
+    ENERGY_MARGIN_DB = 9.0
+    MIN_ENERGY_DB = -70.0  # never call anything below this speech
+    SPEECH_BAND = (300, 3400)
+    MIN_SPEECH_BAND_RATIO = 0.25
+    PAD_SECONDS = 0.3
+    MIN_GAP_SECONDS = 1.0  # shorter silences stay in the stream
+
+    def __init__(self, sample_rate):
+        self.sample_rate = sample_rate
+        self.frame_length = max(1, int(round(self.FRAME_SECONDS * sample_rate)))
+        frequencies = np.fft.rfftfreq(self.frame_length, 1.0 / sample_rate)
+        self._speech_bins = (frequencies >= self.SPEECH_BAND[0]) & (frequencies < self.SPEECH_BAND[1])
+        self._window = np.hanning(self.frame_length).astype(np.float32)
+
+    def detect(self, blocks, noise=None):
+        """
+        Scan consecutive (frames, channels) blocks and return their SpeechIndex.
+
+        If noise is a NoiseProfileAccumulator, the spectrum of every full
+        frame is added to it on the way.
+        """
+        energies = []
+        ratios = []
+        remainder = None
+        total = 0
+
+        for block in blocks:
+            total += len(block)
+            samples = np.concatenate([remainder, block]) if remainder is not None else block
+            usable = len(samples) - len(samples) % self.frame_length
+            energy, ratio = self._frame_levels(samples[:usable], noise)
+            energies.append(energy)
+            ratios.append(ratio)
+            # Decoder buffers are reused, so keep a copy of the partial frame
+            remainder = samples[usable:].copy()
+
+        if remainder is not None and len(remainder):
+            padded = np.pad(remainder, ((0, self.frame_length - len(remainder)), (0, 0)))
+            energy, ratio = self._frame_levels(padded, None)
+            energies.append(energy)
+            ratios.append(ratio)
+
+        energy_db = np.concatenate(energies) if energies else np.zeros(0)
+        band_ratio = np.concatenate(ratios) if ratios else np.zeros(0)
+        return self._index(energy_db, band_ratio, total / self.sample_rate)
+
+    def _frame_levels(self, samples, noise):
+        # (frames, channels, frame_length), in float32 like the rest of the
+        # pipeline (see dtypes); a view of the block when it already is
+        samples = samples.astype(np.float32, copy=False)
+        frames = samples.reshape(-1, self.frame_length, samples.shape[1]).transpose(0, 2, 1)
+        energy_db = 10 * np.log10(np.mean(frames ** 2, axis=(1, 2)) + 1e-12)
+        power = np.abs(np.fft.rfft(frames * self._window, axis=-1)) ** 2
+        if noise is not None and len(frames):
+            noise.add(energy_db, power, self._window)
+        power = power.sum(axis=1)
+        band_ratio = power[:, self._speech_bins].sum(axis=1) / (power.sum(axis=1) + 1e-12)
+        return energy_db, band_ratio
+
+    def _index(self, energy_db, band_ratio, duration):
+        if not len(energy_db):
+            return SpeechIndex(
+                np.zeros((0, 2)), duration, self.FRAME_SECONDS, energy_db, np.zeros(0, dtype=bool), self.MIN_ENERGY_DB
+            )
+
+        floor = np.percentile(energy_db, self.FLOOR_PERCENTILE)
+        threshold = max(floor + self.ENERGY_MARGIN_DB, self.MIN_ENERGY_DB)
+        speech = (energy_db > threshold) & (band_ratio > self.MIN_SPEECH_BAND_RATIO)
+
+        # Pad every speech frame, then close gaps too short to be worth cutting
+        pad = int(round(self.PAD_SECONDS / self.FRAME_SECONDS))
+        padded = np.convolve(speech.astype(np.int32), np.ones(2 * pad + 1, dtype=np.int32), mode='same') > 0
+        edges = np.diff(np.concatenate([[0], padded.astype(np.int8), [0]]))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
+        if len(starts) > 1:
+            min_gap = int(round(self.MIN_GAP_SECONDS / self.FRAME_SECONDS))
+            keep = (starts[1:] - ends[:-1]) >= min_gap
+            starts = np.concatenate([starts[:1], starts[1:][keep]])
+            ends = np.concatenate([ends[:-1][keep], ends[-1:]])
+
+        regions = np.stack([starts, ends], axis=1) * self.FRAME_SECONDS
+        regions = np.minimum(regions, duration)
+        index = SpeechIndex(regions, duration, self.FRAME_SECONDS, energy_db, speech, threshold)
+        logger.info(
+            f"VAD: {len(regions)} speech region(s), {index.speech_seconds:.1f}s of {duration:.1f}s "
+            f"(noise floor {floor:.1f} dB)"
+        )
+        return index
+
+
+class SilenceSplicer:
+    """Cut non-speech out of a block stream and put it back as silence afterwards"""
+    FADE_SECONDS = 0.01
+
+    def __init__(self, speech_index, sample_rate):
+        self.sample_rate = sample_rate
+        self.regions = speech_index.sample_regions(sample_rate)
+        self.recording_samples = int(round(speech_index.duration * sample_rate))
+        self.fade = max(1, int(self.FADE_SECONDS * sample_rate))
+        self.total_samples = None
+        self._segments = []  # (compact_start, original_start, length) in samples
+
+    @property
+    def time_map(self):
+        return TimeMap([
+            (float(compact) / self.sample_rate, float(original) / self.sample_rate, float(length) / self.sample_rate)
+            for compact, original, length in self._segments
+        ])
+
+    def compact(self, blocks):
+        """Yield the speech parts of each (frames, channels) block, faded at every splice"""
+        position = 0
+        compact_position = 0
+        for block in blocks:
+            block_end = position + len(block)
+            pieces = []
+            for start, end in self.regions:
+                low, high = max(start, position), min(end, block_end)
+                if low >= high:
+                    continue
+                gain = self._gain(np.arange(low, high), start, end).astype(block.dtype)
+                pieces.append(block[low - position:high - position] * gain[:, np.newaxis])
+                self._record(compact_position, low, high - low)
+                compact_position += high - low
+
+            position = block_end
+            if pieces:
+                yield pieces[0] if len(pieces) == 1 else np.concatenate(pieces)
+        self.total_samples = position
+
+    def _gain(self, positions, start, end):
+        # Fade in after a splice and out before one, including the cut of
+        # trailing silence; the edges of the recording itself are left alone
+        gain = np.ones(len(positions))
+        if start > 0:
+            gain = np.minimum(gain, (positions - start + 1) / self.fade)
+        if end < self.recording_samples:
+            gain = np.minimum(gain, (end - positions) / self.fade)
+        return np.clip(gain, 0.0, 1.0)
+
+    def _record(self, compact_start, original_start, length):
+        if self._segments:
+            last_compact, last_original, last_length = self._segments[-1]
+            if last_original + last_length == original_start:
+                self._segments[-1] = (last_compact, last_original, last_length + length)
+                return
+        self._segments.append((compact_start, original_start, length))
+
+    def expand(self, chunks, channels):
+        """Re-insert the spliced-out gaps as zeros around enhanced compacted chunks"""
+        compact_position = 0
+        original_position = 0
+        dtype = np.float32
+        for chunk in chunks:
+            dtype = chunk.dtype
+            parts = []
+            offset = 0
+            while offset < len(chunk):
+                segment = self._segment_at(compact_position + offset)
+                original_target = segment[1] + (compact_position + offset - segment[0])
+                if original_target > original_position:
+                    parts.append(np.zeros((original_target - original_position,) + chunk.shape[1:], dtype=chunk.dtype))
+                    original_position = original_target
+                take = min(len(chunk) - offset, segment[0] + segment[2] - (compact_position + offset))
+                if take <= 0:
+                    raise ValueError(f"Enhanced output runs past the spliced input at sample {compact_position + offset}")
+                parts.append(chunk[offset:offset + take])
+                offset += take
+                original_position += take
+            compact_position += len(chunk)
+            if parts:
+                yield parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+        if self.total_samples is not None and self.total_samples > original_position:
+            shape = (self.total_samples - original_position,) if channels == 1 else (self.total_samples - original_position, channels)
+            yield np.zeros(shape, dtype=dtype)
+
+    def _segment_at(self, compact_position):
+        for segment in reversed(self._segments):
+            if segment[0] <= compact_position:
+                return segment
+        raise ValueError(f"No spliced segment at compacted sample {compact_position}")
@@ -24,6 +24,8 @@ class Transcription(db.Model):
     )
     text = db.Column(db.Text)
     confidence_score = db.Column(db.Float)
+    enhancement_tier = db.Column(db.String(20))
+    enhancement_time_saved = db.Column(db.Float)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -77,6 +77,10 @@ class MetricsCollector:
         self.processing_times: Dict[str, list] = {}
         self.endpoint_stats: Dict[str, Dict[str, Any]] = {}
         self.error_types: Dict[str, int] = {}
+        self.caches: Dict[str, Any] = {}
+        self.memory_governor = None
+        self.profiles = None
+        self.transcription_client = None
         
     def track_request(self, endpoint: str, duration: float, status_code: int):
         self.request_count += 1
@@ -102,6 +106,22 @@ class MetricsCollector:
         self.error_count += 1
         self.error_types[error_type] = self.error_types.get(error_type, 0) + 1
     
+    def register_cache(self, name: str, cache: Any):
+        """Report a cache's stats() (hits, misses, hit ratio) in get_stats"""
+        self.caches[name] = cache
+    
+    def register_memory_governor(self, governor: Any):
+        """Report a MemoryGovernor's stats() (budget, reserved, queued jobs) in get_stats"""
+        self.memory_governor = governor
+    
+    def register_profiles(self, store: Any):
+        """Report a ProfileStore's stats() (per-stage time and throughput of recent jobs) in get_stats"""
+        self.profiles = store
+    
+    def register_transcription_client(self, client: Any):
+        """Report a transcription client's stats() (requests, connection reuse, scheduler queue) in get_stats"""
+        self.transcription_client = client
+    
     def get_stats(self) -> Dict[str, Any]:
         process = psutil.Process()
         
@@ -118,7 +138,11 @@ class MetricsCollector:
                 'error_count': self.error_count,
                 'error_types': self.error_types
             },
-            'endpoints': {}
+            'endpoints': {},
+            'caches': {name: cache.stats() for name, cache in self.caches.items()},
+            'memory_governor': self.memory_governor.stats() if self.memory_governor else None,
+            'profiles': self.profiles.stats() if self.profiles else None,
+            'transcription_client': self.transcription_client.stats() if self.transcription_client else None
         }
         
         # Calculate endpoint-specific metrics
@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+import soundfile as sf
+
+SAMPLE_RATE = 16000
+
+
+def speech_like(seconds, sample_rate=SAMPLE_RATE, channels=1, seed=0):
+    """Float32 (channels, samples) bursts of modulated tone over low noise, 1 s on and 1 s off"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    bursts = (np.sin(2 * np.pi * 0.5 * t) > 0) * np.sin(2 * np.pi * 220 * t) * np.sin(2 * np.pi * 3 * t)
+    signal = 0.3 * bursts + 0.02 * rng.standard_normal(len(t))
+    gains = 1.0 - 0.2 * np.arange(channels)
+    return (gains[:, np.newaxis] * signal).astype(np.float32)
+
+
+@pytest.fixture
+def speech_file(tmp_path):
+    """Factory writing speech_like audio to a 16-bit WAV in tmp_path"""
+    def write(seconds=12.0, sample_rate=SAMPLE_RATE, channels=1, name='speech.wav', seed=0):
+        path = tmp_path / name
+        sf.write(str(path), speech_like(seconds, sample_rate, channels, seed).T, sample_rate, subtype='PCM_16')
+        return str(path)
+    return write
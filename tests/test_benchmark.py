@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+from audio_processor.benchmark import MODES, main
+
+# The quick preset's modes on one short recording
+QUICK = [
+    '--preset', 'quick', '--durations', '5', '--sample-rates', '16000', '--channels', '1',
+    '--noise', 'hiss', '--repeat', '1'
+]
+
+
+@pytest.fixture(scope='module')
+def quick_run(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('benchmark')
+    output = directory / 'results.json'
+    status = main(QUICK + ['--corpus-dir', str(directory / 'corpus'), '--output', str(output)])
+    return status, directory, json.loads(output.read_text())
+
+
+def test_quick_preset_reports_every_mode(quick_run):
+    status, _, results = quick_run
+
+    assert status == 0
+    assert results['environment']['numpy']
+    assert [case['mode'] for case in results['cases']] == list(MODES)
+    for case in results['cases']:
+        assert case['status'] == 'completed', case.get('error')
+        assert case['seconds'] == 5
+        assert case['audio_seconds_per_cpu_second'] > 0
+        assert case['peak_rss_bytes'] > 0
+        assert case['snr_improvement_db'] == pytest.approx(case['output_si_snr_db'] - case['input_si_snr_db'], abs=0.02)
+    profiled = [case for case in results['cases'] if case['stages'] is not None]
+    assert [case['mode'] for case in profiled] == ['process_audio']
+
+
+def test_baseline_comparison_flags_regressions(quick_run):
+    _, directory, results = quick_run
+    # A baseline that was much faster and enhanced better than this run
+    baseline = dict(results, cases=[
+        dict(case, audio_seconds_per_cpu_second=case['audio_seconds_per_cpu_second'] * 10,
+             snr_improvement_db=case['snr_improvement_db'] + 5)
+        for case in results['cases']
+    ])
+    baseline_path = directory / 'baseline.json'
+    baseline_path.write_text(json.dumps(baseline))
+    output = directory / 'compared.json'
+
+    status = main(QUICK + [
+        '--corpus-dir', str(directory / 'corpus'), '--output', str(output), '--baseline', str(baseline_path)
+    ])
+
+    compared = json.loads(output.read_text())
+    assert status == 1
+    assert compared['regressions'] == [case['id'] for case in results['cases']]
+    flags = compared['cases'][0]['regressions']
+    assert any(flag.startswith('throughput') for flag in flags)
+    assert any(flag.startswith('SNR improvement') for flag in flags)
@@ -0,0 +1,77 @@
+import os
+import shutil
+
+import numpy as np
+import soundfile as sf
+
+from audio_processor.cache import EnhancedAudioCache, content_key
+from audio_processor.encoder import StreamingEncoder
+
+PARAMS = {'version': 1, 'output_format': 'flac', 'tier': 'auto'}
+
+
+def encode(path, seconds, value, output_format='flac'):
+    with StreamingEncoder(str(path), 16000, 1, output_format) as encoder:
+        encoder.write(np.full(int(seconds * 16000), value, dtype=np.float32))
+    return str(path)
+
+
+def test_key_depends_on_content_and_params_not_name(speech_file, tmp_path):
+    original = speech_file(seconds=2.0)
+    renamed = str(tmp_path / 'renamed.wav')
+    shutil.copyfile(original, renamed)
+    other = speech_file(seconds=2.0, name='other.wav', seed=1)
+
+    assert content_key(original, PARAMS) == content_key(renamed, PARAMS)
+    assert content_key(original, PARAMS) != content_key(other, PARAMS)
+    assert content_key(original, PARAMS) != content_key(original, dict(PARAMS, tier='full'))
+    # Parameter order does not matter
+    assert content_key(original, PARAMS) == content_key(original, dict(reversed(list(PARAMS.items()))))
+
+
+def test_round_trip_keeps_output_format_suffix(tmp_path):
+    cache = EnhancedAudioCache(str(tmp_path / 'cache'))
+    output = encode(tmp_path / 'enhanced_upload.flac', 1.0, 0.25)
+
+    cache.put('k' * 64, output, {'sample_rate': 16000})
+    placed = str(tmp_path / 'placed.flac')
+    metadata = cache.get('k' * 64, placed)
+
+    assert metadata == {'sample_rate': 16000}
+    assert os.listdir(cache.directory) and all(
+        name.endswith(('.flac', '.json')) for name in os.listdir(cache.directory)
+    )
+    assert sf.info(placed).format == 'FLAC'
+    assert cache.stats()['hits'] == 1
+
+
+def test_rewriting_output_path_does_not_corrupt_entry(tmp_path):
+    cache = EnhancedAudioCache(str(tmp_path / 'cache'))
+    output = tmp_path / 'enhanced_upload.flac'
+    encode(output, 1.0, 0.25)
+    cache.put('a' * 64, str(output), {'sample_rate': 16000})
+
+    # The next job with the same upload name writes to the same path
+    encode(output, 0.5, -0.5)
+
+    placed = str(tmp_path / 'placed.flac')
+    cache.get('a' * 64, placed)
+    audio, _ = sf.read(placed, dtype='float32')
+    assert len(audio) == 16000
+    assert np.allclose(audio, 0.25, atol=1e-4)
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = EnhancedAudioCache(str(tmp_path / 'cache'))
+    for index, key in enumerate('abc'):
+        cache.put(key * 64, encode(tmp_path / f'{key}.wav', 1.0, 0.1, 'pcm16'), {'sample_rate': 16000})
+        os.utime(os.path.join(cache.directory, f'{key * 64}.json'), (index, index))
+    entry_bytes = sum(size for _, size, _, _ in cache._entries()) // 3
+
+    cache.get('a' * 64, str(tmp_path / 'touched.wav'))
+    cache.max_bytes = 2 * entry_bytes
+    cache._evict()
+
+    assert cache.get('b' * 64, str(tmp_path / 'evicted.wav')) is None
+    assert cache.get('a' * 64, str(tmp_path / 'kept.wav')) is not None
+    assert cache.stats()['evictions'] == 1
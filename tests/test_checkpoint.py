@@ -0,0 +1,89 @@
+import os
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from audio_processor.checkpoint import ChunkCheckpoint
+from audio_processor.exceptions import AudioEnhancementError
+from audio_processor.memory import MemoryGovernor
+from audio_processor.processor import AudioProcessor
+
+
+def process(path, output_path, checkpoint_dir):
+    # The smallest budget gives the smallest blocks, 8 s each
+    processor = AudioProcessor(path, checkpoint_dir=checkpoint_dir, memory_governor=MemoryGovernor(1))
+    processor.process_audio(output_path)
+    return processor
+
+
+def test_resumed_job_output_is_identical(speech_file, tmp_path, monkeypatch):
+    path = speech_file(seconds=40.0)
+    checkpoint_dir = str(tmp_path / 'checkpoints')
+    reference = process(path, str(tmp_path / 'reference.wav'), str(tmp_path / 'reference_checkpoints'))
+    assert reference.total_chunks == 5
+
+    # Crash while saving the fourth chunk
+    save = ChunkCheckpoint.save
+    saved = []
+
+    def crashing_save(self, *args, **kwargs):
+        if len(saved) == 3:
+            raise OSError("disk went away")
+        saved.append(save(self, *args, **kwargs))
+
+    monkeypatch.setattr(ChunkCheckpoint, 'save', crashing_save)
+    with pytest.raises(AudioEnhancementError):
+        process(path, str(tmp_path / 'crashed.wav'), checkpoint_dir)
+    monkeypatch.setattr(ChunkCheckpoint, 'save', save)
+
+    load = ChunkCheckpoint.load
+    resumed_after = []
+    monkeypatch.setattr(ChunkCheckpoint, 'load', lambda self: resumed_after.append(load(self)) or resumed_after[-1])
+    process(path, str(tmp_path / 'resumed.wav'), checkpoint_dir)
+
+    assert resumed_after == [3]
+    reference_audio, _ = sf.read(str(tmp_path / 'reference.wav'), dtype='int16')
+    resumed_audio, _ = sf.read(str(tmp_path / 'resumed.wav'), dtype='int16')
+    assert np.array_equal(reference_audio, resumed_audio)
+    # A completed job leaves no checkpoint behind
+    assert os.listdir(checkpoint_dir) == []
+
+
+def save_chunks(root, count, stateful):
+    checkpoint = ChunkCheckpoint(root, 'k' * 64, {'sample_rate': 16000})
+    checkpoint.load()
+    for index in range(count):
+        state = {'history': np.full(3, index, dtype=np.float32)} if stateful else None
+        checkpoint.save(np.full((100, 1), index, dtype=np.float32), np.zeros((2, 4)), state)
+    return checkpoint
+
+
+def corrupt(checkpoint, index):
+    with open(os.path.join(checkpoint.directory, checkpoint.chunks[index]['file']), 'r+b') as chunk_file:
+        chunk_file.write(b'garbage')
+
+
+def test_resume_stops_before_a_corrupt_chunk(tmp_path):
+    corrupt(save_chunks(str(tmp_path), 4, stateful=False), 2)
+
+    reopened = ChunkCheckpoint(str(tmp_path), 'k' * 64, {'sample_rate': 16000})
+    assert reopened.load() == 2
+    assert np.array_equal(reopened.chunk(1), np.full((100, 1), 1, dtype=np.float32))
+
+
+def test_stateful_resume_needs_the_newest_engine_state(tmp_path):
+    # Only the newest chunk keeps its engine state, so losing that chunk
+    # leaves nothing a sequential run can resume from
+    corrupt(save_chunks(str(tmp_path), 3, stateful=True), 2)
+    assert ChunkCheckpoint(str(tmp_path), 'k' * 64, {'sample_rate': 16000}).load() == 0
+
+    save_chunks(str(tmp_path / 'intact'), 3, stateful=True)
+    reopened = ChunkCheckpoint(str(tmp_path / 'intact'), 'k' * 64, {'sample_rate': 16000})
+    assert reopened.load() == 3
+    assert reopened.state()['history'][0] == 2
+
+
+def test_checkpoint_of_another_layout_is_discarded(tmp_path):
+    save_chunks(str(tmp_path), 2, stateful=False)
+    assert ChunkCheckpoint(str(tmp_path), 'k' * 64, {'sample_rate': 8000}).load() == 0
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from audio_processor.chunk_engine import ChunkEngine
+from conftest import SAMPLE_RATE, speech_like
+
+# Chunked output differs from a single pass only by float32 rounding and
+# the crossfades at the seams
+TOLERANCE = 1e-3
+
+
+def run_chunked(audio, chunk_samples, strength=0.8):
+    engine = ChunkEngine(SAMPLE_RATE, audio.shape[0], strength)
+    outputs = []
+    for start in range(0, audio.shape[-1], chunk_samples):
+        final = start + chunk_samples >= audio.shape[-1]
+        outputs.append(engine.process(audio[:, start:start + chunk_samples], final=final))
+    return np.concatenate(outputs, axis=-1), engine
+
+
+@pytest.mark.parametrize('chunk_seconds', [1.5, 3.0, 7.0])
+def test_chunked_output_matches_single_pass(chunk_seconds):
+    audio = speech_like(20.0, channels=2)
+    single = ChunkEngine(SAMPLE_RATE, 2, 0.8).process(audio, final=True)
+
+    chunked, engine = run_chunked(audio, int(chunk_seconds * SAMPLE_RATE))
+
+    assert chunked.shape == single.shape == audio.shape
+    assert chunked.dtype == np.float32
+    assert np.max(np.abs(chunked - single)) < TOLERANCE
+    assert engine.samples_in == engine.samples_out == audio.shape[-1]
+
+
+def test_output_lags_input_until_final_chunk():
+    audio = speech_like(4.0)
+    engine = ChunkEngine(SAMPLE_RATE, 1, 0.8)
+
+    first = engine.process(audio[:, :SAMPLE_RATE])
+    rest = engine.process(audio[:, SAMPLE_RATE:], final=True)
+
+    # One second is less than the engine's context, so nothing is final yet
+    assert first.shape == (1, 0)
+    assert rest.shape == audio.shape
+
+
+def test_features_cover_each_frame_once():
+    audio = speech_like(20.0)
+    single = ChunkEngine(SAMPLE_RATE, 1, 0.8)
+    single.process(audio, final=True)
+
+    _, chunked = run_chunked(audio, 3 * SAMPLE_RATE)
+
+    assert sum(len(features) for features in chunked.features) == len(single.features[0])
@@ -0,0 +1,73 @@
+import asyncio
+import io
+import time
+from email.utils import formatdate
+
+import pytest
+import soundfile as sf
+
+from conftest import SAMPLE_RATE, speech_like
+from transcription.deepgram_client import (
+    DeepgramError, DeepgramTranscriptionClient, MAX_RETRY_AFTER, _retry_after
+)
+from transcription.fake_deepgram import FakeDeepgram
+from transcription.scheduler import RequestScheduler
+
+
+def wav_bytes(seconds=2.0):
+    buffer = io.BytesIO()
+    sf.write(buffer, speech_like(seconds).T, SAMPLE_RATE, format='WAV', subtype='PCM_16')
+    return buffer.getvalue()
+
+
+async def transcribe_all(server, bodies, api_key='key'):
+    """Transcribe bodies concurrently against server; returns the outcomes and the client's scheduler"""
+    url = await server.start()
+    client = DeepgramTranscriptionClient(api_key=api_key, base_url=url, scheduler=RequestScheduler(len(bodies)))
+    try:
+        outcomes = await asyncio.gather(
+            *(client.transcribe_stream(body, 'audio/wav') for body in bodies), return_exceptions=True
+        )
+    finally:
+        await client.close()
+        await server.stop()
+    return outcomes, client.scheduler.stats()
+
+
+def test_throttled_request_retries_after_retry_after():
+    # One request per second: the second of two concurrent requests is told to come back in a second
+    server = FakeDeepgram(rate_limit=1, burst=1)
+    started = time.monotonic()
+
+    outcomes, stats = asyncio.run(transcribe_all(server, [wav_bytes(), wav_bytes()]))
+
+    assert not any(isinstance(outcome, Exception) for outcome in outcomes)
+    assert server.stats()['throttled'] == 1
+    # Sooner than the exponential backoff's 4 s minimum
+    assert time.monotonic() - started < 4
+    assert stats['failed'] == 1 and stats['completed'] == 2
+
+
+def test_error_responses_count_as_failed_requests():
+    server = FakeDeepgram(api_key='right')
+
+    outcomes, stats = asyncio.run(transcribe_all(server, [wav_bytes()], api_key='wrong'))
+
+    assert isinstance(outcomes[0], DeepgramError) and outcomes[0].status_code == 401
+    assert stats['failed'] == 1 and stats['completed'] == 0
+
+
+@pytest.mark.parametrize('value, expected', [
+    (None, None),
+    ('', None),
+    ('3', 3.0),
+    ('-5', 0.0),
+    ('3600', MAX_RETRY_AFTER),
+    ('soon', None)
+])
+def test_retry_after_values(value, expected):
+    assert _retry_after(value) == expected
+
+
+def test_retry_after_date():
+    assert 8 <= _retry_after(formatdate(time.time() + 10, usegmt=True)) <= 10
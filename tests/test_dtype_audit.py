@@ -0,0 +1,17 @@
+import pytest
+
+from audio_processor.dtype_audit import COPY_BUDGET, audit
+
+
+@pytest.mark.parametrize('tier, channels', [('full', 1), ('fast', 1), ('full', 2)])
+def test_stages_stay_within_copy_budget_and_dtype(tier, channels):
+    report = audit(seconds=3.0, channels=channels, tier=tier)
+
+    assert report['dtype'] == 'float32'
+    assert report['dtype_errors'] == []
+    over = [stage for stage in report['stages'] if stage['regression']]
+    assert not over, over
+    # Every stage was measured against a budget
+    assert {stage['stage'] for stage in report['stages']} <= set(COPY_BUDGET)
+    assert report['passed']
+
@@ -0,0 +1,31 @@
+import threading
+
+import pytest
+
+from audio_processor.cancellation import CancellationToken
+from audio_processor.encoder import EncodedStream
+from audio_processor.exceptions import AudioProcessingCancelled, AudioProcessingTimeout
+from audio_processor.memory import MemoryGovernor
+from audio_processor.processor import AudioProcessor
+
+
+def test_write_to_a_full_stream_stops_when_cancelled():
+    token = CancellationToken()
+    stream = EncodedStream(max_buffered=4, cancel_token=token)
+    stream.write(b'full')
+
+    threading.Timer(0.2, token.cancel).start()
+    with pytest.raises(AudioProcessingCancelled):
+        stream.write(b'more')
+
+
+def test_job_streaming_to_a_stalled_reader_stops_at_its_deadline(speech_file):
+    # The smallest budget gives 8 s blocks, so the job writes several
+    processor = AudioProcessor(
+        speech_file(seconds=40.0), cancel_token=CancellationToken(1.0), memory_governor=MemoryGovernor(1)
+    )
+    # Nothing reads the stream, so the producer blocks once it is full
+    stream = EncodedStream(max_buffered=1024, cancel_token=processor.cancel_token)
+
+    with pytest.raises(AudioProcessingTimeout):
+        processor.process_audio(None, stream)
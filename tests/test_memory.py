@@ -0,0 +1,73 @@
+import threading
+import time
+
+import pytest
+
+from audio_processor.cancellation import CancellationToken
+from audio_processor.exceptions import AudioProcessingCancelled
+from audio_processor.memory import MemoryGovernor
+from audio_processor.probe import AudioMetadata
+from audio_processor.processor import AudioProcessor
+
+
+def queued_job(speech_file, governor, timeout):
+    """A processor, a running thread processing with it, and the thread's outcome"""
+    processor = AudioProcessor(
+        speech_file(seconds=4.0), memory_governor=governor, cancel_token=CancellationToken(timeout)
+    )
+    outcome = {}
+
+    def run():
+        try:
+            outcome['result'] = processor.process_audio(processor.default_output_path())
+        except Exception as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return processor, thread, outcome
+
+
+def test_time_queued_for_admission_does_not_count_against_deadline(speech_file):
+    # Over budget, so the job waits until the holder is released
+    governor = MemoryGovernor(1)
+    holder = governor.acquire('holder', AudioProcessor(speech_file(seconds=1.0, name='holder.wav')).metadata, 16000, 1)
+
+    processor, thread, outcome = queued_job(speech_file, governor, timeout=1.0)
+    time.sleep(1.5)
+    assert governor.stats()['queued_jobs'] == 1
+    assert processor.cancel_token.deadline is None
+    governor.release(holder)
+    thread.join(30)
+
+    assert 'error' not in outcome
+    assert outcome['result'][1] == 16000
+
+
+def test_queued_job_can_be_cancelled(speech_file):
+    governor = MemoryGovernor(1)
+    holder = governor.acquire('holder', AudioProcessor(speech_file(seconds=1.0, name='holder.wav')).metadata, 16000, 1)
+
+    processor, thread, outcome = queued_job(speech_file, governor, timeout=None)
+    time.sleep(0.2)
+    processor.cancel_token.cancel()
+    thread.join(5)
+    governor.release(holder)
+
+    assert not thread.is_alive()
+    with pytest.raises(AudioProcessingCancelled):
+        raise outcome['error']
+    assert governor.stats()['active_jobs'] == 0
+
+
+@pytest.mark.parametrize('frames, expected', [
+    (0, 8 * 16000),  # length unknown, e.g. FLAC with total_samples 0
+    (16000, 16000),  # shorter than the smallest block
+    (60 * 16000, 8 * 16000)
+])
+def test_block_size_with_known_and_unknown_length(frames, expected):
+    metadata = AudioMetadata('flac', 'flac', 16000, 1, frames, 1024)
+
+    block_frames, _ = MemoryGovernor(1).plan(metadata, 16000, 1)
+
+    assert block_frames == expected
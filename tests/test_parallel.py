@@ -0,0 +1,41 @@
+import numpy as np
+
+from audio_processor.cancellation import CancellationToken
+from audio_processor.chunk_engine import ChunkEngine
+from audio_processor.parallel import ParallelChunkEnhancer
+from conftest import SAMPLE_RATE, speech_like
+
+
+def test_pool_output_matches_single_pass():
+    audio = speech_like(20.0, channels=2)
+    single = ChunkEngine(SAMPLE_RATE, 2, 0.8).process(audio, final=True)
+
+    engine = ChunkEngine(SAMPLE_RATE, 2, 0.8, cancel_token=CancellationToken(60).start())
+    blocks = (audio[:, start:start + 4 * SAMPLE_RATE].T for start in range(0, audio.shape[-1], 4 * SAMPLE_RATE))
+    enhanced = np.concatenate(list(ParallelChunkEnhancer(engine, workers=2).run(blocks))).T
+
+    assert enhanced.shape == single.shape
+    assert np.max(np.abs(enhanced - single)) < 1e-3
+    assert len(engine.features) == 5
+
+
+def test_chunks_waiting_for_a_slow_chunk_count_against_the_limit(monkeypatch):
+    # A long first chunk finishes well after the short ones behind it
+    audio = speech_like(30.0)
+    short = SAMPLE_RATE // 2
+    blocks = [audio[:, :20 * SAMPLE_RATE].T] + [
+        audio[:, start:start + short].T for start in range(20 * SAMPLE_RATE, audio.shape[-1], short)
+    ]
+    enhancer = ParallelChunkEnhancer(ChunkEngine(SAMPLE_RATE, 1, 0.8), workers=2)
+    collect = enhancer._collect
+    held = []
+
+    def counting_collect(executor, in_flight, finished):
+        collect(executor, in_flight, finished)
+        held.append(len(in_flight) + len(finished))
+
+    monkeypatch.setattr(enhancer, '_collect', counting_collect)
+    enhanced = list(enhancer.run(blocks))
+
+    assert len(enhanced) == len(blocks)
+    assert max(held) <= enhancer.max_in_flight
@@ -0,0 +1,46 @@
+import io
+import struct
+
+import pytest
+
+from audio_processor.exceptions import AudioFormatError
+from audio_processor.probe import probe_audio
+
+
+def box(box_type, payload=b''):
+    return struct.pack('>I4s', 8 + len(payload), box_type) + payload
+
+
+def mp4(*mdia_children):
+    ftyp = box(b'ftyp', b'M4A \x00\x00\x00\x00')
+    return ftyp + box(b'moov', box(b'trak', box(b'mdia', b''.join(mdia_children))))
+
+
+HDLR = box(b'hdlr', b'\x00' * 8 + b'soun' + b'\x00' * 12)
+MDHD = box(b'mdhd', b'\x00' * 12 + struct.pack('>II', 44100, 441000) + b'\x00' * 4)
+
+
+def test_probes_wav_headers(speech_file):
+    metadata = probe_audio(speech_file(seconds=2.0), 'wav')
+
+    assert (metadata.format, metadata.sample_rate, metadata.channels, metadata.frames) == ('wav', 16000, 1, 32000)
+
+
+def test_wav_content_with_other_extension_is_rejected(speech_file):
+    with pytest.raises(AudioFormatError):
+        probe_audio(speech_file(seconds=1.0), 'mp3')
+
+
+@pytest.mark.parametrize('children', [
+    (MDHD,),  # no hdlr
+    (HDLR,),  # no mdhd
+    (HDLR, MDHD),  # no minf/stbl/stsd
+], ids=['hdlr', 'mdhd', 'stsd'])
+def test_mp4_missing_boxes_are_format_errors(children):
+    with pytest.raises(AudioFormatError):
+        probe_audio(io.BytesIO(mp4(*children)), 'mp4')
+
+
+def test_truncated_mp4_is_format_error():
+    with pytest.raises(AudioFormatError):
+        probe_audio(io.BytesIO(mp4(HDLR, MDHD)[:-10]), 'mp4')
@@ -0,0 +1,27 @@
+import warnings
+
+import numpy as np
+import soundfile as sf
+
+from audio_processor.processor import AudioProcessor, calculate_snr, snr_from_power
+
+
+def test_snr_of_silence_is_not_a_division_warning():
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        assert snr_from_power(0.0, 0.01) == float('-inf')
+        assert snr_from_power(0.01, 0.0) == float('inf')
+        assert np.isclose(calculate_snr(np.ones(10), np.full(10, 0.1)), 20.0)
+
+
+def test_silent_recording_processes_without_warnings(tmp_path):
+    path = tmp_path / 'silence.wav'
+    sf.write(str(path), np.zeros(3 * 16000, dtype=np.float32), 16000, subtype='PCM_16')
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', RuntimeWarning)
+        output_path, sample_rate, _ = AudioProcessor(str(path)).process_audio(str(tmp_path / 'out.wav'))
+
+    audio, _ = sf.read(output_path)
+    assert sample_rate == 16000
+    assert not np.any(audio)
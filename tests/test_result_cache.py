@@ -0,0 +1,128 @@
+import asyncio
+import shutil
+import time
+
+import numpy as np
+import soundfile as sf
+
+import audio_processor.processor
+from audio_processor.cache import EnhancedAudioCache, content_digest, content_key
+from audio_processor.encoder import EncodedStream
+from audio_processor.processor import AudioProcessor
+from transcription.deepgram_client import DeepgramTranscriptionClient
+from transcription.fake_deepgram import FakeDeepgram
+from transcription.result_cache import TranscriptCache
+
+OPTIONS = {'model': 'nova-2', 'diarize': 'true'}
+RESPONSE = {'results': {'channels': [{'alternatives': [{'transcript': 'hello', 'words': []}]}]}}
+
+
+def test_key_depends_on_content_and_options(speech_file, tmp_path):
+    cache = TranscriptCache(str(tmp_path / 'cache'))
+    original = speech_file(seconds=1.0)
+    renamed = str(tmp_path / 'renamed.wav')
+    shutil.copyfile(original, renamed)
+
+    assert cache.key(original, OPTIONS) == cache.key(renamed, OPTIONS)
+    assert cache.key(original, OPTIONS) != cache.key(original, dict(OPTIONS, diarize='false'))
+    assert cache.key(b'audio', OPTIONS) == cache.key(bytearray(b'audio'), dict(reversed(list(OPTIONS.items()))))
+    assert cache.key(b'audio', OPTIONS) != cache.key(b'other', OPTIONS)
+
+
+def test_expired_entry_is_a_miss(tmp_path):
+    cache = TranscriptCache(str(tmp_path), ttl_seconds=0.1)
+    cache.put('k' * 64, RESPONSE, OPTIONS)
+    assert cache.get('k' * 64) == RESPONSE
+
+    time.sleep(0.2)
+
+    assert cache.get('k' * 64) is None
+    assert cache.stats()['expirations'] == 1
+
+
+def test_stream_key_depends_on_upload_and_enhancement(speech_file, tmp_path):
+    client = DeepgramTranscriptionClient(api_key='key', cache=TranscriptCache(str(tmp_path / 'cache')))
+    path = speech_file(seconds=1.0)
+    params = AudioProcessor(path, tier='auto').cache_params()
+
+    key = client.stream_cache_key(path, params)
+
+    assert key == client.stream_cache_key(path, dict(params))
+    assert key != client.stream_cache_key(path, dict(params, tier='full'))
+    assert key != client.stream_cache_key(speech_file(seconds=1.0, name='other.wav', seed=1), params)
+    assert DeepgramTranscriptionClient(api_key='key').stream_cache_key(path, params) is None
+
+
+def test_keys_from_a_shared_digest_match_keys_from_the_file(speech_file, tmp_path):
+    path = speech_file(seconds=1.0)
+    digest = content_digest(path)
+
+    assert content_key(path, OPTIONS, digest=digest) == content_key(path, OPTIONS)
+    assert TranscriptCache(str(tmp_path)).key(path, OPTIONS, digest) == content_key(path, OPTIONS)
+    # The shared digest is not consumed by a key
+    assert content_key(path, {'other': 1}, digest=digest) == content_key(path, {'other': 1})
+
+
+def test_upload_is_hashed_once_for_both_caches(speech_file, tmp_path, monkeypatch):
+    hashed = []
+    monkeypatch.setattr(
+        audio_processor.processor, 'content_digest', lambda path: hashed.append(path) or content_digest(path)
+    )
+    client = DeepgramTranscriptionClient(api_key='key', cache=TranscriptCache(str(tmp_path / 'transcripts')))
+    path = speech_file(seconds=1.0)
+    processor = AudioProcessor(path, cache=EnhancedAudioCache(str(tmp_path / 'enhanced')))
+
+    key = client.stream_cache_key(path, processor.cache_params(), processor.content_digest())
+    processor.process_audio()
+
+    assert hashed == [path]
+    assert key == client.stream_cache_key(path, processor.cache_params())
+
+
+async def stream_job(client, processor, cache_key):
+    stream = EncodedStream(cancel_token=processor.cancel_token)
+    upload = asyncio.create_task(client.transcribe_stream(
+        stream, stream.content_type, time_map=lambda: processor.time_map, cache_key=cache_key
+    ))
+    await asyncio.to_thread(processor.process_audio, None, stream)
+    return await upload
+
+
+def spoken_file(path, sample_rate=16000):
+    """10 s of near-silence with 1 kHz bursts at 1 s and 7 s, so compaction cuts the gap"""
+    audio = 1e-4 * np.random.default_rng(0).standard_normal(10 * sample_rate)
+    t = np.arange(sample_rate) / sample_rate
+    for start in (1, 7):
+        audio[start * sample_rate:(start + 1) * sample_rate] += 0.3 * np.sin(2 * np.pi * 1000 * t)
+    sf.write(str(path), audio, sample_rate, subtype='PCM_16')
+    return str(path)
+
+
+def test_streamed_transcript_is_stored_under_its_stream_key(tmp_path):
+    cache = TranscriptCache(str(tmp_path / 'cache'))
+    path = spoken_file(tmp_path / 'spoken.wav')
+    server = FakeDeepgram()
+
+    async def run():
+        url = await server.start()
+        client = DeepgramTranscriptionClient(api_key='key', base_url=url, cache=cache)
+        try:
+            processor = AudioProcessor(path, vad=True, compact=True)
+            key = client.stream_cache_key(path, processor.cache_params())
+            result = await stream_job(client, processor, key)
+
+            # A resubmitted recording finds the transcript before any upload
+            resubmitted = AudioProcessor(path, vad=True, compact=True)
+            response = cache.get(client.stream_cache_key(path, resubmitted.cache_params()))
+            await asyncio.to_thread(resubmitted.process_audio, None)
+            return result, client.response_result(response, time_map=resubmitted.time_map)
+        finally:
+            await client.close()
+            await server.stop()
+
+    result, cached = asyncio.run(run())
+
+    assert server.stats()['requests'] == 1
+    assert cached == result
+    # Word times of the cached response are mapped back to the recording too
+    assert max(word['start'] for word in cached['words']) > 6.5
@@ -0,0 +1,80 @@
+import asyncio
+import threading
+import time
+
+from transcription.scheduler import RequestScheduler
+
+
+def run_in_loops(scheduler, loops, requests, hold=0.05):
+    """Send requests through scheduler from each of loops event loops in their own threads; returns peak in flight"""
+    lock = threading.Lock()
+    active = [0, 0]  # current, peak
+
+    async def request():
+        async with scheduler.slot():
+            with lock:
+                active[0] += 1
+                active[1] = max(active[1], active[0])
+            await asyncio.sleep(hold)
+            with lock:
+                active[0] -= 1
+
+    async def many():
+        await asyncio.gather(*(request() for _ in range(requests)))
+
+    threads = [threading.Thread(target=asyncio.run, args=(many(),)) for _ in range(loops)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+    return active[1]
+
+
+def test_limit_holds_across_event_loops():
+    scheduler = RequestScheduler(max_in_flight=2)
+
+    peak = run_in_loops(scheduler, loops=3, requests=6)
+
+    assert peak == 2
+    stats = scheduler.stats()
+    assert stats['completed'] == 18
+    assert stats['in_flight'] == stats['queue_depth'] == 0
+
+
+def test_rate_holds_across_event_loops():
+    scheduler = RequestScheduler(max_in_flight=10, rate=20, burst=1)
+    started = time.monotonic()
+
+    run_in_loops(scheduler, loops=2, requests=5, hold=0)
+
+    # Ten starts at 20 per second, the first one free
+    assert time.monotonic() - started >= 9 / 20 - 0.02
+
+
+def test_cancelled_waiter_does_not_lose_a_slot():
+    scheduler = RequestScheduler(max_in_flight=1)
+
+    async def run():
+        release = asyncio.Event()
+
+        async def holder():
+            async with scheduler.slot():
+                await release.wait()
+
+        async def waiter():
+            async with scheduler.slot():
+                pass
+
+        holding = asyncio.create_task(holder())
+        await asyncio.sleep(0)
+        waiting = asyncio.create_task(waiter())
+        await asyncio.sleep(0)
+        waiting.cancel()
+        release.set()
+        await asyncio.gather(holding, waiting, return_exceptions=True)
+
+        # The slot is free again
+        await asyncio.wait_for(waiter(), 1)
+
+    asyncio.run(run())
+    assert scheduler.stats()['in_flight'] == 0
@@ -0,0 +1,152 @@
+import asyncio
+import os
+import time
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from transcription.deepgram_client import DeepgramTranscriptionClient
+from transcription.scheduler import RequestScheduler
+from transcription.segmented import SegmentedTranscriber
+
+
+def transcriber(max_segments=2):
+    return SegmentedTranscriber(DeepgramTranscriptionClient(api_key='key', scheduler=RequestScheduler(max_segments)))
+
+
+def word(text, start, speaker=0):
+    return {'word': text, 'punctuated_word': text, 'start': start, 'end': start + 0.3, 'speaker': speaker}
+
+
+def result(*words):
+    return {'words': list(words), 'confidence': 0.9}
+
+
+def test_overlapping_words_are_kept_from_the_segment_holding_their_start():
+    # Both segments transcribe the overlap from 8 to 12 s around the cut at 10 s
+    first = result(word('one', 1.0), word('two', 8.5), word('three', 9.5), word('four', 10.5), word('five', 11.5))
+    second = result(word('two', 8.52), word('three', 9.48), word('four', 10.5), word('five', 11.5), word('six', 14.0))
+
+    stitched = transcriber().stitch([first, second], [0.0, 10.0, 20.0])
+
+    assert stitched['text'] == 'one two three four five six'
+    assert [w['start'] for w in stitched['words']] == [1.0, 8.5, 9.5, 10.5, 11.5, 14.0]
+    assert stitched['segments'] == 2
+
+
+def test_word_repeated_across_a_cut_is_dropped_once():
+    # Each side places the same word on its own side of the cut
+    first = result(word('hello', 2.0), word('there', 9.9))
+    second = result(word('there', 10.05), word('friend', 11.0))
+
+    stitched = transcriber().stitch([first, second], [0.0, 10.0, 20.0])
+
+    assert stitched['text'] == 'hello there friend'
+
+
+def test_speakers_are_renumbered_by_the_words_they_share_in_the_overlap():
+    # The second request numbers the same two voices the other way round
+    first = result(word('hi', 1.0, 0), word('yes', 8.5, 1), word('no', 9.2, 0))
+    second = result(word('yes', 8.5, 0), word('no', 9.2, 1), word('maybe', 12.0, 1), word('sure', 13.0, 0))
+
+    stitched = transcriber().stitch([first, second], [0.0, 10.0, 20.0])
+
+    assert [(w['word'], w['speaker']) for w in stitched['words']] == [
+        ('hi', 0), ('yes', 1), ('no', 0), ('maybe', 0), ('sure', 1)
+    ]
+    assert [s['speaker_id'] for s in stitched['speakers']] == ['0', '1', '0', '1']
+
+
+def test_speaker_without_shared_words_gets_a_new_id():
+    first = result(word('hi', 1.0, 0), word('yes', 9.0, 0))
+    # The second request's speaker 1 is the first one's speaker 0; its own
+    # speaker 0 only speaks after the overlap, so it is someone new
+    second = result(word('yes', 9.0, 1), word('hello', 15.0, 0))
+
+    stitched = transcriber().stitch([first, second], [0.0, 10.0, 20.0])
+
+    speakers = [(w['word'], w['speaker']) for w in stitched['words']]
+    assert speakers[:2] == [('hi', 0), ('yes', 0)]
+    assert speakers[2][0] == 'hello' and speakers[2][1] != 0
+
+
+def test_cut_falls_in_the_pause_near_its_target(tmp_path):
+    sample_rate = 16000
+    t = np.arange(10 * sample_rate) / sample_rate
+    audio = 0.3 * np.sin(2 * np.pi * 440 * t)
+    audio[int(4.6 * sample_rate):int(5.0 * sample_rate)] = 0
+    path = str(tmp_path / 'speech.wav')
+    sf.write(path, audio, sample_rate, subtype='PCM_16')
+    segmented = transcriber()
+    segmented.MIN_SEGMENT_SECONDS = 4.0
+
+    cuts = segmented.plan(path, sf.info(path))
+
+    assert len(cuts) == 3 and cuts[0] == 0 and cuts[-1] == 10 * sample_rate
+    assert 4.6 <= cuts[1] / sample_rate <= 5.0
+
+
+def segmented_job(tmp_path):
+    """A transcriber cutting 10 s files into two segments in a work directory of its own, and such a file"""
+    sample_rate = 16000
+    path = str(tmp_path / 'enhanced.wav')
+    audio = 0.3 * np.sin(2 * np.pi * 440 * np.arange(10 * sample_rate) / sample_rate)
+    sf.write(path, audio, sample_rate, subtype='PCM_16')
+    work_dir = tmp_path / 'segments'
+    work_dir.mkdir()
+    segmented = SegmentedTranscriber(
+        DeepgramTranscriptionClient(api_key='key', base_url='http://127.0.0.1:9', scheduler=RequestScheduler(2)),
+        work_dir=str(work_dir)
+    )
+    segmented.MIN_SEGMENT_SECONDS = 4.0
+    return segmented, path, work_dir
+
+
+def test_segment_written_as_the_job_is_cancelled_is_removed(tmp_path, monkeypatch):
+    segmented, path, work_dir = segmented_job(tmp_path)
+    write_segment = segmented._write_segment
+
+    async def run():
+        job = asyncio.current_task()
+
+        def cancelling_write(*args):
+            # The job is cancelled as its second segment is written, before
+            # the path gets back to it
+            second = bool(os.listdir(work_dir))
+            segment = write_segment(*args)
+            if second:
+                job.get_loop().call_soon_threadsafe(job.cancel)
+                time.sleep(0.2)
+            return segment
+
+        monkeypatch.setattr(segmented, '_write_segment', cancelling_write)
+        try:
+            await segmented.transcribe(path)
+        finally:
+            await segmented.client.close()
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(run())
+
+    assert os.listdir(work_dir) == []
+    assert not os.path.exists(path)
+
+
+def test_segments_of_uploads_that_never_ran_are_removed(tmp_path, monkeypatch):
+    segmented, path, work_dir = segmented_job(tmp_path)
+
+    async def never_finishes(segment, time_map=None):
+        # Stands in for an upload cancelled before it could remove its segment
+        await asyncio.sleep(3600)
+
+    monkeypatch.setattr(segmented.client, 'transcribe_file', never_finishes)
+
+    async def run():
+        asyncio.get_running_loop().call_later(0.5, asyncio.current_task().cancel)
+        await segmented.transcribe(path)
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(run())
+
+    assert os.listdir(work_dir) == []
@@ -0,0 +1,63 @@
+import numpy as np
+
+from audio_processor.vad import SilenceSplicer, SpeechIndex, TimeMap, VoiceActivityDetector
+
+
+def bursts(sample_rate=16000):
+    """6 s of near-silence with 1 kHz bursts at 1-1.5 s and 4-4.5 s"""
+    rng = np.random.default_rng(0)
+    audio = 1e-4 * rng.standard_normal(6 * sample_rate)
+    t = np.arange(sample_rate // 2) / sample_rate
+    for start in (1, 4):
+        audio[start * sample_rate:start * sample_rate + len(t)] += 0.3 * np.sin(2 * np.pi * 1000 * t)
+    return audio.astype(np.float32)[:, np.newaxis]
+
+
+def test_detects_speech_regions_in_float32():
+    audio = bursts()
+    blocks = [audio[start:start + 7000] for start in range(0, len(audio), 7000)]
+
+    index = VoiceActivityDetector(16000).detect(blocks)
+
+    assert index.energy_db.dtype == np.float32
+    assert index.duration == 6.0
+    # Each burst padded by PAD_SECONDS, with the silence between them cut
+    assert len(index.regions) == 2
+    assert np.allclose(index.regions, [[0.7, 1.8], [3.7, 4.8]], atol=0.05)
+
+
+def test_time_map_places_splice_points_by_side():
+    time_map = TimeMap([(0.0, 1.0, 2.0), (2.0, 5.0, 1.0)])
+
+    assert time_map.to_original(0.5) == 1.5
+    assert time_map.to_original(2.0, side='right') == 5.0
+    assert time_map.to_original(2.0, side='left') == 3.0
+
+
+def splice(regions, seconds=4.0, sample_rate=16000):
+    """Compact then expand a constant signal; returns the splicer, compacted and expanded audio"""
+    index = SpeechIndex(np.array(regions, dtype=float), seconds, 0.02, None, None, None)
+    splicer = SilenceSplicer(index, sample_rate)
+    audio = np.ones((int(seconds * sample_rate), 1), dtype=np.float32)
+    blocks = [audio[start:start + 7000] for start in range(0, len(audio), 7000)]
+    compacted = np.concatenate(list(splicer.compact(blocks)))
+    expanded = np.concatenate(list(splicer.expand([compacted[:, 0]], 1)))
+    return splicer, compacted[:, 0], expanded
+
+
+def test_last_region_fades_out_before_trailing_silence():
+    splicer, compacted, expanded = splice([[1.0, 2.0], [2.5, 3.0]])
+
+    assert compacted[-1] < 0.01
+    assert np.isclose(compacted[-splicer.fade // 2], 0.5)
+    # No step into the zeros put back after 3 s
+    assert expanded[3 * 16000 - 1] < 0.01
+    assert not expanded[3 * 16000:].any()
+    assert len(expanded) == 4 * 16000
+
+
+def test_regions_at_the_recording_edges_are_not_faded():
+    _, compacted, _ = splice([[0.0, 1.0], [3.0, 4.0]])
+
+    assert compacted[0] == 1.0
+    assert compacted[-1] == 1.0
@@ -1,10 +1,12 @@
 import os
+import io
+import json
 import logging
 import asyncio
-import mimetypes
+import threading
 from typing import Optional, Dict, Any, List
 from datetime import datetime
-from deepgram import DeepgramClient, PrerecordedOptions
+import aiohttp
 from tenacity import (
     retry,
     stop_after_attempt,
@@ -12,6 +14,11 @@ from tenacity import (
     retry_if_exception_type
 )
 import time
+from email.utils import parsedate_to_datetime
+from audio_processor.probe import probe_audio
+from audio_processor.exceptions import AudioFormatError
+from transcription.scheduler import RequestScheduler
+from transcription.result_cache import TranscriptCache
 
 logger = logging.getLogger(__name__)
 
@@ -35,10 +42,121 @@ class DeepgramValidationError(DeepgramError):
     """Raised when file validation fails"""
     pass
 
+class DeepgramRetryableError(DeepgramError):
+    """
+    Raised for failures worth retrying: connection errors, timeouts, 429 and
+    5xx responses; retry_after is the delay the server asked for, if any
+    """
+    def __init__(self, message: str, status_code: Optional[int] = None, response_data: Optional[Dict] = None,
+                 retry_after: Optional[float] = None):
+        super().__init__(message, status_code, response_data)
+        self.retry_after = retry_after
+
+# Longest Retry-After honoured; a longer one is cut short rather than
+# holding the job for it
+MAX_RETRY_AFTER = 60
+_backoff = wait_exponential(multiplier=1, min=4, max=10)
+
+def _retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header: delay seconds or an HTTP date"""
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+def _retry_wait(retry_state):
+    # The server's Retry-After when it gave one, exponential backoff otherwise
+    retry_after = getattr(retry_state.outcome.exception(), 'retry_after', None)
+    if retry_after is not None:
+        return retry_after
+    return _backoff(retry_state)
+
+def _log_retry(retry_state):
+    client = retry_state.args[0]
+    client.retries += 1
+    logger.warning(f"Retry attempt {retry_state.attempt_number} after {retry_state.outcome.exception()}")
+
+class _RequestBody:
+    """
+    Request body from a file path, a bytes-like buffer or an async iterable
+    of bytes; counts the bytes read. Leaving it closes the iterable, so its
+    producer learns at once that a failed request stopped reading.
+    """
+    def __init__(self, source: Any):
+        self.source = source
+        self.replayable = not hasattr(source, '__aiter__')
+        self.bytes_read = 0
+        self._file = None
+        self._chunks = None
+
+    async def __aenter__(self):
+        self.bytes_read = 0
+        if isinstance(self.source, (str, os.PathLike)):
+            self._file = open(self.source, 'rb')
+            self.bytes_read = os.fstat(self._file.fileno()).st_size
+            return self._file
+        if self.replayable:
+            self.bytes_read = memoryview(self.source).nbytes
+            return self.source
+        self._chunks = self.source.__aiter__()
+        return self._stream()
+
+    async def __aexit__(self, *exc_info):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._chunks is not None and hasattr(self._chunks, 'aclose'):
+            await self._chunks.aclose()
+        return False
+
+    async def _stream(self):
+        while True:
+            try:
+                chunk = await self._chunks.__anext__()
+            except StopAsyncIteration:
+                return
+            self.bytes_read += len(chunk)
+            yield chunk
+
 class DeepgramTranscriptionClient:
+    """
+    Pre-recorded transcription over one pooled, keep-alive HTTP session
+    
+    One client is meant to live for the whole process (see shared()): its
+    aiohttp session keeps up to max_connections connections to Deepgram
+    open between jobs, and every request goes through its RequestScheduler,
+    which bounds the requests in flight and rate-limits their starts. The
+    API URL is configurable (DEEPGRAM_API_URL), so the client can be pointed
+    at a local stand-in for Deepgram.
+    """
     # Maximum file size (100MB)
     MAX_FILE_SIZE = 100 * 1024 * 1024
     
+    DEFAULT_API_URL = 'https://api.deepgram.com'
+    LISTEN_PATH = '/v1/listen'
+    TRANSCRIPTION_OPTIONS = {
+        'model': 'nova-2',
+        'language': 'en-US',
+        'smart_format': 'true',
+        'punctuate': 'true',
+        'diarize': 'true',
+        'utterances': 'true'
+    }
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+    KEEPALIVE_SECONDS = 60
+    CONNECT_TIMEOUT = 10
+    # Deepgram answers a pre-recorded request once the whole file is transcribed
+    READ_TIMEOUT = 600
+    
+    _shared = None
+    _shared_lock = threading.Lock()
+    
     # Supported MIME types and their extensions
     SUPPORTED_FORMATS = {
         'audio/wav': ['.wav'],
@@ -51,22 +169,100 @@ class DeepgramTranscriptionClient:
         'audio/mp4': ['.mp4']
     }
     
-    def __init__(self):
-        """Initialize the Deepgram client with API key from environment"""
-        self.api_key = os.environ.get('DEEPGRAM_API_KEY')
-        if not self.api_key:
-            raise DeepgramError("Deepgram API key not found in environment variables")
-            
-        self.client = DeepgramClient(self.api_key)
-        logger.info("Deepgram client initialized")
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 scheduler: Optional[RequestScheduler] = None, max_connections: Optional[int] = None,
+                 cache: Optional[TranscriptCache] = None):
+        """
+        Initialize the Deepgram client; unset arguments come from the environment
+        
+        Args:
+            api_key: Deepgram API key (DEEPGRAM_API_KEY); checked when a request is made
+            base_url: API URL (DEEPGRAM_API_URL, by default Deepgram's)
+            scheduler: RequestScheduler for the requests (by default one with
+                DEEPGRAM_MAX_IN_FLIGHT requests in flight, DEEPGRAM_RATE_PER_SECOND
+                starts per second and a burst of DEEPGRAM_BURST)
+            max_connections: size of the connection pool (by default the
+                scheduler's max_in_flight)
+            cache: optional TranscriptCache answering repeated requests for
+                the same audio and options
+        """
+        self.api_key = api_key or os.environ.get('DEEPGRAM_API_KEY')
+        self.base_url = (base_url or os.environ.get('DEEPGRAM_API_URL') or self.DEFAULT_API_URL).rstrip('/')
+        self.scheduler = scheduler or RequestScheduler(
+            int(os.environ.get('DEEPGRAM_MAX_IN_FLIGHT', 4)),
+            float(os.environ.get('DEEPGRAM_RATE_PER_SECOND', 2.0)),
+            int(os.environ.get('DEEPGRAM_BURST', 4))
+        )
+        self.max_connections = max_connections or self.scheduler.max_in_flight
+        self.cache = cache
+        self._session = None
+        self._session_loop = None
+        self.requests = 0
+        self.retries = 0
+        self.upload_bytes = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+        logger.info(f"Deepgram client initialized for {self.base_url}")
+    
+    @classmethod
+    def shared(cls, **options) -> 'DeepgramTranscriptionClient':
+        """The process-wide client, created on first use with options (see __init__)"""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls(**options)
+            return cls._shared
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        # A session belongs to the event loop it was created in
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            trace = aiohttp.TraceConfig()
+            trace.on_connection_create_end.append(self._on_connection_created)
+            trace.on_connection_reuseconn.append(self._on_connection_reused)
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=self.KEEPALIVE_SECONDS),
+                timeout=aiohttp.ClientTimeout(
+                    total=None, sock_connect=self.CONNECT_TIMEOUT, sock_read=self.READ_TIMEOUT
+                ),
+                trace_configs=[trace]
+            )
+            self._session_loop = loop
+        return self._session
+    
+    async def _on_connection_created(self, session, context, params):
+        self.connections_created += 1
+    
+    async def _on_connection_reused(self, session, context, params):
+        self.connections_reused += 1
+    
+    async def close(self) -> None:
+        """Close the pooled connections"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'base_url': self.base_url,
+            'requests': self.requests,
+            'retries': self.retries,
+            'upload_bytes': self.upload_bytes,
+            'max_connections': self.max_connections,
+            'connections_created': self.connections_created,
+            'connections_reused': self.connections_reused,
+            'scheduler': self.scheduler.stats()
+        }
 
-    def _validate_file(self, file_path: str) -> None:
+    def _validate_file(self, file_path: str) -> str:
         """
-        Validate file existence, size, and format
+        Validate file existence, size, and format from its headers
         
         Args:
             file_path: Path to the audio file
             
+        Returns:
+            MIME type of the container found in the file headers
+            
         Raises:
             DeepgramValidationError: If validation fails
         """
@@ -82,35 +278,117 @@ class DeepgramTranscriptionClient:
                     f"File size ({file_size} bytes) exceeds maximum allowed size ({self.MAX_FILE_SIZE} bytes)"
                 )
 
-            # Check MIME type
-            mime_type, _ = mimetypes.guess_type(file_path)
-            if not mime_type:
-                raise DeepgramValidationError("Could not determine file type")
-
+            # Identify the container from its headers, and check it matches
+            # the extension
             file_ext = os.path.splitext(file_path)[1].lower()
+            try:
+                metadata = probe_audio(file_path, file_ext.lstrip('.'))
+            except AudioFormatError as e:
+                raise DeepgramValidationError(f"Invalid audio file: {e.message}")
+
+            mime_type = metadata.mime_type
             if mime_type not in self.SUPPORTED_FORMATS or \
                file_ext not in self.SUPPORTED_FORMATS[mime_type]:
                 raise DeepgramValidationError(f"Unsupported file format: {mime_type}")
 
-            logger.debug(f"File validation successful: {file_path} ({mime_type}, {file_size} bytes)")
+            logger.debug(f"File validation successful: {file_path} ({metadata}, {file_size} bytes)")
+            return mime_type
         finally:
             duration = time.time() - start_time
             logger.info(f"File validation completed in {duration:.2f}s")
 
     @retry(
-        retry=retry_if_exception_type((ConnectionError, TimeoutError)),
+        retry=retry_if_exception_type(DeepgramRetryableError),
         stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=4, max=10),
-        before_sleep=lambda retry_state: logger.warning(
-            f"Retry attempt {retry_state.attempt_number} after {retry_state.outcome.exception()}"
-        )
+        wait=_retry_wait,
+        before_sleep=_log_retry,
+        reraise=True
     )
-    async def transcribe_file(self, file_path: str) -> Dict[str, Any]:
+    async def _request(self, body: '_RequestBody', mime_type: str) -> Dict[str, Any]:
+        """
+        POST the body to the listen endpoint once a scheduler slot is free;
+        returns the parsed response. An error response is raised while the
+        slot is held, so the scheduler counts the request as failed.
+        """
+        if not self.api_key:
+            raise DeepgramError("Deepgram API key not found in environment variables")
+        
+        # A stream is consumed by the attempt that sends it, so its failures are final
+        retryable = DeepgramRetryableError if body.replayable else DeepgramError
+        async with self.scheduler.slot():
+            session = self._get_session()
+            self.requests += 1
+            try:
+                async with body as data:
+                    async with session.post(
+                        self.base_url + self.LISTEN_PATH,
+                        params=self.TRANSCRIPTION_OPTIONS,
+                        data=data,
+                        headers={'Authorization': f'Token {self.api_key}', 'Content-Type': mime_type}
+                    ) as response:
+                        text = await response.text()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                raise retryable(f"Request to Deepgram failed: {str(e) or e.__class__.__name__}")
+            finally:
+                self.upload_bytes += body.bytes_read
+            
+            try:
+                data = json.loads(text) if text else None
+            except ValueError:
+                data = {'body': text[:1000]}
+            if response.status >= 400:
+                message = (data or {}).get('err_msg') or (data or {}).get('error') or response.reason
+                message = f"Deepgram returned {response.status}: {message}"
+                if response.status in self.RETRY_STATUSES and body.replayable:
+                    retry_after = _retry_after(response.headers.get('Retry-After')) if response.status == 429 else None
+                    raise DeepgramRetryableError(message, response.status, data, retry_after=retry_after)
+                raise DeepgramError(message, response.status, data)
+            return data
+    
+    async def transcribe_file(self, file_path: str, time_map: Optional[Any] = None) -> Dict[str, Any]:
         """
-        Transcribe an audio file using Deepgram's API with retry logic
+        Transcribe an audio file using Deepgram's API, retrying connection
+        errors, timeouts, 429 and 5xx responses; the file is removed afterwards
         
         Args:
             file_path: Path to the audio file
+            time_map: TimeMap of a file with silence spliced out; word and
+                speaker times are mapped back to the original recording
+            
+        Returns:
+            Dict containing transcription results
+            
+        Raises:
+            DeepgramError: If transcription fails
+        """
+        try:
+            return await self._transcribe(file_path, None, time_map, file_path)
+        finally:
+            # Cleanup
+            try:
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+                    logger.debug(f"Cleaned up temporary file: {file_path}")
+            except Exception as e:
+                logger.error(f"Error cleaning up file {file_path}: {str(e)}")
+
+    async def transcribe_stream(self, source: Any, mime_type: str, time_map: Optional[Any] = None,
+                                cache_key: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Transcribe audio from memory: a bytes-like buffer or BytesIO, or an
+        async iterable of bytes (such as an EncodedStream) that is uploaded
+        as it is produced. A buffer is retried like a file; a stream can only
+        be sent once, so its failures are not retried.
+        
+        Args:
+            source: the encoded audio
+            mime_type: its MIME type
+            time_map: TimeMap of audio with silence spliced out, or a callable
+                returning it once the upload has finished (a streaming job's
+                TimeMap is only known when its stream ends)
+            cache_key: transcript cache key of a stream (see stream_cache_key),
+                under which the response is stored; the caller looks it up
+                before starting the stream
             
         Returns:
             Dict containing transcription results
@@ -118,52 +396,75 @@ class DeepgramTranscriptionClient:
         Raises:
             DeepgramError: If transcription fails
         """
+        if isinstance(source, io.BytesIO):
+            source = source.getbuffer()
+        description = 'stream' if hasattr(source, '__aiter__') else f'buffer of {memoryview(source).nbytes} bytes'
+        return await self._transcribe(source, mime_type, time_map, description, cache_key)
+    
+    def stream_cache_key(self, upload_path: str, enhancement_params: Dict[str, Any],
+                         content_digest: Optional[Any] = None) -> Optional[str]:
+        """
+        Transcript cache key of audio enhanced from upload_path with
+        enhancement_params (see AudioProcessor.cache_params) and streamed as
+        it is produced, or None without a cache. A stream's bytes are only
+        known once it is sent, so it is keyed on what determines them.
+        content_digest is the upload's, if it has been computed already
+        (see AudioProcessor.content_digest).
+        """
+        if self.cache is None:
+            return None
+        return self.cache.key(
+            upload_path, {'enhancement': enhancement_params, 'transcription': self.TRANSCRIPTION_OPTIONS},
+            content_digest
+        )
+    
+    def response_result(self, response: Dict[str, Any], time_map: Optional[Any] = None) -> Dict[str, Any]:
+        """Result of a Deepgram response, such as a cached one, with word times mapped through time_map"""
+        channel, transcript = self._parse_response(response)
+        return self._result(channel, transcript, time_map)
+    
+    async def _transcribe(self, source: Any, mime_type: Optional[str], time_map: Optional[Any],
+                          description: str, cache_key: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Upload source (a path when mime_type is None, validated first) and
+        parse the response. A file or buffer is looked up in the cache
+        first; a stream is only stored, under cache_key.
+        """
         start_time = time.time()
         metrics = {
-            'file_path': file_path,
+            'source': description,
             'start_time': datetime.utcnow().isoformat()
         }
 
         try:
             # Validate file before processing
-            self._validate_file(file_path)
-
-            # Configure transcription options
-            options = PrerecordedOptions(
-                smart_format=True,
-                punctuate=True,
-                diarize=True,
-                utterances=True,
-                model="nova-2",
-                language="en-US"
-            )
-
-            logger.info(f"Starting transcription for file: {file_path}")
-            
-            # Determine file mimetype
-            mime_type, _ = mimetypes.guess_type(file_path)
-            if not mime_type:
-                mime_type = 'audio/wav'  # Default to wav if unable to determine
+            if mime_type is None:
+                mime_type = self._validate_file(source)
 
-            with open(file_path, 'rb') as audio:
-                response = await self.client.listen.prerecorded.v("1").transcribe_file(audio, options)
+            # Audio already transcribed with the same options costs no request
+            body = _RequestBody(source)
+            response = None
+            if self.cache is None:
+                cache_key = None
+            elif body.replayable:
+                cache_key = await asyncio.to_thread(self.cache.key, source, self.TRANSCRIPTION_OPTIONS)
+                response = self.cache.get(cache_key)
+            metrics['cached'] = response is not None
 
-            # Process response
-            if not response or not isinstance(response, dict) or 'results' not in response:
-                raise DeepgramError("Invalid response format from Deepgram")
+            if response is None:
+                logger.info(f"Starting transcription for {description} ({mime_type})")
+                response = await self._request(body, mime_type)
+                metrics['upload_bytes'] = body.bytes_read
 
-            try:
-                results = response['results']
-                if not results.get('channels'):
-                    raise DeepgramError("No channels found in transcription results")
+            channel, transcript = self._parse_response(response)
 
-                channel = results['channels'][0]
-                if not channel.get('alternatives'):
-                    raise DeepgramError("No alternatives found in transcription results")
+            # Stored before word times are mapped, which rewrites them in place
+            if cache_key is not None and not metrics['cached']:
+                await asyncio.to_thread(self.cache.put, cache_key, response, self.TRANSCRIPTION_OPTIONS)
 
-                transcript = channel['alternatives'][0]
-            except (KeyError, IndexError) as e:
-                raise DeepgramError(f"Invalid response structure: {str(e)}")
+            if callable(time_map):
+                time_map = time_map()
+            result = self._result(channel, transcript, time_map)
 
             # Log success metrics
             duration = time.time() - start_time
@@ -174,13 +475,7 @@ class DeepgramTranscriptionClient:
                 'confidence': transcript.get('confidence', 0)
             })
             logger.info(f"Transcription metrics: {metrics}")
-
-            return {
-                'text': transcript.get('transcript', ''),
-                'confidence': transcript.get('confidence', 0),
-                'words': transcript.get('words', []),
-                'speakers': self._extract_speakers(channel)
-            }
+            return result
 
         except Exception as e:
             # Log error metrics
@@ -197,14 +492,44 @@ class DeepgramTranscriptionClient:
                 raise
             raise DeepgramError(f"Transcription error: {str(e)}")
 
-        finally:
-            # Cleanup
-            try:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                    logger.debug(f"Cleaned up temporary file: {file_path}")
-            except Exception as e:
-                logger.error(f"Error cleaning up file {file_path}: {str(e)}")
+    def _parse_response(self, response: Any):
+        """The first channel and its first alternative of a response"""
+        if not response or not isinstance(response, dict) or 'results' not in response:
+            raise DeepgramError("Invalid response format from Deepgram")
+
+        try:
+            results = response['results']
+            if not results.get('channels'):
+                raise DeepgramError("No channels found in transcription results")
+
+            channel = results['channels'][0]
+            if not channel.get('alternatives'):
+                raise DeepgramError("No alternatives found in transcription results")
+
+            return channel, channel['alternatives'][0]
+        except (KeyError, IndexError) as e:
+            raise DeepgramError(f"Invalid response structure: {str(e)}")
+
+    def _result(self, channel: Dict, transcript: Dict, time_map: Optional[Any]) -> Dict[str, Any]:
+        """Result of a parsed response, with word times mapped through time_map"""
+        if time_map is not None:
+            self._map_word_times(transcript.get('words', []), time_map)
+        return {
+            'text': transcript.get('transcript', ''),
+            'confidence': transcript.get('confidence', 0),
+            'words': transcript.get('words', []),
+            'speakers': self._extract_speakers(channel)
+        }
+
+    def _map_word_times(self, words: List[Dict[str, Any]], time_map: Any) -> None:
+        """Rewrite word start/end times in place from compacted to original time"""
+        if not words:
+            return
+        starts = time_map.to_original([word.get('start', 0) for word in words], side='right')
+        ends = time_map.to_original([word.get('end', 0) for word in words], side='left')
+        for word, start, end in zip(words, starts, ends):
+            word['start'] = float(start)
+            word['end'] = float(max(start, end))
 
     def _extract_speakers(self, channel_data: Dict) -> List[Dict[str, Any]]:
         """Extract speaker information from channel data"""
@@ -6,6 +6,7 @@ from typing import Optional, Dict, Any
 from datetime import datetime
 from deepgram import (
     DeepgramClient,
+    DeepgramClientOptions,
     LiveOptions,
     LiveTranscriptionEvents
 )
@@ -20,7 +21,11 @@ class DeepgramStreamingClient:
         if not self.api_key:
             raise ValueError("Deepgram API key not found in environment variables")
             
-        self.client = DeepgramClient(api_key=self.api_key)
+        # DEEPGRAM_API_URL points the client at another server, such as the
+        # local stand-in in transcription.fake_deepgram
+        url = os.environ.get('DEEPGRAM_API_URL')
+        config = DeepgramClientOptions(url=url) if url else None
+        self.client = DeepgramClient(api_key=self.api_key, config=config)
         self.active_connections = {}  # Store connection info with metrics
         self.reconnect_attempts = {}  # Track reconnection attempts per connection
         self.max_reconnect_attempts = 3
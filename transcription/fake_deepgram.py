@@ -0,0 +1,635 @@
+"""Local stand-in for the Deepgram API, for offline load and latency testing.
+
+FakeDeepgram serves the two endpoints the service talks to:
+
+* ``POST /v1/listen``: pre-recorded transcription. The body is decoded (any
+  format libsndfile reads), its speech regions are found with the
+  VoiceActivityDetector, and words are synthesized over them at a speaking
+  rate, with speakers changing between regions when diarize is requested.
+  The response has Deepgram's layout (metadata, channels, alternatives,
+  words with punctuated_word and speaker, utterances). Words are drawn from
+  a generator seeded with the audio's hash, so the same audio always gets
+  the same transcript.
+* ``GET /v1/listen`` upgraded to a WebSocket: live transcription of
+  linear16 audio. Utterances are detected on 20 ms frames as the audio
+  arrives. The server sends Results messages (interim ones with
+  interim_results, a final one with speech_final at the end of each
+  utterance), SpeechStarted with vad_events, UtteranceEnd with
+  utterance_end_ms, and a closing Metadata message after CloseStream.
+
+Its behaviour is configurable, to reproduce production conditions offline:
+
+* latency: distribution of the delay added to every pre-recorded response
+  (see LatencyModel), plus realtime_factor seconds per second of audio,
+* error_rate: share of pre-recorded requests answered with a 5xx,
+* max_concurrent, rate_limit and burst: requests beyond either limit are
+  answered 429 with a Retry-After, as Deepgram throttles,
+* read_bytes_per_second: request bodies are read no faster than this, for
+  slow uploads,
+* live_latency: delay before each live message, for slow streams; the
+  delays add up when they exceed the gap between messages.
+
+Point the clients at it with DEEPGRAM_API_URL=http://HOST:PORT (with any
+DEEPGRAM_API_KEY unless the server was given one), or pass base_url to
+DeepgramTranscriptionClient. GET /stats returns the server's counters.
+
+``python -m transcription.fake_deepgram serve`` runs a server;
+``python -m transcription.fake_deepgram load --url URL`` drives one (or the
+real API) with concurrent requests through DeepgramTranscriptionClient and
+reports latency percentiles, failures and the client's stats as JSON. With
+--pipeline each request runs the whole job, enhancement streamed into the
+upload as the API does, so end-to-end benchmarks run on an offline box.
+"""
+
+import argparse
+import asyncio
+import collections
+import hashlib
+import io
+import json
+import logging
+import math
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+import numpy as np
+import soundfile as sf
+from aiohttp import web
+
+from audio_processor.benchmark import SyntheticCorpus, NOISE_TYPES
+from audio_processor.encoder import EncodedStream
+from audio_processor.probe import probe_audio
+from audio_processor.processor import AudioProcessor
+from audio_processor.vad import VoiceActivityDetector
+from transcription.deepgram_client import DeepgramTranscriptionClient, DeepgramError
+from transcription.scheduler import RequestScheduler, TokenBucket
+
+logger = logging.getLogger(__name__)
+
+MODEL_ID = '1dbdfb4d-85b2-4659-9831-16b3c76229aa'
+VOCABULARY = (
+    'the', 'a', 'we', 'you', 'they', 'it', 'is', 'was', 'have', 'will', 'can', 'not', 'and', 'but', 'so',
+    'that', 'this', 'there', 'what', 'when', 'about', 'with', 'from', 'into', 'over', 'after', 'before',
+    'time', 'people', 'way', 'day', 'thing', 'work', 'part', 'place', 'case', 'point', 'number', 'question',
+    'think', 'know', 'see', 'make', 'take', 'going', 'right', 'really', 'just', 'also', 'then', 'well',
+    'meeting', 'report', 'record', 'court', 'witness', 'answer', 'counsel', 'date', 'office'
+)
+
+
+class LatencyModel:
+    """
+    Seconds drawn from a distribution given as 'fixed:SECONDS',
+    'uniform:LOW,HIGH', 'lognormal:MEDIAN,SIGMA' or 'pareto:MINIMUM,ALPHA'
+    (heavy-tailed, for tail latency)
+    """
+    PARAMETERS = {'fixed': 1, 'uniform': 2, 'lognormal': 2, 'pareto': 2}
+
+    def __init__(self, spec='fixed:0'):
+        kind, _, values = spec.partition(':')
+        try:
+            params = [float(value) for value in values.split(',')] if values else []
+        except ValueError:
+            params = None
+        if kind not in self.PARAMETERS or params is None or len(params) != self.PARAMETERS[kind]:
+            raise ValueError(f"Invalid latency distribution: {spec}")
+        self.spec = spec
+        self.kind = kind
+        self.params = params
+
+    def sample(self, rng):
+        if self.kind == 'fixed':
+            return self.params[0]
+        if self.kind == 'uniform':
+            return float(rng.uniform(*self.params))
+        if self.kind == 'lognormal':
+            median, sigma = self.params
+            return median * math.exp(sigma * rng.standard_normal())
+        minimum, alpha = self.params
+        return minimum * (1.0 + float(rng.pareto(alpha)))
+
+
+def _synthesize_words(regions, rng, diarize, punctuate, speakers):
+    """Words spread over (start, end) speech regions; returns the words and one utterance per region"""
+    words = []
+    utterances = []
+    speaker = 0
+    for index, (start, end) in enumerate(regions):
+        # Speakers take turns between regions
+        if index and diarize and speakers > 1 and rng.random() < 0.6:
+            speaker = (speaker + int(rng.integers(1, speakers))) % speakers
+        count = max(1, int(round((end - start) * FakeDeepgram.WORDS_PER_SECOND)))
+        slot = (end - start) / count
+        region_words = []
+        for position in range(count):
+            text = VOCABULARY[int(rng.integers(len(VOCABULARY)))]
+            punctuated = text
+            if punctuate:
+                punctuated = text.capitalize() if position == 0 else text
+                punctuated += '.' if position == count - 1 else ''
+            word = {
+                'word': text,
+                'start': round(start + (position + 0.1) * slot, 3),
+                'end': round(start + (position + 0.9) * slot, 3),
+                'confidence': round(float(rng.uniform(0.85, 0.999)), 4),
+                'punctuated_word': punctuated
+            }
+            if diarize:
+                word['speaker'] = speaker
+                word['speaker_confidence'] = round(float(rng.uniform(0.5, 0.95)), 4)
+            region_words.append(word)
+        words.extend(region_words)
+        utterances.append({
+            'start': region_words[0]['start'],
+            'end': region_words[-1]['end'],
+            'confidence': _mean_confidence(region_words),
+            'channel': 0,
+            'transcript': _transcript(region_words),
+            'words': region_words,
+            'speaker': speaker if diarize else None,
+            'id': str(uuid.UUID(int=int(rng.integers(2 ** 63)) << 64 | index))
+        })
+    return words, utterances
+
+
+def _transcript(words):
+    return ' '.join(word['punctuated_word'] for word in words)
+
+
+def _mean_confidence(words):
+    return round(float(np.mean([word['confidence'] for word in words])), 4) if words else 0.0
+
+
+def _model_info(query):
+    return {MODEL_ID: {'name': query.get('model', 'nova-2'), 'version': '2024-01-09.29447', 'arch': 'nova-2'}}
+
+
+class FakeDeepgram:
+    """aiohttp application standing in for Deepgram's pre-recorded and live endpoints"""
+    WORDS_PER_SECOND = 2.5
+    READ_CHUNK = 64 * 1024
+    ERROR_STATUSES = (500, 502, 503)
+
+    def __init__(self, latency='fixed:0', realtime_factor=0.0, error_rate=0.0, max_concurrent=None,
+                 rate_limit=None, burst=1, read_bytes_per_second=None, live_latency='fixed:0',
+                 speakers=2, api_key=None, seed=0):
+        self.latency = LatencyModel(latency)
+        self.realtime_factor = realtime_factor
+        self.error_rate = error_rate
+        self.max_concurrent = max_concurrent
+        self.bucket = TokenBucket(rate_limit, burst) if rate_limit else None
+        self.read_bytes_per_second = read_bytes_per_second
+        self.live_latency = LatencyModel(live_latency)
+        self.speakers = speakers
+        self.api_key = api_key
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.active = 0
+        self.counts = collections.Counter()
+        self.audio_seconds = 0.0
+        self.url = None
+        self._runner = None
+
+        self.app = web.Application()
+        self.app.router.add_post('/v1/listen', self._prerecorded)
+        self.app.router.add_get('/v1/listen', self._live)
+        self.app.router.add_get('/stats', self._stats)
+
+    async def start(self, host='127.0.0.1', port=0):
+        """Serve on host:port (0 for any free port); returns the base URL"""
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        self.url = f"http://{host}:{self._runner.addresses[0][1]}"
+        logger.info(f"Fake Deepgram listening on {self.url}")
+        return self.url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def stats(self):
+        return {
+            'active': self.active,
+            'audio_seconds': round(self.audio_seconds, 3),
+            **{name: self.counts[name] for name in (
+                'requests', 'completed', 'live_sessions', 'throttled', 'errors', 'unauthorized', 'bad_requests'
+            )}
+        }
+
+    async def _stats(self, request):
+        return web.json_response(self.stats())
+
+    def _refuse(self, request):
+        """The error response a request gets before any work, or None to admit it"""
+        authorization = request.headers.get('Authorization', '')
+        key = authorization[len('Token '):] if authorization.startswith('Token ') else ''
+        if not key or (self.api_key is not None and key != self.api_key):
+            self.counts['unauthorized'] += 1
+            return self._error(401, 'INVALID_AUTH', 'Invalid credentials.')
+        # Retry-After: when the rate limit next admits a request, or a second
+        # for the concurrency limit
+        retry_after = 1 if self.max_concurrent is not None and self.active >= self.max_concurrent else 0
+        if not retry_after and self.bucket is not None:
+            retry_after = math.ceil(self.bucket.take())
+        if retry_after:
+            self.counts['throttled'] += 1
+            return self._error(
+                429, 'TOO_MANY_REQUESTS', 'Too many requests. Please try again later',
+                headers={'Retry-After': str(retry_after)}
+            )
+        return None
+
+    def _error(self, status, code, message, headers=None):
+        return web.json_response(
+            {'err_code': code, 'err_msg': message, 'request_id': str(uuid.uuid4())}, status=status, headers=headers
+        )
+
+    async def _read_body(self, request):
+        chunks = []
+        async for chunk in request.content.iter_chunked(self.READ_CHUNK):
+            chunks.append(chunk)
+            if self.read_bytes_per_second:
+                await asyncio.sleep(len(chunk) / self.read_bytes_per_second)
+        return b''.join(chunks)
+
+    async def _prerecorded(self, request):
+        self.counts['requests'] += 1
+        refusal = self._refuse(request)
+        if refusal is not None:
+            return refusal
+
+        self.active += 1
+        try:
+            body = await self._read_body(request)
+            try:
+                response = await asyncio.to_thread(self.transcribe, body, request.query)
+            except (RuntimeError, ValueError) as e:
+                self.counts['bad_requests'] += 1
+                logger.info(f"Rejected undecodable audio: {str(e)}")
+                return self._error(400, 'Bad Request', 'Bad Request: failed to process audio: corrupt or unsupported data')
+
+            duration = response['metadata']['duration']
+            await asyncio.sleep(self.latency.sample(self.rng) + duration * self.realtime_factor)
+            if self.rng.random() < self.error_rate:
+                self.counts['errors'] += 1
+                status = int(self.rng.choice(self.ERROR_STATUSES))
+                return self._error(status, 'INTERNAL_SERVER_ERROR', 'Simulated server error')
+
+            self.counts['completed'] += 1
+            self.audio_seconds += duration
+            return web.json_response(response)
+        finally:
+            self.active -= 1
+
+    def transcribe(self, body, query):
+        """Synthesized pre-recorded response for the encoded audio in body"""
+        audio, sample_rate = sf.read(io.BytesIO(body), dtype='float32', always_2d=True)
+        digest = hashlib.sha256(body).hexdigest()
+        index = VoiceActivityDetector(sample_rate).detect([audio])
+        rng = np.random.default_rng(int(digest[:16], 16))
+        words, utterances = _synthesize_words(
+            index.regions, rng,
+            diarize=query.get('diarize') == 'true',
+            punctuate=query.get('punctuate') == 'true' or query.get('smart_format') == 'true',
+            speakers=self.speakers
+        )
+        results = {
+            'channels': [{'alternatives': [{
+                'transcript': _transcript(words),
+                'confidence': _mean_confidence(words),
+                'words': words
+            }]}]
+        }
+        if query.get('utterances') == 'true':
+            results['utterances'] = utterances
+        return {
+            'metadata': {
+                'transaction_key': 'deprecated',
+                'request_id': str(uuid.uuid4()),
+                'sha256': digest,
+                'created': datetime.utcnow().isoformat() + 'Z',
+                'duration': round(len(audio) / sample_rate, 3),
+                'channels': audio.shape[1],
+                'models': [MODEL_ID],
+                'model_info': _model_info(query)
+            },
+            'results': results
+        }
+
+    async def _live(self, request):
+        self.counts['requests'] += 1
+        refusal = self._refuse(request)
+        if refusal is not None:
+            return refusal
+
+        websocket = web.WebSocketResponse()
+        await websocket.prepare(request)
+        self.counts['live_sessions'] += 1
+        self.active += 1
+        try:
+            await _LiveSession(self, websocket, request.query).run()
+        finally:
+            self.active -= 1
+        return websocket
+
+
+class _LiveSession:
+    """One live WebSocket: utterances detected frame by frame, messages sent after live_latency"""
+    FRAME_SECONDS = 0.02
+    SPEECH_DB = -50.0  # frames quieter than this are never speech
+    SPEECH_ABOVE_FLOOR_DB = 8.0
+    FLOOR_RISE_DB = 0.02  # per frame, so the floor follows noise that gets louder
+    INTERIM_SECONDS = 1.0
+    DEFAULT_ENDPOINTING_SECONDS = 0.3
+
+    def __init__(self, server, websocket, query):
+        self.server = server
+        self.websocket = websocket
+        self.query = query
+        self.encoding = query.get('encoding', 'linear16')
+        self.sample_rate = int(query.get('sample_rate', 16000))
+        self.channels = int(query.get('channels', 1))
+        self.interim = query.get('interim_results') == 'true'
+        self.vad_events = query.get('vad_events') == 'true'
+        self.diarize = query.get('diarize') == 'true'
+        self.punctuate = query.get('punctuate') == 'true' or query.get('smart_format') == 'true'
+        endpointing = query.get('endpointing')
+        self.endpointing = (
+            int(endpointing) / 1000 if endpointing and endpointing.isdigit() else self.DEFAULT_ENDPOINTING_SECONDS
+        )
+        utterance_end = query.get('utterance_end_ms')
+        self.utterance_end = int(utterance_end) / 1000 if utterance_end else None
+        self.frame_bytes = max(1, int(self.FRAME_SECONDS * self.sample_rate)) * self.channels * 2
+        self.request_id = str(uuid.uuid4())
+        self.digest = hashlib.sha256()
+        self.rng = np.random.default_rng([server.seed, server.counts['live_sessions']])
+        self.pending = b''
+        self.floor = None
+        self.frames = 0
+        self.utterances = 0
+        self.speech_start = None
+        self.last_speech = None
+        self.last_interim = None
+        self.awaiting_end = None
+        self.speaker = 0
+        self.outbox = asyncio.Queue()
+
+    @property
+    def now(self):
+        return self.frames * self.FRAME_SECONDS
+
+    async def run(self):
+        if self.encoding != 'linear16':
+            await self.websocket.close(code=1008, message=b'The fake server transcribes linear16 live audio only')
+            return
+        sender = asyncio.create_task(self._send_loop())
+        try:
+            async for message in self.websocket:
+                if message.type == web.WSMsgType.BINARY:
+                    self._receive(message.data)
+                elif message.type == web.WSMsgType.TEXT:
+                    control = json.loads(message.data).get('type')
+                    if control == 'Finalize':
+                        self._end_utterance(speech_final=False)
+                    elif control == 'CloseStream':
+                        break
+                else:
+                    break
+            self._end_utterance(speech_final=True)
+            self._send({
+                'type': 'Metadata',
+                'transaction_key': 'deprecated',
+                'request_id': self.request_id,
+                'sha256': self.digest.hexdigest(),
+                'created': datetime.utcnow().isoformat() + 'Z',
+                'duration': round(self.now, 3),
+                'channels': self.channels,
+                'models': [MODEL_ID],
+                'model_info': _model_info(self.query)
+            })
+            self.server.audio_seconds += self.now
+        finally:
+            self.outbox.put_nowait(None)
+            await sender
+            await self.websocket.close()
+
+    def _receive(self, data):
+        self.digest.update(data)
+        self.pending += data
+        usable = len(self.pending) - len(self.pending) % self.frame_bytes
+        if not usable:
+            return
+        samples = np.frombuffer(self.pending[:usable], dtype='<i2').astype(np.float32) / 32768
+        self.pending = self.pending[usable:]
+        frames = samples.reshape(-1, self.frame_bytes // 2)
+        levels = 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-12)
+        for level in levels:
+            # The noise floor follows the quietest frames
+            self.floor = level if self.floor is None else min(level, self.floor + self.FLOOR_RISE_DB)
+            self._frame(level > max(self.SPEECH_DB, self.floor + self.SPEECH_ABOVE_FLOOR_DB))
+            self.frames += 1
+
+    def _frame(self, speech):
+        now = self.now
+        if speech:
+            if self.speech_start is None:
+                self.speech_start = now
+                self.last_interim = now
+                self.awaiting_end = None
+                if self.vad_events:
+                    self._send({'type': 'SpeechStarted', 'channel': [0, 1], 'timestamp': round(now, 3)})
+            self.last_speech = now + self.FRAME_SECONDS
+            if self.interim and now - self.last_interim >= self.INTERIM_SECONDS:
+                self.last_interim = now
+                self._results(self.speech_start, self.last_speech, is_final=False, speech_final=False)
+        elif self.speech_start is not None and now - self.last_speech >= self.endpointing:
+            self._end_utterance(speech_final=True)
+        elif self.awaiting_end is not None and now - self.awaiting_end >= self.utterance_end:
+            self._send({'type': 'UtteranceEnd', 'channel': [0, 1], 'last_word_end': round(self.awaiting_end, 3)})
+            self.awaiting_end = None
+
+    def _end_utterance(self, speech_final):
+        if self.speech_start is None:
+            return
+        self._results(self.speech_start, self.last_speech, is_final=True, speech_final=speech_final)
+        self.awaiting_end = self.last_speech if self.utterance_end is not None else None
+        self.speech_start = None
+        self.utterances += 1
+
+    def _results(self, start, end, is_final, speech_final):
+        # Interim and final results of one utterance draw the same words
+        rng = np.random.default_rng([self.server.seed, self.utterances, int(start * 1000)])
+        words, _ = _synthesize_words([(start, end)], rng, self.diarize, self.punctuate, 1)
+        if self.diarize:
+            for word in words:
+                word['speaker'] = self.utterances % max(1, self.server.speakers)
+        self._send({
+            'type': 'Results',
+            'channel_index': [0, 1],
+            'duration': round(end - start, 3),
+            'start': round(start, 3),
+            'is_final': is_final,
+            'speech_final': speech_final,
+            'from_finalize': is_final and not speech_final,
+            'channel': {'alternatives': [{
+                'transcript': _transcript(words),
+                'confidence': _mean_confidence(words),
+                'words': words
+            }]},
+            'metadata': {'request_id': self.request_id, 'model_info': _model_info(self.query)[MODEL_ID],
+                         'model_uuid': MODEL_ID}
+        })
+
+    def _send(self, message):
+        self.outbox.put_nowait(message)
+
+    async def _send_loop(self):
+        while True:
+            message = await self.outbox.get()
+            if message is None:
+                return
+            await asyncio.sleep(self.server.live_latency.sample(self.rng))
+            if not self.websocket.closed:
+                await self.websocket.send_json(message)
+
+
+def _percentiles(values):
+    if not values:
+        return None
+    values = np.asarray(values)
+    return {
+        'mean': round(float(values.mean()), 4),
+        'p50': round(float(np.percentile(values, 50)), 4),
+        'p90': round(float(np.percentile(values, 90)), 4),
+        'p99': round(float(np.percentile(values, 99)), 4),
+        'max': round(float(values.max()), 4)
+    }
+
+
+async def load(url, paths, requests, concurrency, rate=None, burst=1, api_key=None, pipeline=False):
+    """
+    Send requests requests for paths (in turn) through one client with
+    concurrency requests in flight; returns the latency and failure report
+    """
+    client = DeepgramTranscriptionClient(
+        api_key=api_key or os.environ.get('DEEPGRAM_API_KEY') or 'offline',
+        base_url=url,
+        scheduler=RequestScheduler(concurrency, rate, burst)
+    )
+    payloads = []
+    for path in paths:
+        with open(path, 'rb') as audio_file:
+            payloads.append((path, audio_file.read(), probe_audio(path, os.path.splitext(path)[1].lstrip('.')).mime_type))
+
+    latencies = []
+    failures = collections.Counter()
+    words = 0
+
+    async def one(number):
+        nonlocal words
+        path, payload, mime_type = payloads[number % len(payloads)]
+        start = time.perf_counter()
+        try:
+            if pipeline:
+                processor = AudioProcessor(path, workers=1, vad=True, compact=True, tier='auto')
+                stream = EncodedStream(cancel_token=processor.cancel_token)
+                upload = asyncio.create_task(client.transcribe_stream(
+                    stream, stream.content_type, time_map=lambda: processor.time_map
+                ))
+                try:
+                    await asyncio.to_thread(processor.process_audio, None, stream)
+                finally:
+                    result = await upload
+            else:
+                result = await client.transcribe_stream(payload, mime_type)
+            latencies.append(time.perf_counter() - start)
+            words += len(result['words'])
+        except DeepgramError as e:
+            failures[str(e.status_code or e.__class__.__name__)] += 1
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(one(number) for number in range(requests)))
+    finally:
+        await client.close()
+    wall = time.perf_counter() - started
+    return {
+        'url': url,
+        'requests': requests,
+        'concurrency': concurrency,
+        'pipeline': pipeline,
+        'completed': len(latencies),
+        'failed': dict(failures),
+        'words': words,
+        'wall_seconds': round(wall, 3),
+        'requests_per_second': round(len(latencies) / wall, 3) if wall else None,
+        'latency_seconds': _percentiles(latencies),
+        'client': client.stats()
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve = commands.add_parser('serve', help='run a fake Deepgram server')
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8700)
+    serve.add_argument('--latency', default='fixed:0', help='pre-recorded response latency, e.g. lognormal:0.8,0.5')
+    serve.add_argument('--realtime-factor', type=float, default=0.0, help='extra seconds per second of audio')
+    serve.add_argument('--error-rate', type=float, default=0.0)
+    serve.add_argument('--max-concurrent', type=int, help='requests beyond this many in flight get 429')
+    serve.add_argument('--rate-limit', type=float, help='requests per second beyond which requests get 429')
+    serve.add_argument('--burst', type=int, default=1)
+    serve.add_argument('--read-bytes-per-second', type=float, help='slow down reading request bodies')
+    serve.add_argument('--live-latency', default='fixed:0', help='delay before each live message')
+    serve.add_argument('--speakers', type=int, default=2)
+    serve.add_argument('--api-key', help='the only key accepted (default: any)')
+    serve.add_argument('--seed', type=int, default=0)
+
+    drive = commands.add_parser('load', help='drive a server with concurrent transcription requests')
+    drive.add_argument('--url', required=True)
+    drive.add_argument('--files', nargs='+', help='audio files to send (default: a synthetic recording)')
+    drive.add_argument('--seconds', type=float, default=30.0, help='length of the synthetic recording')
+    drive.add_argument('--noise', choices=NOISE_TYPES, default='hiss')
+    drive.add_argument('--requests', type=int, default=50)
+    drive.add_argument('--concurrency', type=int, default=4)
+    drive.add_argument('--rate', type=float, help='client-side request starts per second')
+    drive.add_argument('--burst', type=int, default=1)
+    drive.add_argument('--api-key')
+    drive.add_argument('--pipeline', action='store_true', help='enhance each file and stream it, as the API does')
+    drive.add_argument('--corpus-dir', default=os.path.join(tempfile.gettempdir(), 'benchmark_corpus'))
+    drive.add_argument('--output', help='report JSON file (default: stdout)')
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        server = FakeDeepgram(
+            latency=args.latency, realtime_factor=args.realtime_factor, error_rate=args.error_rate,
+            max_concurrent=args.max_concurrent, rate_limit=args.rate_limit, burst=args.burst,
+            read_bytes_per_second=args.read_bytes_per_second, live_latency=args.live_latency,
+            speakers=args.speakers, api_key=args.api_key, seed=args.seed
+        )
+        logging.basicConfig(level=logging.INFO)
+        web.run_app(server.app, host=args.host, port=args.port, access_log=None)
+        return 0
+
+    paths = args.files or [SyntheticCorpus(args.seconds, noise=args.noise).write(args.corpus_dir)]
+    report = asyncio.run(load(
+        args.url, paths, args.requests, args.concurrency, args.rate, args.burst, args.api_key, args.pipeline
+    ))
+    report = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(report + '\n')
+    else:
+        print(report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""Persistent cache of transcription results.
+
+Entries are keyed on a hash of the submitted audio's bytes together with
+the canonical JSON form of the request options (model, language, diarize,
+smart_format, ...), so sending the same audio with the same options again
+is answered from disk without a request. Each entry is one JSON file
+holding Deepgram's parsed response, before any TimeMap is applied, so a hit
+goes through the same result handling as a fresh response. Files are
+written to a temporary name and renamed into place, so a reader never sees
+a partial entry. Entries expire after ttl_seconds and are evicted least
+recently used first once the cache grows past its size limit.
+
+Files and in-memory buffers are keyed on their own bytes. A streamed
+upload's bytes are only known once it has been sent, so it is keyed on
+what determines them instead: the recording it is enhanced from and the
+enhancement parameters (see DeepgramTranscriptionClient.stream_cache_key).
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from audio_processor.cache import content_key
+
+logger = logging.getLogger(__name__)
+
+
+def _options_json(options: Dict[str, Any]) -> bytes:
+    return json.dumps(options, sort_keys=True, separators=(',', ':')).encode()
+
+
+class TranscriptCache:
+    """LRU, size-bounded, expiring cache of transcription responses keyed by audio and options"""
+    HASH_BLOCK_SIZE = 1024 * 1024
+    SUFFIX = '.json'
+
+    def __init__(self, directory: str, max_bytes: int = 1024 * 1024 * 1024,
+                 ttl_seconds: Optional[float] = 30 * 24 * 3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, source: Any, options: Dict[str, Any], digest: Optional[Any] = None) -> str:
+        """
+        Key of source (a file path or a bytes-like buffer) sent with options;
+        digest is a path's content_digest, if it has been computed already
+        """
+        if isinstance(source, (str, os.PathLike)):
+            return content_key(source, options, self.HASH_BLOCK_SIZE, digest)
+        digest = hashlib.sha256(source)
+        digest.update(_options_json(options))
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + self.SUFFIX)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """The cached response for key, or None on a miss"""
+        path = self._path(key)
+        try:
+            with open(path) as entry_file:
+                entry = json.load(entry_file)
+            expired = self.ttl_seconds is not None and time.time() - entry['stored_at'] > self.ttl_seconds
+            if not expired:
+                now = time.time()
+                os.utime(path, (now, now))
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            logger.info(f"Transcript cache miss: {key[:12]}")
+            return None
+
+        if expired:
+            self._remove(path)
+            with self._lock:
+                self.misses += 1
+                self.expirations += 1
+            logger.info(f"Transcript cache entry expired: {key[:12]}")
+            return None
+
+        with self._lock:
+            self.hits += 1
+        logger.info(f"Transcript cache hit: {key[:12]}")
+        return entry['response']
+
+    def put(self, key: str, response: Dict[str, Any], options: Dict[str, Any]) -> None:
+        """Store response under key, then evict down to max_bytes"""
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'w') as entry_file:
+                json.dump({'stored_at': time.time(), 'options': options, 'response': response}, entry_file)
+            os.replace(temp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            # A failed store only costs a future miss
+            logger.error(f"Error caching transcript {key[:12]}: {str(e)}")
+            self._remove(temp_path)
+            return
+        self._evict()
+
+    def _remove(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _evict(self) -> None:
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.directory):
+                if not name.endswith(self.SUFFIX):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    entries.append((os.path.getmtime(path), os.path.getsize(path), path))
+                except OSError:
+                    continue
+            entries.sort()
+            total = sum(entry[1] for entry in entries)
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+                self.evictions += 1
+                logger.info(f"Evicted transcript cache entry {os.path.basename(path)}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'expirations': self.expirations,
+                'evictions': self.evictions
+            }
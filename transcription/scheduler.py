@@ -0,0 +1,174 @@
+import asyncio
+import collections
+import contextlib
+import logging
+import threading
+import time
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """Token-bucket rate limit: rate tokens per second, at most burst saved up; thread-safe"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        if rate <= 0 or burst < 1:
+            raise ValueError("Token bucket needs a positive rate and a burst of at least 1")
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self) -> float:
+        """Take a token if one is available; otherwise return the seconds until one is"""
+        with self._lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def reserve(self) -> float:
+        """
+        Take the next token, available now or not; returns the seconds until
+        it is. Reservations queue up in the order they are made.
+        """
+        with self._lock:
+            self._refill()
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+class RequestScheduler:
+    """
+    Admit async requests with at most max_in_flight running at once and
+    starts limited by a token bucket (rate per second, burst)
+
+    Requests wait first for an in-flight slot, then for a token, in arrival
+    order. Queue depth, in-flight count and wait times are reported by
+    stats(). Slots and tokens are counted under a thread lock rather than
+    with asyncio primitives, so requests from every event loop sharing the
+    scheduler (the API's, and those worker threads run with asyncio.run)
+    stay within the one set of limits; a freed slot is handed to the next
+    waiter on that waiter's own loop.
+    """
+
+    def __init__(self, max_in_flight: int = 4, rate: Optional[float] = None, burst: int = 1):
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+        self.max_in_flight = max_in_flight
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.queued = 0
+        self.in_flight = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._held = 0  # slots taken, by admitted requests and those waiting for a token
+        self._waiters = collections.deque()  # futures of requests waiting for a slot, oldest first
+        self._stats_lock = threading.Lock()
+
+    async def _acquire_slot(self):
+        with self._stats_lock:
+            if self._held < self.max_in_flight and not self._waiters:
+                self._held += 1
+                return
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+        try:
+            await waiter
+        except BaseException:
+            with self._stats_lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    raise
+            # Handed a slot as it was cancelled: pass it on. A slot handed to
+            # a future already cancelled is passed on by _hand_over.
+            if waiter.done() and not waiter.cancelled():
+                self._release_slot()
+            raise
+
+    def _release_slot(self):
+        with self._stats_lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                try:
+                    waiter.get_loop().call_soon_threadsafe(self._hand_over, waiter)
+                    return
+                except RuntimeError:
+                    continue  # the waiter's loop is closed
+            self._held -= 1
+
+    def _hand_over(self, waiter):
+        # Runs on the waiter's loop, so it cannot race with its cancellation
+        if waiter.cancelled():
+            self._release_slot()
+        else:
+            waiter.set_result(None)
+
+    async def _take_token(self):
+        delay = self.bucket.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        """Async context manager holding one admitted request; yields the seconds it waited"""
+        queued_at = time.monotonic()
+        with self._stats_lock:
+            self.queued += 1
+            self.submitted += 1
+        try:
+            await self._acquire_slot()
+            try:
+                if self.bucket is not None:
+                    await self._take_token()
+            except BaseException:
+                self._release_slot()
+                raise
+        finally:
+            with self._stats_lock:
+                self.queued -= 1
+
+        wait = time.monotonic() - queued_at
+        with self._stats_lock:
+            self.in_flight += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+        if wait >= 1.0:
+            logger.info(f"Request admitted after waiting {wait:.2f}s ({self.queued} still queued)")
+
+        succeeded = False
+        try:
+            yield wait
+            succeeded = True
+        finally:
+            with self._stats_lock:
+                self.in_flight -= 1
+                if succeeded:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+            self._release_slot()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            admitted = self.submitted - self.queued
+            return {
+                'max_in_flight': self.max_in_flight,
+                'rate_per_second': self.bucket.rate if self.bucket else None,
+                'burst': self.bucket.burst if self.bucket else None,
+                'queue_depth': self.queued,
+                'in_flight': self.in_flight,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'avg_wait_seconds': self.total_wait / admitted if admitted else 0.0,
+                'max_wait_seconds': self.max_wait
+            }
@@ -0,0 +1,284 @@
+"""Segmented transcription of long recordings.
+
+A single pre-recorded request is limited to MAX_FILE_SIZE and is transcribed
+serially, so a long recording is cut into segments that are transcribed
+concurrently (through the shared client and its scheduler) and stitched
+back together:
+
+- Cuts are placed at the quietest point near each evenly spaced target, so
+  they fall in pauses rather than in words. Each segment extends
+  OVERLAP_SECONDS past its cuts, which gives a word spoken across a cut a
+  whole copy in one of the two segments.
+- Word times are shifted by the segment's offset (and mapped back to the
+  original recording through the job's TimeMap, when silence was spliced).
+- Words in an overlap are kept from the segment whose own range holds their
+  start; a word repeated on both sides of a cut is dropped once.
+- Deepgram numbers speakers per request, so the speakers of each segment are
+  matched to those of the previous one by how much their words coincide in
+  the overlap, and renumbered accordingly.
+
+Segments are written one after the other, and each is submitted as soon as
+it is written, so uploads start while later segments are still being cut.
+With enough scheduler slots the wall-clock time approaches that of the
+longest segment.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import tempfile
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import soundfile as sf
+
+from audio_processor.encoder import OUTPUT_FORMATS, StreamingEncoder
+from audio_processor.vad import TimeMap
+from transcription.deepgram_client import DeepgramTranscriptionClient, DeepgramError
+
+logger = logging.getLogger(__name__)
+
+
+class SegmentedTranscriber:
+    """Transcribe a recording in concurrent segments cut at pauses, then stitch the results"""
+    FRAME_SECONDS = 0.02
+    PAUSE_SECONDS = 0.3  # length of the quiet stretch a cut is centred in
+    SEARCH_FRACTION = 0.1  # cuts are searched within this share of a segment around each target
+    OVERLAP_SECONDS = 5.0
+    MIN_SEGMENT_SECONDS = 300.0  # shorter recordings go in one request
+    SIZE_MARGIN = 0.9  # share of MAX_FILE_SIZE a segment may use
+    DUPLICATE_SECONDS = 0.25  # the same word this close across a cut is one word
+    BLOCK_FRAMES = 65536
+
+    def __init__(self, client: DeepgramTranscriptionClient, max_segments: Optional[int] = None,
+                 work_dir: Optional[str] = None):
+        """
+        Args:
+            client: client the segments are transcribed with
+            max_segments: segments a recording is split into when it is not
+                too large for fewer (by default the client scheduler's
+                max_in_flight, so all segments run at once)
+            work_dir: directory for segment files (by default the system's)
+        """
+        self.client = client
+        self.max_segments = max_segments or client.scheduler.max_in_flight
+        self.work_dir = work_dir
+
+    async def transcribe(self, file_path: str, time_map: Optional[TimeMap] = None) -> Dict[str, Any]:
+        """
+        Transcribe file_path, in segments if it is long or too large for one
+        request; the result has the same form as transcribe_file's
+        """
+        info = await asyncio.to_thread(sf.info, file_path)
+        cuts = await asyncio.to_thread(self.plan, file_path, info)
+        if len(cuts) == 2:
+            return await self.client.transcribe_file(file_path, time_map=time_map)
+
+        output_format = self._output_format(file_path)
+        logger.info(
+            f"Transcribing {file_path} ({info.duration:.1f}s) in {len(cuts) - 1} segments "
+            f"cut at {[round(cut / info.samplerate, 1) for cut in cuts[1:-1]]}s"
+        )
+
+        overlap = int(round(self.OVERLAP_SECONDS * info.samplerate))
+        tasks = []
+        paths = []
+        writing = None
+        try:
+            for index in range(len(cuts) - 1):
+                start = max(0, cuts[index] - overlap)
+                end = min(info.frames, cuts[index + 1] + overlap)
+                # Shielded, so a cancelled job can still learn the path of a
+                # segment its thread goes on writing
+                writing = asyncio.ensure_future(
+                    asyncio.to_thread(self._write_segment, file_path, info, start, end, output_format)
+                )
+                paths.append(await asyncio.shield(writing))
+                writing = None
+                segment_map = self._segment_map(time_map, start / info.samplerate, (end - start) / info.samplerate)
+                tasks.append(asyncio.create_task(self.client.transcribe_file(paths[-1], time_map=segment_map)))
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # transcribe_file removes its segment, unless its task was
+            # cancelled before it started or never created
+            if writing is not None:
+                written = (await asyncio.gather(writing, return_exceptions=True))[0]
+                if isinstance(written, str):
+                    paths.append(written)
+            for path in paths:
+                if os.path.exists(path):
+                    os.remove(path)
+            raise
+        finally:
+            # Like transcribe_file, consume the input
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+        boundaries = [self._to_original(time_map, cut / info.samplerate) for cut in cuts]
+        return self.stitch(results, boundaries)
+
+    def segment_count(self, duration: float, sample_rate: int, channels: int) -> int:
+        """Segments a recording of this length and format is transcribed in"""
+        bytes_per_second = sample_rate * channels * 2  # 16-bit output, before any compression
+        max_seconds = self.client.MAX_FILE_SIZE * self.SIZE_MARGIN / bytes_per_second - 2 * self.OVERLAP_SECONDS
+        max_seconds /= 1 + self.SEARCH_FRACTION
+        by_size = math.ceil(duration / max_seconds)
+        by_latency = min(self.max_segments, int(duration // self.MIN_SEGMENT_SECONDS))
+        return max(1, by_size, by_latency)
+
+    def plan(self, file_path: str, info: Any) -> List[int]:
+        """Cut positions in frames, from 0 to the end of the file"""
+        count = self.segment_count(info.duration, info.samplerate, info.channels)
+        if count == 1:
+            return [0, info.frames]
+
+        frame_length = max(1, int(round(self.FRAME_SECONDS * info.samplerate)))
+        energy = self._frame_energy(file_path, frame_length)
+        pause = max(1, int(round(self.PAUSE_SECONDS / self.FRAME_SECONDS)))
+        quiet = np.convolve(energy, np.ones(pause) / pause, mode='same')
+
+        segment_frames = len(energy) / count
+        search = max(1, int(segment_frames * self.SEARCH_FRACTION))
+        cuts = [0]
+        for index in range(1, count):
+            target = int(round(index * segment_frames))
+            low, high = max(target - search, 0), min(target + search, len(quiet))
+            cuts.append((low + int(np.argmin(quiet[low:high]))) * frame_length)
+        cuts.append(info.frames)
+        return cuts
+
+    def stitch(self, results: List[Dict[str, Any]], boundaries: List[float]) -> Dict[str, Any]:
+        """
+        Join per-segment results whose word times are already in recording
+        time; boundaries are the cut times, from the start to the end
+        """
+        words = []
+        speaker_maps = []
+        previous = []
+        for index, result in enumerate(results):
+            segment_words = result.get('words', [])
+            mapping = self._match_speakers(previous, segment_words, boundaries[index], speaker_maps)
+            speaker_maps.append(mapping)
+
+            own = [
+                dict(word, speaker=mapping.get(word['speaker'], word['speaker'])) if 'speaker' in word else word
+                for word in segment_words
+                if (index == 0 or word.get('start', 0) >= boundaries[index])
+                and (index == len(results) - 1 or word.get('start', 0) < boundaries[index + 1])
+            ]
+            if words and own and self._same_word(words[-1], own[0]):
+                own = own[1:]
+            words.extend(own)
+            previous = segment_words
+
+        weights = [len(result.get('words', [])) for result in results]
+        confidence = (
+            sum(result.get('confidence', 0) * weight for result, weight in zip(results, weights)) / sum(weights)
+            if sum(weights) else 0
+        )
+        return {
+            'text': ' '.join(word.get('punctuated_word', word.get('word', '')) for word in words),
+            'confidence': confidence,
+            'words': words,
+            'speakers': self.client._extract_speakers({'alternatives': [{'words': words}]}),
+            'segments': len(results)
+        }
+
+    def _match_speakers(self, previous, words, cut, speaker_maps):
+        """Map this segment's speaker ids to the ids used so far"""
+        local = sorted({word['speaker'] for word in words if 'speaker' in word})
+        if not speaker_maps:
+            return {speaker: speaker for speaker in local}
+
+        # Seconds during which each (earlier, this segment's) pair of speakers
+        # said the same words in the overlap around the cut
+        window = (cut - self.OVERLAP_SECONDS, cut + self.OVERLAP_SECONDS)
+        earlier_map = speaker_maps[-1]
+        shared = {}
+        ours = [word for word in words if 'speaker' in word and word.get('start', 0) < window[1]]
+        for earlier in previous:
+            if 'speaker' not in earlier or earlier.get('end', 0) <= window[0]:
+                continue
+            for word in ours:
+                coincide = min(earlier.get('end', 0), word.get('end', 0)) - max(earlier.get('start', 0), word.get('start', 0))
+                if coincide > 0:
+                    key = (earlier_map.get(earlier['speaker'], earlier['speaker']), word['speaker'])
+                    shared[key] = shared.get(key, 0.0) + coincide
+
+        mapping = {}
+        for (known, speaker), _ in sorted(shared.items(), key=lambda item: -item[1]):
+            if speaker not in mapping and known not in mapping.values():
+                mapping[speaker] = known
+        unmatched = [speaker for speaker in local if speaker not in mapping]
+        if unmatched:
+            # No shared words to go by: keep the id Deepgram gave, unless a
+            # matched speaker already has it
+            used = set(mapping.values())
+            known = {speaker for earlier in speaker_maps for speaker in earlier.values()}
+            next_id = max(known | used | set(local), default=-1) + 1
+            for speaker in unmatched:
+                if speaker in used:
+                    mapping[speaker] = next_id
+                    next_id += 1
+                else:
+                    mapping[speaker] = speaker
+                used.add(mapping[speaker])
+            logger.debug(f"Speakers {unmatched} had no words in the overlap at {cut:.1f}s")
+        return mapping
+
+    def _same_word(self, earlier, word):
+        return (
+            earlier.get('word', '').lower() == word.get('word', '').lower()
+            and abs(earlier.get('start', 0) - word.get('start', 0)) < self.DUPLICATE_SECONDS
+        )
+
+    def _frame_energy(self, file_path, frame_length):
+        energies = []
+        remainder = np.zeros(0, dtype=np.float32)
+        for block in sf.blocks(file_path, blocksize=self.BLOCK_FRAMES, dtype='float32', always_2d=True):
+            samples = np.concatenate([remainder, block.mean(axis=1)])
+            usable = len(samples) - len(samples) % frame_length
+            frames = samples[:usable].reshape(-1, frame_length)
+            energies.append(np.mean(frames * frames, axis=1))
+            remainder = samples[usable:]
+        return np.concatenate(energies) if energies else np.zeros(1)
+
+    def _write_segment(self, file_path, info, start, end, output_format):
+        fd, path = tempfile.mkstemp(
+            prefix='segment_', suffix=OUTPUT_FORMATS[output_format][2], dir=self.work_dir
+        )
+        os.close(fd)
+        try:
+            with StreamingEncoder(path, info.samplerate, info.channels, output_format) as encoder:
+                for block in sf.blocks(file_path, blocksize=self.BLOCK_FRAMES, start=start, stop=end,
+                                       dtype='float32', always_2d=info.channels > 1):
+                    encoder.write(block)
+        except Exception:
+            os.remove(path)
+            raise
+        return path
+
+    def _output_format(self, file_path):
+        extension = os.path.splitext(file_path)[1].lower()
+        for name, (_, _, format_extension) in OUTPUT_FORMATS.items():
+            if format_extension == extension:
+                return name
+        raise DeepgramError(f"Cannot segment {file_path}: not an enhanced output file")
+
+    def _segment_map(self, time_map, offset, duration):
+        # Segment time -> recording time: shift by the segment's offset, then
+        # through the splice map if there is one
+        if time_map is None or not time_map.segments:
+            return TimeMap([(0.0, offset, duration)])
+        return TimeMap([
+            (compact - offset, original, length) for compact, original, length in time_map.segments
+        ])
+
+    def _to_original(self, time_map, seconds):
+        if time_map is None or not time_map.segments:
+            return seconds
+        return time_map.to_original(seconds, side='right')